@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey
+#
+#Released under the MIT license, see LICENSE.txt
+import argparse
+import json
+import os
+import sys
+import random
+import time
+
+from contigSim.src.sampleTree import SampleTree
+from contigSim.src.contig import CircularContig
+from contigSim.src.contig import LinearContig
+from contigSim.src.dcj import dcj
+from contigSim.src.eventQueue import EventQueue
+from contigSim.src.model import Model
+from contigSim.benchmarks.samplerBenchmarks import makeWeights
+
+""" Benchmarks for the hot paths of the simulator: the SampleTree pool,
+dcj, the EventQueue and end-to-end Model.simulate on the runSim.py
+parameter presets.  Every result is a time per operation in seconds (so
+smaller is better), and the results are written as a JSON dictionary
+of name -> seconds.  Given a baseline (a previous JSON output) the results
+are compared against it, and the benchmarks that got slower by more than
+the threshold are reported as regressions.
+
+"""
+
+# the parameter sets and starting states of runSim.py
+# (t, N, rll, rld, rdd, fl, fg, pgain)
+def presetParameters(N=3000000000, t=10000):
+    return [("llOnly", (t, N, 1.0 / N, 0, 0, 0, 0, 0)),
+            ("fgfl", (t, N, 1.0 / N, 0.1 / N, 0.1 / N, 0.5, 0.5, 0)),
+            ("pgain", (t, N, 1.0 / N, 0.1 / N, 0.1 / N, 0.5, 0.5, 0.5))]
+
+def presetStates():
+    return [("linear", (0, 25, 0)),
+            ("circular", (0, 0, 25)),
+            ("garbage", (3000000, 25, 0))]
+
+##################################################################
+# SampleTree insert, remove and uniformSample, for each degree and
+# pool size
+##################################################################
+def benchSampleTree(sizes, degrees, samples):
+    res = dict()
+    for n in sizes:
+        weights = makeWeights(n)
+        for degree in degrees:
+            name = "sampleTree.d%d.n%d" % (degree, n)
+            tree = SampleTree(degree)
+            start = time.time()
+            for i, w in enumerate(weights):
+                tree.insert(i, w)
+            res[name + ".insert"] = (time.time() - start) / n
+
+            start = time.time()
+            for i in xrange(samples):
+                tree.uniformSample()
+            res[name + ".sample"] = (time.time() - start) / samples
+
+            nodes = list(tree.leafNodes())
+            random.shuffle(nodes)
+            nodes = nodes[:samples]
+            start = time.time()
+            for node in nodes:
+                tree.remove(node)
+            res[name + ".remove"] = (time.time() - start) / len(nodes)
+    return res
+
+##################################################################
+# dcj for each of its cases (both orientations), on contigs of
+# the given size
+##################################################################
+def benchDcj(size, samples):
+    lin1 = LinearContig(size)
+    lin2 = LinearContig(size)
+    circ1 = CircularContig(size)
+    circ2 = CircularContig(size)
+    cases = [("linear", lin1, lin1),
+             ("linearLinear", lin1, lin2),
+             ("linearCircular", lin1, circ2),
+             ("circular", circ1, circ1),
+             ("circularCircular", circ1, circ2),
+             ("circularLinear", circ1, lin2)]
+    pos = [(random.randint(0, size - 1), random.randint(0, size - 1))
+           for i in xrange(samples)]
+    res = dict()
+    for name, c1, c2 in cases:
+        for forward in (True, False):
+            start = time.time()
+            for p1, p2 in pos:
+                dcj(c1, p1, c2, p2, forward)
+            res["dcj.%s.%s" % (name, "fw" if forward else "rev")] = \
+                (time.time() - start) / samples
+    return res
+
+##################################################################
+# EventQueue.next with the three event types of Model
+##################################################################
+def benchEventQueue(samples):
+    queue = EventQueue()
+    queue.addEventType(1.0, "ll")
+    queue.addEventType(0.1, "ld")
+    queue.addEventType(0.1, "dd")
+    queue.begin()
+    start = time.time()
+    for i in xrange(samples):
+        queue.next()
+    return {"eventQueue.next" : (time.time() - start) / samples}
+
+##################################################################
+# Model.simulate for each preset, per event that was actually run (as
+# counted by simulate in the model's metadata)
+##################################################################
+def benchModel(N, t):
+    res = dict()
+    for pName, params in presetParameters(N, t):
+        for sName, state in presetStates():
+            if state[0] + state[1] + state[2] >= N:
+                continue
+            model = Model()
+            model.setParameters(*params[1:])
+            model.setStartingState(*state)
+            start = time.time()
+            model.simulate(params[0])
+            elapsed = time.time() - start
+            events = max(model.metadata["events"], 1)
+            res["model.%s.%s.event" % (pName, sName)] = elapsed / events
+    return res
+
+def runAll(args):
+    random.seed(args.seed)
+    res = dict()
+    res.update(benchSampleTree(args.sizes, args.degrees, args.samples))
+    res.update(benchDcj(args.contigSize, args.samples))
+    res.update(benchEventQueue(args.samples * 10))
+    res.update(benchModel(args.N, args.t))
+    return res
+
+##################################################################
+# the benchmarks in both results that are slower than in the baseline
+# by more than the threshold (as a fraction), as a sorted list of
+# (name, baseline, current) tuples
+##################################################################
+def compareResults(results, baseline, threshold):
+    regressions = []
+    for name in sorted(results.keys()):
+        if name in baseline and \
+           results[name] > baseline[name] * (1.0 + threshold):
+            regressions.append((name, baseline[name], results[name]))
+    return regressions
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    parser = argparse.ArgumentParser(
+        description='Benchmark the simulator and compare to a baseline.')
+    parser.add_argument('--out', type=str, default='bench.json',
+                        help='JSON file to write results to. '
+                        'default=%(default)s')
+    parser.add_argument('--baseline', type=str, default=None,
+                        help='JSON results to compare against.')
+    parser.add_argument('--saveBaseline', default=False, action='store_true',
+                        help='Write the results to --baseline instead of '
+                        'comparing.')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Fraction a benchmark can slow down before it '
+                        'counts as a regression. default=%(default)s')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000],
+                        help='SampleTree pool sizes. default=%(default)s')
+    parser.add_argument('--degrees', type=int, nargs='+', default=[2, 4, 8, 16],
+                        help='SampleTree degrees. default=%(default)s')
+    parser.add_argument('--samples', type=int, default=10000,
+                        help='Operations per measurement. '
+                        'default=%(default)s')
+    parser.add_argument('--contigSize', type=int, default=1000000,
+                        help='Contig size for dcj. default=%(default)s')
+    parser.add_argument('--N', type=int, default=3000000000,
+                        help='N for the Model presets. default=%(default)s')
+    parser.add_argument('--t', type=float, default=10000,
+                        help='Time for the Model presets. '
+                        'default=%(default)s')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Random seed. default=%(default)s')
+    args = parser.parse_args(argv[1:])
+
+    results = runAll(args)
+    for name in sorted(results.keys()):
+        print "%-45s %12.3f us" % (name, results[name] * 1e6)
+    outFile = open(args.out, 'w')
+    json.dump(results, outFile, indent=1, sort_keys=True)
+    outFile.close()
+
+    if args.baseline is None:
+        return 0
+    if args.saveBaseline:
+        baseFile = open(args.baseline, 'w')
+        json.dump(results, baseFile, indent=1, sort_keys=True)
+        baseFile.close()
+        return 0
+    if not os.path.isfile(args.baseline):
+        print "no baseline %s to compare against" % args.baseline
+        return 0
+    baseFile = open(args.baseline)
+    baseline = json.load(baseFile)
+    baseFile.close()
+    regressions = compareResults(results, baseline, args.threshold)
+    for name, before, after in regressions:
+        print "REGRESSION %-34s %12.3f -> %.3f us" % (name, before * 1e6,
+                                                      after * 1e6)
+    if len(regressions) > 0:
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey
+#
+#Released under the MIT license, see LICENSE.txt
+import argparse
+import os
+import sys
+import random
+import time
+
+from contigSim.src.sampleTree import SampleTree
+from contigSim.src.bucketSampler import BucketSampler
+
+""" Time insert, uniformSample and remove of the contig pools (SampleTree
+and BucketSampler) for pools of different sizes whose weights are spread
+log-uniformly over many orders of magnitude, like our contig sizes.
+
+"""
+
+# weights log-uniform between 1 and maxWeight
+def makeWeights(n, maxWeight=3000000000, seed=0):
+    rand = random.Random(seed)
+    return [int(maxWeight ** rand.random()) for i in xrange(n)]
+
+# seconds per operation of insert, uniformSample and remove (a sample
+# followed by removing the sampled node and inserting it back)
+def timePool(poolType, weights, samples=10000):
+    pool = poolType()
+    start = time.time()
+    for i, w in enumerate(weights):
+        pool.insert(i, w)
+    insertTime = (time.time() - start) / len(weights)
+
+    start = time.time()
+    for i in xrange(samples):
+        pool.uniformSample()
+    sampleTime = (time.time() - start) / samples
+
+    start = time.time()
+    for i in xrange(samples):
+        node, offset = pool.uniformSample()
+        data, weight = node.data, node.weight
+        pool.remove(node)
+        pool.insert(data, weight)
+    updateTime = (time.time() - start) / samples
+    return {"insert" : insertTime, "sample" : sampleTime,
+            "update" : updateTime}
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    parser = argparse.ArgumentParser(
+        description='Benchmark the contig pools against each other.')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[100, 1000, 10000, 100000],
+                        help='Pool sizes. default=%(default)s')
+    parser.add_argument('--samples', type=int, default=10000,
+                        help='Samples per measurement. default=%(default)s')
+    args = parser.parse_args(argv[1:])
+
+    random.seed(0)
+    print "%10s %14s %12s %12s %12s" % ("size", "pool", "insert(us)",
+                                        "sample(us)", "update(us)")
+    for n in args.sizes:
+        weights = makeWeights(n)
+        for name, poolType in [("SampleTree", SampleTree),
+                               ("BucketSampler", BucketSampler)]:
+            res = timePool(poolType, weights, args.samples)
+            print "%10d %14s %12.2f %12.2f %12.2f" % (
+                n, name, res["insert"] * 1e6, res["sample"] * 1e6,
+                res["update"] * 1e6)
+
+if __name__ == "__main__":
+    sys.exit(main())
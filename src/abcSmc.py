@@ -0,0 +1,380 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey
+#
+#Released under the MIT license, see LICENSE.txt
+
+import argparse
+import os
+import sys
+import math
+import random
+import multiprocessing
+import numpy as np
+
+from model import Model
+from histogram import BinScheme
+from histogram import Histogram
+
+""" Approximate Bayesian computation (ABC-SMC) of the rates of the model
+from an observed contig size histogram, instead of a hand-made grid of
+parameter sets.
+
+A population of particles (parameter sets) is drawn from the prior and
+simulated, then moved through generations of decreasing tolerance: each
+generation proposes particles by perturbing ones of the last generation
+(picked by weight) with a Gaussian kernel of twice their weighted
+covariance, simulates them, and keeps those whose distance to the data
+is within the tolerance, weighted by prior / proposal density (Beaumont
+et al. 2009).  The tolerance of a generation is a quantile of the
+distances of the last one, so the kernels and tolerances adapt to the
+posterior and most simulations are spent where it has mass.
+
+The distance between a simulated and the observed histogram (of the
+same bins) is the total variation distance between their distributions
+of bases over the bins, plus the absolute log ratio of their numbers
+of contigs.  With an earlyFactor, each run is first simulated to
+earlyTime of its time, and rejected there if its distance is already
+earlyFactor times the tolerance (a heuristic: it saves the second part
+of runs that are far off, at the risk of rejecting a few that would
+have come back).
+
+Priors are uniform on an interval, or log-uniform for rates, and the
+particles are perturbed in the log space of the log-uniform ones.
+
+"""
+
+# the parameters of Model.setParameters that can be fitted, in order
+parameterNames = ["rll", "rld", "rdd", "fl", "fg", "pgain"]
+
+##################################################################
+# read an observed histogram from a text file of "size count" lines
+# (# for comments), binned by scheme
+##################################################################
+def loadObserved(path, scheme=None):
+    hist = Histogram(scheme)
+    for line in open(path):
+        line = line.split("#")[0].split()
+        if len(line) == 0:
+            continue
+        hist.add(int(float(line[0])), float(line[1]) if len(line) > 1 else 1)
+    return hist
+
+# distance between a simulated and an observed histogram (see above)
+def histogramDistance(simulated, observed):
+    scheme = observed.scheme
+    total = [0., 0.]
+    contigs = [0., 0.]
+    bases = [dict(), dict()]
+    for i, hist in enumerate((simulated, observed)):
+        for index, count in hist.iteritems():
+            size = (scheme.binLower(index) + scheme.binUpper(index)) / 2.
+            bases[i][index] = count * size
+            total[i] += count * size
+            contigs[i] += count
+    if total[0] == 0 or total[1] == 0:
+        return float("inf")
+    tv = 0.5 * sum(abs(bases[0].get(x, 0.) / total[0] -
+                       bases[1].get(x, 0.) / total[1])
+                   for x in set(bases[0]) | set(bases[1]))
+    return tv + abs(math.log(contigs[0] / contigs[1]))
+
+# the histogram of a category (as made by Experiment) of a model's pool
+def poolHistogram(model, category, scheme):
+    checks = {"alive" : lambda x : not x.isDead(),
+              "aliveLinear" : lambda x : not x.isDead() and x.isLinear(),
+              "aliveCircular" : lambda x : not x.isDead() and x.isCircular(),
+              "overall" : lambda x : True}
+    return model.pool.histogram(scheme=scheme, checkFn=checks[category])
+
+##################################################################
+# the simulations, run in worker processes (or the calling one).  the
+# observed histogram and settings are set once per process by
+# initWorker
+##################################################################
+workerState = dict()
+
+def initWorker(observed, category, startingState):
+    workerState["observed"] = observed
+    workerState["category"] = category
+    workerState["startingState"] = startingState
+    workerState["model"] = None
+
+##################################################################
+# simulate a parameter set (t, N, rll, rld, rdd, fl, fg, pgain) with a
+# seed.  if earlyTime is given, the run is stopped at that time and
+# given up if its distance is over earlyThreshold.  returns (distance,
+# whether it was given up)
+##################################################################
+def simulateParticle(job):
+    params, seed, earlyTime, earlyThreshold = job
+    random.seed(seed)
+    model = workerState["model"]
+    if model is None:
+        model = Model()
+        workerState["model"] = model
+    else:
+        model.reset()
+    observed = workerState["observed"]
+    category = workerState["category"]
+    model.setParameters(*params[1:])
+    model.setStartingState(*workerState["startingState"])
+    if earlyTime is not None:
+        model.simulate(earlyTime)
+        distance = histogramDistance(poolHistogram(model, category,
+                                                   observed.scheme), observed)
+        if distance > earlyThreshold:
+            return (distance, True)
+        model.simulate(params[0], resume=True)
+    else:
+        model.simulate(params[0])
+    return (histogramDistance(poolHistogram(model, category, observed.scheme),
+                              observed), False)
+
+##################################################################
+# the ABC-SMC driver.  priors maps the names (of parameterNames) of the
+# fitted parameters to (low, high) or (low, high, "log"); the others
+# are fixed at the values of fixed (0 by default).  the runs last time
+# t from the starting state (garbageSize, numLinear, numCircular) with
+# N bases
+##################################################################
+class AbcSmc(object):
+    def __init__(self, observed, priors, t, N, startingState, fixed=None,
+                 populationSize=100, quantile=0.5, processes=1,
+                 category="alive", earlyFactor=None, earlyTime=0.5, seed=0):
+        self.observed = observed
+        self.names = [x for x in parameterNames if x in priors]
+        assert len(self.names) == len(priors) and len(self.names) > 0
+        self.priors = [priors[x] for x in self.names]
+        self.logScale = np.array([len(x) > 2 and x[2] == "log"
+                                  for x in self.priors])
+        self.lower = self.__transform(np.array([x[0] for x in self.priors],
+                                               dtype=float))
+        self.upper = self.__transform(np.array([x[1] for x in self.priors],
+                                               dtype=float))
+        assert (self.lower < self.upper).all()
+        self.fixed = dict((x, 0.) for x in parameterNames)
+        if fixed is not None:
+            self.fixed.update(fixed)
+        self.t = t
+        self.N = N
+        self.startingState = tuple(startingState)
+        self.populationSize = populationSize
+        self.quantile = quantile
+        self.processes = processes
+        self.category = category
+        self.earlyFactor = earlyFactor
+        self.earlyTime = earlyTime
+        self.random = np.random.RandomState(seed)
+        self.seed = seed
+        # the particles (in the transformed space), weights and distances
+        # of the last generation
+        self.particles = None
+        self.weights = None
+        self.distances = None
+        # per generation: tolerance, simulations, accepted and early
+        # rejections
+        self.history = []
+        self.simulations = 0
+
+    # the (t, N, rll, rld, rdd, fl, fg, pgain) of a particle
+    def parameters(self, particle):
+        values = dict(self.fixed)
+        values.update(zip(self.names, self.__untransform(particle)))
+        return (self.t, self.N) + tuple(values[x] for x in parameterNames)
+
+    # the particles of the last generation as {name : value} dictionaries
+    def samples(self):
+        return [dict(zip(self.names, self.__untransform(x)))
+                for x in self.particles]
+
+    # weighted mean of each fitted parameter
+    def posteriorMean(self):
+        values = np.array([self.__untransform(x) for x in self.particles])
+        return dict(zip(self.names, self.weights.dot(values)))
+
+    ##################################################################
+    # run generations until the tolerance reaches minEpsilon, the
+    # acceptance rate falls below minAcceptance, or maxGenerations
+    ##################################################################
+    def run(self, maxGenerations=5, minEpsilon=0., minAcceptance=0.02):
+        pool = None
+        if self.processes > 1:
+            pool = multiprocessing.Pool(self.processes, initWorker,
+                                        (self.observed, self.category,
+                                         self.startingState))
+        else:
+            initWorker(self.observed, self.category, self.startingState)
+        try:
+            epsilon = float("inf")
+            for generation in xrange(maxGenerations):
+                stats = self.__generation(epsilon, pool)
+                self.history.append(stats)
+                if stats["accepted"] < self.populationSize or \
+                   float(stats["accepted"]) / stats["simulations"] < \
+                   minAcceptance:
+                    break
+                epsilon = float(np.percentile(self.distances,
+                                              100 * self.quantile))
+                if epsilon <= minEpsilon:
+                    break
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        return self.samples(), self.weights
+
+    ##################################################################
+    # one generation: propose and simulate particles in batches until
+    # populationSize are within epsilon (giving up after maxSimulations)
+    ##################################################################
+    def __generation(self, epsilon, pool, maxSimulations=None):
+        if maxSimulations is None:
+            maxSimulations = 200 * self.populationSize
+        if self.particles is not None:
+            covariance = 2. * np.atleast_2d(np.cov(self.particles.T,
+                                                   aweights=self.weights))
+            covariance += 1e-12 * np.eye(len(self.names))
+        early = self.earlyFactor is not None and epsilon < float("inf")
+        accepted = []
+        distances = []
+        stats = {"epsilon" : epsilon, "simulations" : 0, "accepted" : 0,
+                 "early" : 0}
+        batch = max(self.processes * 4, 8)
+        while len(accepted) < self.populationSize and \
+              stats["simulations"] < maxSimulations:
+            proposals = [self.__propose(covariance if self.particles is
+                                        not None else None)
+                         for i in xrange(batch)]
+            jobs = []
+            for particle in proposals:
+                self.seed += 1
+                jobs.append((self.parameters(particle), self.seed,
+                             self.t * self.earlyTime if early else None,
+                             self.earlyFactor * epsilon if early else None))
+            if pool is None:
+                results = map(simulateParticle, jobs)
+            else:
+                results = pool.map(simulateParticle, jobs)
+            stats["simulations"] += len(jobs)
+            self.simulations += len(jobs)
+            for particle, (distance, gaveUp) in zip(proposals, results):
+                stats["early"] += int(gaveUp)
+                if not gaveUp and distance <= epsilon and \
+                   len(accepted) < self.populationSize:
+                    accepted.append(particle)
+                    distances.append(distance)
+        stats["accepted"] = len(accepted)
+        if len(accepted) < self.populationSize:
+            return stats
+        accepted = np.array(accepted)
+        if self.particles is None:
+            weights = np.ones(len(accepted))
+        else:
+            # (the prior is uniform in the transformed space)
+            inverse = np.linalg.inv(covariance)
+            weights = np.empty(len(accepted))
+            for i, particle in enumerate(accepted):
+                delta = self.particles - particle
+                kernel = np.exp(-0.5 * np.einsum('ij,jk,ik->i', delta,
+                                                 inverse, delta))
+                weights[i] = 1. / self.weights.dot(kernel)
+        self.particles = accepted
+        self.weights = weights / weights.sum()
+        self.distances = np.array(distances)
+        return stats
+
+    # a particle from the prior, or perturbed from the last generation
+    def __propose(self, covariance):
+        while True:
+            if covariance is None:
+                return self.random.uniform(self.lower, self.upper)
+            index = self.random.choice(len(self.particles), p=self.weights)
+            particle = self.random.multivariate_normal(self.particles[index],
+                                                       covariance)
+            if (particle >= self.lower).all() and \
+               (particle <= self.upper).all():
+                return particle
+
+    def __transform(self, values):
+        return np.where(self.logScale, np.log(np.maximum(values, 1e-300)),
+                        values)
+
+    def __untransform(self, values):
+        return np.where(self.logScale, np.exp(values), values)
+
+# parse a --prior name:low:high[:log]
+def parsePrior(text):
+    fields = text.split(":")
+    prior = (float(fields[1]), float(fields[2]))
+    if len(fields) > 3:
+        prior += (fields[3],)
+    return fields[0], prior
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    parser = argparse.ArgumentParser(
+        description='Fit the rates of the model to an observed contig size '
+        'histogram with ABC-SMC.')
+    parser.add_argument('observed', type=str,
+                        help='Text file of "size count" lines.')
+    parser.add_argument('--prior', type=str, action='append', required=True,
+                        help='Prior of a fitted parameter as name:low:high, or '
+                        'name:low:high:log for a log-uniform one (repeat for '
+                        'each parameter).')
+    parser.add_argument('--fixed', type=str, action='append', default=[],
+                        help='Value of a parameter that is not fitted, as '
+                        'name:value. default=0')
+    parser.add_argument('--N', type=int, required=True,
+                        help='Number of bases.')
+    parser.add_argument('--t', type=float, required=True, help='Time.')
+    parser.add_argument('--state', type=str, default="0,25,0",
+                        help='Starting state garbageSize,numLinear,numCircular. '
+                        'default=%(default)s')
+    parser.add_argument('--binSize', type=int, default=1,
+                        help='Size of bins. default=%(default)s')
+    parser.add_argument('--logBase', type=float, default=None,
+                        help='Log bins of this factor from --linearLimit.')
+    parser.add_argument('--linearLimit', type=int, default=None,
+                        help='Size at which the log bins start. '
+                        'default=--binSize')
+    parser.add_argument('--particles', type=int, default=100,
+                        help='Population size. default=%(default)s')
+    parser.add_argument('--generations', type=int, default=5,
+                        help='Maximum number of generations. default=%(default)s')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Simulations to run in parallel. default=%(default)s')
+    parser.add_argument('--earlyFactor', type=float, default=None,
+                        help='Give up runs whose distance half way is this '
+                        'many times the tolerance. default=never')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Random seed. default=%(default)s')
+    parser.add_argument('--out', type=str, default=None,
+                        help='Write the weighted posterior samples here.')
+    args = parser.parse_args(argv[1:])
+
+    scheme = BinScheme(args.binSize, args.logBase, args.linearLimit)
+    priors = dict(parsePrior(x) for x in args.prior)
+    fixed = dict((x.split(":")[0], float(x.split(":")[1])) for x in args.fixed)
+    abc = AbcSmc(loadObserved(args.observed, scheme), priors, args.t, args.N,
+                 [int(x) for x in args.state.split(",")], fixed,
+                 args.particles, processes=args.processes,
+                 earlyFactor=args.earlyFactor, seed=args.seed)
+    samples, weights = abc.run(args.generations)
+    for i, stats in enumerate(abc.history):
+        print "generation %d: epsilon=%g simulations=%d accepted=%d early=%d" % (
+            i, stats["epsilon"], stats["simulations"], stats["accepted"],
+            stats["early"])
+    print "posterior mean: %s" % abc.posteriorMean()
+    if args.out is not None:
+        outFile = open(args.out, "w")
+        outFile.write("weight\t%s\n" % "\t".join(abc.names))
+        for sample, weight in zip(samples, weights):
+            outFile.write("%g\t%s\n" % (weight, "\t".join(
+                "%g" % sample[x] for x in abc.names)))
+        outFile.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
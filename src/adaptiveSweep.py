@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey
+#
+#Released under the MIT license, see LICENSE.txt
+
+import argparse
+import cPickle
+import heapq
+import itertools
+import os
+import sys
+import math
+
+from experiment import Experiment
+from histogram import mergeHistograms
+from abcSmc import histogramDistance
+
+""" Adaptive refinement of a parameter grid.  A flat grid spends most of
+its simulations where the results hardly change, so this starts from a
+coarse grid over some dimensions of setParameters (N, rll, rld, rdd, fl,
+fg, pgain) and only subdivides where neighbouring points give different
+results.
+
+The grid is a set of boxes whose corners are simulated points (an
+Experiment cell per point and starting state).  The score of a box along
+an axis is the largest distance (abcSmc.histogramDistance between the
+summed histograms of a category, the largest over the starting states)
+between two corners joined by an edge along that axis.  Every round, the
+boxes scoring more than the tolerance are bisected along their worst
+axis, highest score first, as long as the simulations of the new corners
+fit in the budget, and the new points are run as one Experiment.  It
+stops when no box is over the tolerance or the budget is spent.
+
+Points are kept in unit coordinates (0 to 1 along each axis), mapped
+linearly or (for "log" dimensions) log-linearly onto the ranges.
+
+"""
+
+# the parameters of Model.setParameters (after t), in order
+parameterNames = ["N", "rll", "rld", "rdd", "fl", "fg", "pgain"]
+
+# the summed histogram of a category of a cell's results (a list of
+# replicates, or a SharedAccumulator)
+def cellHistogram(results, category):
+    if isinstance(results, list):
+        return mergeHistograms([x[category] for x in results])
+    return results.histogram(category)
+
+##################################################################
+# the sweep.  dimensions maps parameter names to (low, high) or
+# (low, high, "log"), fixed gives the values of the others (0 by
+# default, but N is needed).  the budget is a number of simulations
+# (replicates of a cell), which the first grid must fit in
+##################################################################
+class AdaptiveSweep(object):
+    def __init__(self, t, dimensions, startingStates, fixed=None, initial=3,
+                 tolerance=0.1, budget=1000, replicates=10, binSize=1,
+                 scheme=None, category="alive", processes=1,
+                 minWidth=1. / 64):
+        self.t = t
+        self.names = [x for x in parameterNames if x in dimensions]
+        assert len(self.names) == len(dimensions) and len(self.names) > 0
+        self.ranges = [dimensions[x] for x in self.names]
+        self.fixed = dict((x, 0) for x in parameterNames)
+        if fixed is not None:
+            self.fixed.update(fixed)
+        assert "N" in dimensions or self.fixed["N"] > 0
+        self.startingStates = [tuple(x) for x in startingStates]
+        self.initial = initial
+        self.tolerance = tolerance
+        self.budget = budget
+        self.replicates = replicates
+        self.binSize = binSize
+        self.scheme = scheme
+        self.category = category
+        self.processes = processes
+        # boxes aren't cut narrower than this (in unit coordinates), as
+        # the replicates' noise would keep them over the tolerance
+        self.minWidth = minWidth
+        # the summed histogram of each (point, starting state)
+        self.histograms = dict()
+        # the experiment holding every cell that was run
+        self.experiment = None
+        self.simulations = 0
+        # the boxes (lo, hi) of the grid, as a heap of (-score, box)
+        self.boxes = []
+        self.rounds = 0
+
+    # the parameter set (t, N, rll, rld, rdd, fl, fg, pgain) of a point
+    def parameters(self, point):
+        values = dict(self.fixed)
+        for name, (u, rng) in zip(self.names, zip(point, self.ranges)):
+            if len(rng) > 2 and rng[2] == "log":
+                value = math.exp(math.log(rng[0]) +
+                                 u * (math.log(rng[1]) - math.log(rng[0])))
+            else:
+                value = rng[0] + u * (rng[1] - rng[0])
+            values[name] = value
+        values["N"] = int(round(values["N"]))
+        return (self.t,) + tuple(values[x] for x in parameterNames)
+
+    ##################################################################
+    # run the sweep.  returns the experiment with the results of all
+    # the points
+    ##################################################################
+    def run(self):
+        axis = [i / float(self.initial - 1) for i in xrange(self.initial)]
+        points = list(itertools.product(*([axis] * len(self.names))))
+        if len(points) * self.__pointCost() > self.budget:
+            raise ValueError("the first grid (%d points of %d simulations) "
+                             "is over the budget of %d simulations" % (
+                                 len(points), self.__pointCost(),
+                                 self.budget))
+        self.evaluate(points)
+        for lo in itertools.product(*([axis[:-1]] * len(self.names))):
+            hi = tuple(axis[axis.index(x) + 1] for x in lo)
+            self.__push((lo, hi))
+        while True:
+            self.rounds += 1
+            newPoints = set()
+            splits = []
+            waiting = []
+            while len(self.boxes) > 0:
+                score, box = heapq.heappop(self.boxes)
+                if -score <= self.tolerance:
+                    heapq.heappush(self.boxes, (score, box))
+                    break
+                halves, added = self.__split(box)
+                if halves is None:
+                    waiting.append((score, box))
+                    continue
+                added = set(x for x in added if (x, self.startingStates[0])
+                            not in self.histograms)
+                cost = len(added - newPoints) * self.__pointCost()
+                if self.simulations + len(newPoints) * self.__pointCost() + \
+                   cost > self.budget:
+                    waiting.append((score, box))
+                    continue
+                newPoints |= added
+                splits.extend(halves)
+            for item in waiting:
+                heapq.heappush(self.boxes, item)
+            if len(splits) == 0:
+                break
+            self.evaluate(sorted(newPoints))
+            for box in splits:
+                self.__push(box)
+        return self.experiment
+
+    # simulations per point
+    def __pointCost(self):
+        return self.replicates * len(self.startingStates)
+
+    # run the points (that weren't already) as an experiment
+    def evaluate(self, points):
+        points = [x for x in points if (x, self.startingStates[0]) not in
+                  self.histograms]
+        if len(points) == 0:
+            return
+        exp = Experiment()
+        if self.scheme is not None:
+            exp.setBinScheme(self.scheme)
+        for point in points:
+            exp.addParameterSet(*self.parameters(point))
+        for state in self.startingStates:
+            exp.addStartingState(*state)
+        if self.processes > 1:
+            cells = exp.runCellsShared(self.replicates, self.binSize,
+                                       self.processes)
+        else:
+            cells = exp.runCells(self.replicates, self.binSize)
+        for key, results in cells:
+            pass
+        for point in points:
+            params = self.parameters(point)
+            for state in self.startingStates:
+                self.histograms[(point, state)] = cellHistogram(
+                    exp.results[params + state], self.category)
+        self.simulations += len(points) * self.__pointCost()
+        if self.experiment is None:
+            self.experiment = exp
+        else:
+            self.experiment.merge(exp)
+
+    # distance between the results of two points
+    def distance(self, point1, point2):
+        return max(histogramDistance(self.histograms[(point1, x)],
+                                     self.histograms[(point2, x)])
+                   for x in self.startingStates)
+
+    # the score of a box along each axis
+    def axisScores(self, box):
+        lo, hi = box
+        scores = []
+        for axis in xrange(len(lo)):
+            score = 0.
+            others = [(lo[i], hi[i]) for i in xrange(len(lo)) if i != axis]
+            for corner in itertools.product(*others):
+                corner = list(corner)
+                point1 = tuple(corner[:axis] + [lo[axis]] + corner[axis:])
+                point2 = tuple(corner[:axis] + [hi[axis]] + corner[axis:])
+                score = max(score, self.distance(point1, point2))
+            scores.append(score)
+        return scores
+
+    def __push(self, box):
+        heapq.heappush(self.boxes, (-max(self.axisScores(box)), box))
+
+    # the two halves of a box bisected along its worst axis (of those
+    # wide enough to cut), and the points of the cut.  (None, None) if
+    # it can't be cut
+    def __split(self, box):
+        lo, hi = box
+        scores = [(score, axis) for axis, score in
+                  enumerate(self.axisScores(box))
+                  if hi[axis] - lo[axis] >= 2 * self.minWidth]
+        if len(scores) == 0:
+            return None, None
+        axis = max(scores)[1]
+        mid = (lo[axis] + hi[axis]) / 2.
+        left = (lo, hi[:axis] + (mid,) + hi[axis + 1:])
+        right = (lo[:axis] + (mid,) + lo[axis + 1:], hi)
+        others = [(lo[i], hi[i]) for i in xrange(len(lo)) if i != axis]
+        cut = set()
+        for corner in itertools.product(*others):
+            corner = list(corner)
+            cut.add(tuple(corner[:axis] + [mid] + corner[axis:]))
+        return [left, right], cut
+
+    # the points of the grid (in unit coordinates)
+    def points(self):
+        return sorted(set(x[0] for x in self.histograms))
+
+    ##################################################################
+    # the refined grid: a dictionary for each box (highest score first)
+    # with its lower and upper parameter values and its score
+    ##################################################################
+    def report(self):
+        res = []
+        for score, (lo, hi) in sorted(self.boxes):
+            low = self.parameters(lo)
+            high = self.parameters(hi)
+            res.append({"score" : -score,
+                        "lower" : dict((x, low[1 + parameterNames.index(x)])
+                                       for x in self.names),
+                        "upper" : dict((x, high[1 + parameterNames.index(x)])
+                                       for x in self.names)})
+        return res
+
+# parse a name:low:high[:log] dimension
+def parseDimension(text):
+    fields = text.split(":")
+    res = (float(fields[1]), float(fields[2]))
+    if len(fields) > 3:
+        res += (fields[3],)
+    return fields[0], res
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    parser = argparse.ArgumentParser(
+        description='Sweep parameters on a grid that is refined where the '
+        'results change the most.')
+    parser.add_argument('--dim', type=str, action='append', required=True,
+                        help='Swept parameter as name:low:high, or '
+                        'name:low:high:log for log spacing (repeat for each).')
+    parser.add_argument('--fixed', type=str, action='append', default=[],
+                        help='Value of a parameter that is not swept, as '
+                        'name:value. default=0')
+    parser.add_argument('--t', type=float, required=True, help='Time.')
+    parser.add_argument('--state', type=str, action='append', default=[],
+                        help='Starting state garbageSize,numLinear,numCircular '
+                        '(repeat for several). default=0,25,0')
+    parser.add_argument('--initial', type=int, default=3,
+                        help='Points along each axis of the first grid. '
+                        'default=%(default)s')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Distance between neighbours above which a box '
+                        'is subdivided. default=%(default)s')
+    parser.add_argument('--budget', type=int, default=1000,
+                        help='Total number of simulations. default=%(default)s')
+    parser.add_argument('--replicates', type=int, default=10,
+                        help='Replicates of each cell. default=%(default)s')
+    parser.add_argument('--binSize', type=int, default=1,
+                        help='Size of bins. default=%(default)s')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Processes to run the replicates of a cell. '
+                        'default=%(default)s')
+    parser.add_argument('--out', type=str, default=None,
+                        help='Save the experiment of all the points here.')
+    args = parser.parse_args(argv[1:])
+
+    dimensions = dict(parseDimension(x) for x in args.dim)
+    fixed = dict((x.split(":")[0], float(x.split(":")[1])) for x in args.fixed)
+    states = [[int(y) for y in x.split(",")] for x in args.state]
+    if len(states) == 0:
+        states = [[0, 25, 0]]
+    sweep = AdaptiveSweep(args.t, dimensions, states, fixed, args.initial,
+                          args.tolerance, args.budget, args.replicates,
+                          args.binSize, processes=args.processes)
+    exp = sweep.run()
+    print "%d points, %d simulations, %d rounds" % (
+        len(sweep.points()), sweep.simulations, sweep.rounds)
+    for box in sweep.report():
+        print "%.4f %s" % (box["score"], " ".join(
+            "%s=[%g,%g]" % (x, box["lower"][x], box["upper"][x])
+            for x in sweep.names))
+    if args.out is not None:
+        outFile = open(args.out, "wb")
+        cPickle.dump(exp, outFile, 2)
+        outFile.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey
+#
+#Released under the MIT license, see LICENSE.txt
+
+import os
+import sys
+import copy
+import random
+from collections import defaultdict
+
+from histogram import BinScheme
+from histogram import Histogram
+
+""" Composition-rejection sampler with the same interface as SampleTree.
+Elements are grouped into buckets of weights [2^k, 2^(k+1)).  A sample
+picks a bucket in proportion to its total weight, then picks elements of
+the bucket uniformly and accepts them with probability weight / 2^(k+1)
+(which is at least 1/2).  Insert and remove are O(1) (swap-remove from the
+bucket's list), and sampling is O(1) expected since there are at most ~64
+buckets for any integer weights.  Removed nodes are reused by insert, as
+in SampleTree.
+
+"""
+
+class BucketSamplerNode(object):
+    def __init__(self, data, weight):
+        self.data = data
+        self.weight = weight
+        self.bucket = None
+        self.index = None
+
+class BucketSampler(object):
+    def __init__(self):
+        # buckets[k] holds nodes with weight in [2^k, 2^(k+1))
+        self.buckets = []
+        self.bucketWeights = []
+        # nodes of zero weight (never sampled)
+        self.zero = []
+        self.totalWeight = 0
+        self.count = 0
+        # removed nodes, to be reused by insert, and the number of nodes
+        # allocated and reused
+        self.freeNodes = []
+        self.maxFreeNodes = 65536
+        self.allocCount = 0
+        self.reuseCount = 0
+
+    # insert a new leaf node with given data and weight
+    def insert(self, data, weight):
+        if len(self.freeNodes) == 0:
+            node = BucketSamplerNode(data, weight)
+            self.allocCount += 1
+        else:
+            node = self.freeNodes.pop()
+            node.data = data
+            node.weight = weight
+            self.reuseCount += 1
+        weight = int(weight)
+        assert weight >= 0
+        if weight == 0:
+            node.bucket = -1
+            bucket = self.zero
+        else:
+            node.bucket = weight.bit_length() - 1
+            while len(self.buckets) <= node.bucket:
+                self.buckets.append([])
+                self.bucketWeights.append(0)
+            bucket = self.buckets[node.bucket]
+            self.bucketWeights[node.bucket] += weight
+        node.index = len(bucket)
+        bucket.append(node)
+        self.totalWeight += weight
+        self.count += 1
+        return node
+
+    # remove a given leaf node (which goes to the free list, so it must
+    # not be used afterwards)
+    def remove(self, node):
+        if node.bucket < 0:
+            bucket = self.zero
+        else:
+            bucket = self.buckets[node.bucket]
+            self.bucketWeights[node.bucket] -= int(node.weight)
+        assert bucket[node.index] is node
+        last = bucket.pop()
+        if last is not node:
+            last.index = node.index
+            bucket[node.index] = last
+        self.totalWeight -= int(node.weight)
+        self.count -= 1
+        self.__releaseNode(node)
+
+    def __releaseNode(self, node):
+        node.data = None
+        node.weight = 0
+        node.bucket = None
+        node.index = None
+        if len(self.freeNodes) < self.maxFreeNodes:
+            self.freeNodes.append(node)
+
+    # remove all the elements (their nodes go to the free list)
+    def clear(self):
+        for node in list(self.nodes()):
+            self.__releaseNode(node)
+        self.buckets = []
+        self.bucketWeights = []
+        self.zero = []
+        self.totalWeight = 0
+        self.count = 0
+
+    # number of nodes allocated and reused (by insert) in a dictionary
+    def allocations(self):
+        return {"allocated" : self.allocCount, "reused" : self.reuseCount}
+
+    # how many data elememnts are in the sampler
+    def size(self):
+        return self.count
+
+    # what is the total weight of the data elements in the sampler
+    # the probability of selecting an element is its weight over the total
+    def weight(self):
+        return self.totalWeight
+
+    # uniformly sample a data element based on its weight.  returns the
+    # node and an offset uniform in [0, weight) like SampleTree
+    def uniformSample(self):
+        if self.totalWeight == 0:
+            return None
+        x = random.randint(0, self.totalWeight - 1)
+        for k in xrange(len(self.buckets)):
+            if x < self.bucketWeights[k]:
+                break
+            x -= self.bucketWeights[k]
+        bucket = self.buckets[k]
+        bound = 2 << k
+        while True:
+            node = bucket[int(random.random() * len(bucket))]
+            offset = random.randint(0, bound - 1)
+            if offset < node.weight:
+                return (node, offset)
+
+    # k independent samples (as SampleTree.uniformSampleMany)
+    def uniformSampleMany(self, k):
+        if self.totalWeight == 0:
+            return None
+        return [self.uniformSample() for i in xrange(k)]
+
+    # iterate through the nodes containing data elements
+    def nodes(self):
+        for node in self.zero:
+            yield node
+        for bucket in self.buckets:
+            for node in bucket:
+                yield node
+
+    # iterate through the leaf nodes (as SampleTree.leafNodes)
+    def leafNodes(self):
+        return self.nodes()
+
+    # iterate through the data elements in the sampler
+    def dataElements(self):
+        for node in self.nodes():
+            yield node.data
+
+    # the (data, weight) of every element, in a list
+    def snapshot(self):
+        return [(x.data, x.weight) for x in self.nodes()]
+
+    # git a histogram of the node weights of data elements with whose
+    # types are instances of the given dataType (as SampleTree.histogram)
+    def histogram(self, binSize = 1, dataType=None, checkFn = None,
+                  scheme = None):
+        if scheme is None:
+            scheme = BinScheme(binSize)
+        hist = Histogram(scheme)
+        for node in self.nodes():
+            if (dataType is None or issubclass(type(node.data), dataType)) and\
+               (checkFn is None or checkFn(node.data) == True):
+                hist.add(node.weight)
+        return hist
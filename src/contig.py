@@ -17,6 +17,10 @@ contigs have an extra edge because of implicit telomere bases.  the operations
 in the member functions don't change the object (return new ones instead).
 New telomeres aren't created when cutting a linear contig (done outside)
 
+The operations take an optional ContigPool to make their results from, so
+that a simulation can recycle the contigs it no longer needs rather than
+allocating new ones for every event.
+
 """
 class Contig(object):
     def __init__(self, size):
@@ -51,10 +55,10 @@ class LinearContig(Contig):
 
     # cut (remove edge) at position, returning a left contig and a right contig
     # (original not touched)
-    def cut(self, position):
+    def cut(self, position, pool = None):
         assert position < self.size
-        l = LinearContig(position)
-        r = LinearContig(self.size - position - 1)
+        l = makeContig(LinearContig, position, pool)
+        r = makeContig(LinearContig, self.size - position - 1, pool)
         return (l,r)
 
     # get the contig in reverse orientation
@@ -63,20 +67,20 @@ class LinearContig(Contig):
 
     # add edge between two endpoints
     # return the new circular contig (current contig is unchange)
-    def circularize(self):
-        return CircularContig(self.size + 1)
+    def circularize(self, pool = None):
+        return makeContig(CircularContig, self.size + 1, pool)
 
     # stick another linear contig to the left (new edge)
     # forward is the direction of the other contig
-    def joinToLeft(self, other, forward=True):
+    def joinToLeft(self, other, forward=True, pool = None):
         assert type(other) == LinearContig
-        return LinearContig(self.size + other.size + 1)
+        return makeContig(LinearContig, self.size + other.size + 1, pool)
 
     # stick another linear contig to the right (new edge)
     # forward is the direction of the other contig
-    def joinToRight(self, other, forward=True):
+    def joinToRight(self, other, forward=True, pool = None):
         assert type(other) == LinearContig
-        return LinearContig(self.size + other.size + 1)
+        return makeContig(LinearContig, self.size + other.size + 1, pool)
 
 
 
@@ -100,23 +104,61 @@ class CircularContig(Contig):
             return self.size
 
     # chop a contig into two circles
-    def cut(self, pos1, pos2):
-        left = CircularContig(self.size - math.fabs(pos1 - pos2))
-        right = CircularContig(math.fabs(pos1 - pos2))
+    def cut(self, pos1, pos2, pool = None):
+        left = makeContig(CircularContig, self.size - math.fabs(pos1 - pos2),
+                          pool)
+        right = makeContig(CircularContig, math.fabs(pos1 - pos2), pool)
         return (left, right)
     
     # return a linearized version of the circular contig by cutting at position
     # (removing edge)
-    def linearize(self, position = 0):
-        return LinearContig(self.size - 1)
+    def linearize(self, position = 0, pool = None):
+        return makeContig(LinearContig, self.size - 1, pool)
 
     # join two circles with a dcj operation
-    def join(self, other, pos1 = 0, pos2 = 0, forward = True):
-        return CircularContig(self.size + other.size)
-    
-
-    
-    
-        
-
-    
+    def join(self, other, pos1 = 0, pos2 = 0, forward = True, pool = None):
+        return makeContig(CircularContig, self.size + other.size, pool)
+
+##################################################################
+# free lists of contigs that are no longer used (by the pool of a
+# simulation).  make() reuses one of the given type if there is one,
+# and otherwise allocates it.  a released contig must not be referenced
+# anywhere anymore, since it will be handed out again by make()
+##################################################################
+class ContigPool(object):
+    def __init__(self, maxFree = 4096):
+        self.maxFree = maxFree
+        self.free = {LinearContig : [], CircularContig : []}
+        # number of contigs allocated, reused and released
+        self.allocCount = 0
+        self.reuseCount = 0
+        self.releaseCount = 0
+
+    def make(self, contigType, size):
+        free = self.free[contigType]
+        if len(free) == 0:
+            self.allocCount += 1
+            return contigType(size)
+        contig = free.pop()
+        contig.size = size
+        self.reuseCount += 1
+        return contig
+
+    def release(self, contig):
+        free = self.free[type(contig)]
+        if len(free) < self.maxFree:
+            if hasattr(contig, 'dead'):
+                del contig.dead
+            free.append(contig)
+        self.releaseCount += 1
+
+    # the counters in a dictionary
+    def counts(self):
+        return {"allocated" : self.allocCount, "reused" : self.reuseCount,
+                "released" : self.releaseCount}
+
+# a new contig of the given type and size, from pool if it's not None
+def makeContig(contigType, size, pool = None):
+    if pool is None:
+        return contigType(size)
+    return pool.make(contigType, size)
@@ -19,8 +19,10 @@ from contig import Contig
 # the positions are the target edges to be cut, and forward=True specifes
 # they are reattached left-to-left (False would be left-to-right)
 # created contigs don't carry over "dead" information, so that has to be
-# set externally for now. 
-def dcj(cont1, pos1, cont2, pos2, forward=True):
+# set externally for now.  if a ContigPool is given, the created contigs
+# are made from it and the intermediate ones released back to it (the
+# input contigs are left alone)
+def dcj(cont1, pos1, cont2, pos2, forward=True, pool=None):
     t1 = type(cont1)
     t2 = type(cont2)
     assert issubclass(t1, Contig)
@@ -31,99 +33,121 @@ def dcj(cont1, pos1, cont2, pos2, forward=True):
 
     if t1 == LinearContig:
         if cont2 is None or cont2 is cont1:
-            return __dcj_linear(cont1, pos1, pos2, forward)
+            return __dcj_linear(cont1, pos1, pos2, forward, pool)
         elif t2 == LinearContig:
-            return __dcj_linear_linear(cont1, pos1, pos2, forward, cont2)
+            return __dcj_linear_linear(cont1, pos1, pos2, forward, cont2, pool)
         else:
-            return __dcj_linear_circular(cont1, pos1, pos2, forward, cont2)
+            return __dcj_linear_circular(cont1, pos1, pos2, forward, cont2,
+                                         pool)
 
     if t1 == CircularContig:
         if cont2 is None or cont2 is cont1:
-            return __dcj_circular(cont1, pos1, pos2, forward)
+            return __dcj_circular(cont1, pos1, pos2, forward, pool)
         elif t2 == LinearContig:
-            return __dcj_circular_linear(cont1, pos1, pos2, forward, cont2)
+            return __dcj_circular_linear(cont1, pos1, pos2, forward, cont2,
+                                         pool)
         else:
-            return __dcj_circular_circular(cont1, pos1, pos2, forward, cont2)
+            return __dcj_circular_circular(cont1, pos1, pos2, forward, cont2,
+                                           pool)
 
     assert False
 
+# give intermediate contigs back to the pool (if there is one)
+def __release(pool, *contigs):
+    if pool is not None:
+        for contig in contigs:
+            pool.release(contig)
+
 # dcj on a single linear contig
 # case 1) both breaks are on same edge: cut into two if forward=true
 # case 2) join in "forward sense" returns A-BC
 # case 3) join in "reverse sense" returns AC, circle(B)"
-def __dcj_linear(cont, pos1, pos2, forward):
+def __dcj_linear(cont, pos1, pos2, forward, pool):
     p1 = min(pos1, pos2)
     p2 = max(pos1, pos2)
     if p1 == p2:
         if forward == True:
-            left,right = cont.cut(p1)
+            left,right = cont.cut(p1, pool)
             left.size += 1
             right.size += 1
             return (left, right)
         else:
             return (copy.deepcopy(cont),)
-    left, temp = cont.cut(p1)
-    middle, right = temp.cut(p2 - left.size - 1)
+    left, temp = cont.cut(p1, pool)
+    middle, right = temp.cut(p2 - left.size - 1, pool)
+    __release(pool, temp)
     if forward:
-        temp = left.joinToRight(middle, forward=False)
-        return (temp.joinToRight(right, forward=True),)
+        temp = left.joinToRight(middle, forward=False, pool=pool)
+        result = temp.joinToRight(right, forward=True, pool=pool)
+        __release(pool, left, middle, temp, right)
+        return (result,)
     else:
-        linCont = left.joinToRight(right, forward=True)
-        cirCont = middle.circularize()
+        linCont = left.joinToRight(right, forward=True, pool=pool)
+        cirCont = middle.circularize(pool)
+        __release(pool, left, middle, right)
         return (linCont, cirCont)
 
 # dcj between two linear contigs makes two linear contigs
 # case 1) "forward" AB + CD => A-C + -BD
 # case 2) "reverse" AB + CD => AD + CB
-def __dcj_linear_linear(cont1, pos1, pos2, forward, cont2):
-    a,b = cont1.cut(pos1)
-    c,d = cont2.cut(pos2)
+def __dcj_linear_linear(cont1, pos1, pos2, forward, cont2, pool):
+    a,b = cont1.cut(pos1, pool)
+    c,d = cont2.cut(pos2, pool)
     if forward:
-        return (a.joinToRight(c, forward=False),
-                d.joinToLeft(b, forward=False))
+        result = (a.joinToRight(c, forward=False, pool=pool),
+                  d.joinToLeft(b, forward=False, pool=pool))
     else:
-        return (a.joinToRight(d, forward=True),
-                c.joinToRight(b, forward=True))
+        result = (a.joinToRight(d, forward=True, pool=pool),
+                  c.joinToRight(b, forward=True, pool=pool))
+    __release(pool, a, b, c, d)
+    return result
 
 # dcj between a linear and circular contig makes a single linear contig
 # case 1) "forward" AB + C => ACB
 # case 2) "reverse" AB + C => A-CB
-def __dcj_linear_circular(cont1, pos1, pos2, forward, cont2):
-    a, b = cont1.cut(pos1)
-    c = cont2.linearize(pos2)
+def __dcj_linear_circular(cont1, pos1, pos2, forward, cont2, pool):
+    a, b = cont1.cut(pos1, pool)
+    c = cont2.linearize(pos2, pool)
     if forward:
-        return (a.joinToRight(c, True).joinToRight(b, True),)
+        temp = a.joinToRight(c, True, pool)
     else:
-        return (a.joinToRight(c, False).joinToRight(b, True),)
+        temp = a.joinToRight(c, False, pool)
+    result = temp.joinToRight(b, True, pool)
+    __release(pool, a, b, c, temp)
+    return (result,)
 
 # dcj on single circular contig
 # case 1) both breaks on same edge: cut into linear if forward=True
 # case 2) forward : figure 8
 # case 3) reverse : cut in two
-def __dcj_circular(cont, pos1, pos2, forward):
+def __dcj_circular(cont, pos1, pos2, forward, pool):
     p1 = min(pos1, pos2)
     p2 = max(pos1, pos2)
     if p1 == p2:
         if forward is True:
-            result = cont.linearize(p1)
+            result = cont.linearize(p1, pool)
             result.size += 1
             return (result,)
         else:
             return (copy.deepcopy(cont),)
-    temp = cont.linearize(p1)
-    left, right = temp.cut(p2 - p1 - 1)
+    temp = cont.linearize(p1, pool)
+    left, right = temp.cut(p2 - p1 - 1, pool)
+    __release(pool, temp)
     if forward:
-        temp = left.joinToRight(right, False)
-        return (temp.circularize(),)
+        temp = left.joinToRight(right, False, pool)
+        result = (temp.circularize(pool),)
+        __release(pool, left, right, temp)
     else:
-        return (left.circularize(), right.circularize())
+        result = (left.circularize(pool), right.circularize(pool))
+        __release(pool, left, right)
+    return result
 
 # dcj on two circular contigs makes a single circular contig
 # case 1) forward : AB
 # case 2) reverse : A-B
-def __dcj_circular_circular(cont1, pos1, pos2, forward, cont2):
-    return (cont1.join(cont2, pos1, pos2, forward),)
+def __dcj_circular_circular(cont1, pos1, pos2, forward, cont2, pool):
+    return (cont1.join(cont2, pos1, pos2, forward, pool),)
 
 # dcj on a circular with a linear (same as linear with circular)    
-def __dcj_circular_linear(cont1, pos1, pos2, forward, cont2):
-    return __dcj_linear_circular(cont2, pos2, pos1, not forward, cont1)
+def __dcj_circular_linear(cont1, pos1, pos2, forward, cont2, pool):
+    return __dcj_linear_circular(cont2, pos2, pos1, not forward, cont1, pool)
@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey
+#
+#Released under the MIT license, see LICENSE.txt
+
+import argparse
+import os
+import sys
+import math
+import random
+import numpy as np
+
+from model import Model
+from sampleTree import SampleTree
+from bucketSampler import BucketSampler
+
+""" Differential testing of simulation engines.  A faster pool, event
+scheduler or dcj engine has to give the same dynamics as Model, in
+distribution.  DifferentialTest runs a reference engine and a candidate
+engine on the same parameter sets and starting states (in the format of
+Experiment), many replicates each, and compares the two samples of
+per-replicate summaries with two-sample tests.
+
+Every replicate is reduced to a few statistics (the number of contigs
+and of bases of each category, the largest and median live contig and
+the event counters), which are independent across replicates so the
+tests are valid.  Each statistic gets a Kolmogorov-Smirnov test, and
+those with few distinct values a chi-square test of homogeneity as well.
+A configuration diverges if any p-value is below alpha divided by the
+number of tests of the whole run (Bonferroni).  The p-values are
+computed here with numpy (no scipy).
+
+An engine is a function (params, state, replicates, seed) returning a
+list with the (histograms, counters) of each replicate, where the
+histograms are binned by size (binSize 1) as made by Experiment and the
+counters are in the order Experiment prints them.
+
+"""
+
+# the histogram categories of the summaries
+categories = ["aliveLinear", "aliveCircular", "deadLinear", "deadCircular"]
+
+# names of the counters (in the order of Model's counters)
+counterNames = ["ll", "fg", "fl", "ldLoss", "ldSwap", "ddGain", "ddSwap"]
+
+##################################################################
+# engine of Model with the given pool class (and thinning of null
+# events, see Model).  the replicates are seeded with python's random
+# (the one Model uses)
+##################################################################
+def modelEngine(poolType=SampleTree, thinning=False):
+    def run(params, state, replicates, seed):
+        random.seed(seed)
+        model = Model(poolType=poolType, thinning=thinning)
+        model.setParameters(*params[1:])
+        results = []
+        for rep in xrange(replicates):
+            if rep > 0:
+                model.reset()
+            model.setStartingState(*state)
+            model.simulate(params[0])
+            hists = dict()
+            for name in categories:
+                dead = name.startswith("dead")
+                linear = name.endswith("Linear")
+                hists[name] = model.pool.histogram(
+                    checkFn = lambda x : x.isDead() == dead and
+                    x.isLinear() == linear)
+            results.append((hists, (model.llCount, model.fgCount,
+                                    model.flCount, model.ldLossCount,
+                                    model.ldSwapCount, model.ddGainCount,
+                                    model.ddSwapCount)))
+        return results
+    return run
+
+# engine of the Ensemble (all the replicates in one batch)
+def ensembleEngine():
+    def run(params, state, replicates, seed):
+        from ensemble import Ensemble
+        ensemble = Ensemble(replicates, seed=seed)
+        ensemble.setParameters(*params[1:])
+        ensemble.setStartingState(*state)
+        ensemble.simulate(params[0])
+        hists = ensemble.histograms()
+        return [(hists[rep], ensemble.counts(rep))
+                for rep in xrange(replicates)]
+    return run
+
+# the statistics of a replicate as a {name : value} dictionary
+def summarize(histograms, counters):
+    res = dict()
+    alive = []
+    for name in categories:
+        hist = histograms[name]
+        res[name + ".contigs"] = sum(hist.values())
+        res[name + ".bases"] = sum(k * v for k, v in hist.items())
+        if name.startswith("alive"):
+            for size, count in hist.items():
+                alive.extend([size] * int(count))
+    alive.sort()
+    res["alive.largest"] = alive[-1] if len(alive) > 0 else 0
+    res["alive.median"] = alive[len(alive) / 2] if len(alive) > 0 else 0
+    for name, value in zip(counterNames, counters):
+        res["count." + name] = value
+    return res
+
+##################################################################
+# two-sample Kolmogorov-Smirnov test.  returns the statistic D and
+# its (asymptotic) p-value
+##################################################################
+def ksTest(x, y):
+    x = np.sort(np.asarray(x, dtype=float))
+    y = np.sort(np.asarray(y, dtype=float))
+    n = len(x)
+    m = len(y)
+    values = np.concatenate([x, y])
+    cdfX = np.searchsorted(x, values, side='right') / float(n)
+    cdfY = np.searchsorted(y, values, side='right') / float(m)
+    d = float(np.abs(cdfX - cdfY).max())
+    ne = math.sqrt(float(n * m) / (n + m))
+    return d, kolmogorovQ((ne + 0.12 + 0.11 / ne) * d)
+
+# survival function of the Kolmogorov distribution
+def kolmogorovQ(x):
+    if x < 0.2:
+        return 1.
+    total = 0.
+    for k in xrange(1, 101):
+        term = 2 * (-1) ** (k - 1) * math.exp(-2. * k * k * x * x)
+        total += term
+        if abs(term) < 1e-12:
+            break
+    return min(max(total, 0.), 1.)
+
+##################################################################
+# chi-square test that two samples of a discrete statistic come from
+# the same distribution.  values expected less than minExpected times
+# (in either sample) are lumped together with their neighbours.
+# returns the statistic, the degrees of freedom and the p-value
+##################################################################
+def chiSquareTest(x, y, minExpected=5.):
+    values = sorted(set(x) | set(y))
+    index = dict((v, i) for i, v in enumerate(values))
+    table = np.zeros((2, len(values)))
+    for row, sample in enumerate((x, y)):
+        for value in sample:
+            table[row, index[value]] += 1
+    # lump columns (in order) until each has enough expected counts
+    total = table.sum()
+    rowFraction = table.sum(axis=1) / total
+    columns = []
+    current = np.zeros(2)
+    for j in xrange(len(values)):
+        current += table[:, j]
+        if (current.sum() * rowFraction).min() >= minExpected:
+            columns.append(current)
+            current = np.zeros(2)
+    if current.sum() > 0:
+        if len(columns) > 0:
+            columns[-1] = columns[-1] + current
+        else:
+            columns.append(current)
+    if len(columns) < 2:
+        return 0., 0, 1.
+    table = np.array(columns).T
+    expected = np.outer(table.sum(axis=1), table.sum(axis=0)) / total
+    stat = float(((table - expected) ** 2 / expected).sum())
+    dof = table.shape[1] - 1
+    return stat, dof, chiSquareQ(stat, dof)
+
+# survival function of the chi-square distribution with dof degrees of
+# freedom (the regularized upper incomplete gamma function Q(dof/2, x/2))
+def chiSquareQ(x, dof):
+    a = dof / 2.
+    x = x / 2.
+    if x <= 0:
+        return 1.
+    lnFront = -x + a * math.log(x) - math.lgamma(a)
+    if x < a + 1:
+        # series for P(a, x)
+        term = 1. / a
+        total = term
+        for n in xrange(1, 1000):
+            term *= x / (a + n)
+            total += term
+            if abs(term) < abs(total) * 1e-14:
+                break
+        return min(max(1. - total * math.exp(lnFront), 0.), 1.)
+    # continued fraction for Q(a, x) (modified Lentz)
+    tiny = 1e-300
+    b = x + 1. - a
+    c = 1. / tiny
+    d = 1. / b
+    h = d
+    for i in xrange(1, 1000):
+        an = -i * (i - a)
+        b += 2.
+        d = an * d + b
+        if abs(d) < tiny:
+            d = tiny
+        c = b + an / c
+        if abs(c) < tiny:
+            c = tiny
+        d = 1. / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1.) < 1e-14:
+            break
+    return min(max(math.exp(lnFront) * h, 0.), 1.)
+
+##################################################################
+# a reference and a candidate engine compared over the cross product
+# of parameter sets and starting states (as in Experiment)
+##################################################################
+class DifferentialTest(object):
+    def __init__(self, reference, candidate, replicates=100, alpha=0.001,
+                 seed=0, maxDiscrete=20):
+        self.reference = reference
+        self.candidate = candidate
+        self.replicates = replicates
+        self.alpha = alpha
+        self.seed = seed
+        # statistics with at most this many distinct values also get a
+        # chi-square test
+        self.maxDiscrete = maxDiscrete
+        self.parameterSpace = []
+        self.startingStateSpace = []
+        self.results = []
+
+    def addParameterSet(self, t, N, rll, rld = 0, rdd = 0, fl = 0, fg = 0,
+                        pgain = 0):
+        self.parameterSpace.append((t, N, rll, rld, rdd, fl, fg, pgain))
+
+    def addStartingState(self, garbageSize, numLinear, numCircular):
+        self.startingStateSpace.append((garbageSize, numLinear, numCircular))
+
+    ##################################################################
+    # run both engines on every configuration and test every statistic.
+    # returns (and keeps in self.results) a list of dictionaries with
+    # the key (params + state), statistic, test, value and p-value, and
+    # whether it diverged at the corrected level
+    ##################################################################
+    def run(self):
+        self.results = []
+        seed = self.seed
+        for params in self.parameterSpace:
+            for state in self.startingStateSpace:
+                reference = self.__summaries(self.reference, params, state,
+                                             seed)
+                candidate = self.__summaries(self.candidate, params, state,
+                                             seed + 1)
+                seed += 2
+                self.results.extend(self.__compare(params + state, reference,
+                                                   candidate))
+        level = self.alpha / max(len(self.results), 1)
+        for res in self.results:
+            res["diverged"] = res["pValue"] < level
+        return self.results
+
+    # the results that diverged
+    def divergences(self):
+        return [x for x in self.results if x["diverged"]]
+
+    # the smallest p-value of each configuration (key)
+    def minPValues(self):
+        res = dict()
+        for x in self.results:
+            res[x["key"]] = min(res.get(x["key"], 1.), x["pValue"])
+        return res
+
+    def __summaries(self, engine, params, state, seed):
+        return [summarize(hists, counters) for hists, counters in
+                engine(params, state, self.replicates, seed)]
+
+    def __compare(self, key, reference, candidate):
+        res = []
+        for name in sorted(reference[0].keys()):
+            x = [s[name] for s in reference]
+            y = [s[name] for s in candidate]
+            if len(set(x) | set(y)) < 2:
+                continue
+            d, p = ksTest(x, y)
+            res.append({"key" : key, "statistic" : name, "test" : "ks",
+                        "value" : d, "pValue" : p})
+            if len(set(x) | set(y)) <= self.maxDiscrete:
+                stat, dof, p = chiSquareTest(x, y)
+                if dof > 0:
+                    res.append({"key" : key, "statistic" : name,
+                                "test" : "chi2", "value" : stat,
+                                "pValue" : p})
+        return res
+
+# a small matrix of configurations exercising every kind of event
+def addDefaultConfigurations(test, t=150, N=1000):
+    test.addParameterSet(t, N, rll=1.0 / N)
+    test.addParameterSet(t, N, rll=1.0 / N, rld=0.2 / N, rdd=0.2 / N,
+                         fl=0.5, fg=0.5, pgain=0.5)
+    test.addStartingState(0, 5, 5)
+    test.addStartingState(200, 0, 10)
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    parser = argparse.ArgumentParser(
+        description='Compare an engine against Model (with a SampleTree) '
+        'in distribution.')
+    parser.add_argument('--candidate', type=str, default='bucket',
+                        choices=['bucket', 'ensemble', 'tree',
+                                 'thinning'],
+                        help='Engine to test. default=%(default)s')
+    parser.add_argument('--replicates', type=int, default=200,
+                        help='Replicates per configuration. default=%(default)s')
+    parser.add_argument('--t', type=float, default=150,
+                        help='Time. default=%(default)s')
+    parser.add_argument('--N', type=int, default=1000,
+                        help='Number of bases. default=%(default)s')
+    parser.add_argument('--alpha', type=float, default=0.001,
+                        help='Family-wise significance level. default=%(default)s')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the first run. default=%(default)s')
+    args = parser.parse_args(argv[1:])
+
+    candidates = {"bucket" : modelEngine(BucketSampler),
+                  "ensemble" : ensembleEngine(),
+                  "tree" : modelEngine(SampleTree),
+                  "thinning" : modelEngine(SampleTree, thinning=True)}
+    test = DifferentialTest(modelEngine(SampleTree),
+                            candidates[args.candidate], args.replicates,
+                            args.alpha, args.seed)
+    addDefaultConfigurations(test, args.t, args.N)
+    for res in test.run():
+        print "%-60s %-22s %-5s %10.4f %10.3g %s" % (
+            res["key"], res["statistic"], res["test"], res["value"],
+            res["pValue"], "DIVERGED" if res["diverged"] else "")
+    divergences = test.divergences()
+    print "%d of %d tests diverged" % (len(divergences), len(test.results))
+    return int(len(divergences) > 0)
+
+if __name__ == "__main__":
+    sys.exit(main())
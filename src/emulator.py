@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey
+#
+#Released under the MIT license, see LICENSE.txt
+
+import argparse
+import cPickle
+import math
+import random
+import sys
+import numpy as np
+
+from histogram import Histogram
+
+""" Emulator of the results of a sweep, to get the histogram at a
+parameter set that wasn't simulated (with an uncertainty) without
+running any replicates.
+
+The cells of an Experiment (for one starting state) are the training
+points.  The parameters that vary between them are its dimensions,
+scaled to 0 to 1 over the range of the cells (after taking the log of
+those given as log dimensions).  Each bin of the mean histogram of a
+replicate (of a category) is interpolated by a Gaussian process with a
+squared exponential kernel.  All the bins share the kernel, so the
+matrix is inverted once: each bin only has its own mean and variance
+(those of its counts over the cells), and a query costs a product with
+the cells.  The length scale of the kernel is the one of a few that
+makes the cells most likely, unless it is given, and the noise of the
+replicates (the variance of their mean, or the Poisson variance for a
+SharedAccumulator) goes on the diagonal.
+
+The predicted standard deviation of a bin is its variance times the
+part of the kernel not explained by the cells, which only depends on
+where the cells are.  So suggest can pick new points one at a time
+where it is largest, counting each picked point as simulated for the
+next ones.
+
+"""
+
+# the parameters of a cell key (Experiment.addParameterSet), in order
+parameterNames = ["t", "N", "rll", "rld", "rdd", "fl", "fg", "pgain"]
+
+# the length scales (in unit coordinates) tried when fitting
+lengthScales = [0.1, 0.15, 0.2, 0.3, 0.5, 0.8, 1.2, 2.]
+
+# mean and variance of the mean of a cell's replicates (a list of
+# replicates, or a SharedAccumulator) as rows over the occupied bins,
+# where columns maps a bin to its column
+def cellMoments(results, category, columns):
+    numBins = len(columns)
+    if isinstance(results, list):
+        rows = np.zeros((len(results), numBins))
+        for i, histograms in enumerate(results):
+            for index, count in histograms[category].iteritems():
+                rows[i, columns[index]] = count
+        mean = rows.mean(axis=0)
+        if len(results) > 1:
+            return mean, rows.var(axis=0, ddof=1) / len(results)
+        return mean, mean
+    mean = np.zeros(numBins)
+    replicates = max(results.replicates(), 1)
+    for index, count in results.histogram(category).iteritems():
+        mean[columns[index]] = count / float(replicates)
+    return mean, mean / replicates
+
+# the bins of a cell's results
+def cellBins(results, category):
+    if isinstance(results, list):
+        res = set()
+        for histograms in results:
+            res.update(histograms[category].iterkeys())
+        return res
+    return set(results.histogram(category).iterkeys())
+
+class Emulator(object):
+    ##################################################################
+    # fit to the cells of exp with the given starting state (which can
+    # be left out if there's only one).  logNames are parameters scaled
+    # by their log.  the length scale is fitted if not given
+    ##################################################################
+    def __init__(self, exp, category="alive", state=None, logNames=[],
+                 lengthScale=None):
+        self.category = category
+        self.scheme = exp.getBinScheme()
+        if state is None:
+            states = set(x[len(parameterNames):] for x in exp.results)
+            assert len(states) == 1
+            state = states.pop()
+        self.state = tuple(state)
+        keys = sorted(x for x in exp.results
+                      if x[len(parameterNames):] == self.state)
+        assert len(keys) > 0
+        params = np.array([x[:len(parameterNames)] for x in keys],
+                          dtype=float)
+        # the parameters that vary and the values of the others
+        self.names = [x for i, x in enumerate(parameterNames)
+                      if len(set(params[:, i])) > 1]
+        assert len(self.names) > 0
+        self.fixed = dict((x, params[0, i]) for i, x in
+                          enumerate(parameterNames) if x not in self.names)
+        self.logNames = [x for x in logNames if x in self.names]
+        columns = np.array([self.__scale(x, params[:, parameterNames.index(x)])
+                            for x in self.names]).reshape(len(self.names), -1)
+        self.lower = columns.min(axis=1)
+        self.upper = columns.max(axis=1)
+        self.points = self.unit(params)
+
+        # only the bins that are occupied in some cell are fitted (the
+        # others are predicted empty), so a long sparse tail is cheap
+        bins = set()
+        for key in keys:
+            bins |= cellBins(exp.results[key], category)
+        self.bins = np.array(sorted(bins), dtype=int)
+        columns = dict((x, i) for i, x in enumerate(self.bins))
+        means = np.zeros((len(keys), len(self.bins)))
+        noise = np.zeros((len(keys), len(self.bins)))
+        for i, key in enumerate(keys):
+            means[i], noise[i] = cellMoments(exp.results[key], category,
+                                             columns)
+        self.binMeans = means.mean(axis=0)
+        self.binScales = means.std(axis=0)
+        # (the bins that are the same in every cell are predicted exactly)
+        self.varying = self.binScales > 0
+        self.binScales[~self.varying] = 1.
+        values = (means - self.binMeans) / self.binScales
+        # the replicate noise relative to the variance of the bins
+        if self.varying.any():
+            self.nugget = float(np.clip(
+                (noise[:, self.varying] /
+                 self.binScales[self.varying] ** 2).mean(), 1e-6, 1.))
+        else:
+            self.nugget = 1e-6
+
+        if lengthScale is None:
+            lengthScale = max(lengthScales, key=lambda x :
+                              self.__likelihood(x, values))
+        self.lengthScale = lengthScale
+        self.inverse = np.linalg.inv(self.__kernel(self.points, self.points) +
+                                     self.nugget * np.eye(len(self.points)))
+        self.weights = self.inverse.dot(values)
+
+    def __scale(self, name, values):
+        if name in self.logNames:
+            return np.log(values)
+        return values
+
+    ##################################################################
+    # unit coordinates (rows) of an array of parameter sets (t, N, rll,
+    # rld, rdd, fl, fg, pgain), one per row
+    ##################################################################
+    def unit(self, params):
+        params = np.asarray(params, dtype=float).reshape(-1,
+                                                         len(parameterNames))
+        res = np.zeros((len(params), len(self.names)))
+        for j, name in enumerate(self.names):
+            column = self.__scale(name, params[:, parameterNames.index(name)])
+            res[:, j] = (column - self.lower[j]) / (self.upper[j] -
+                                                    self.lower[j])
+        return res
+
+    # the parameter set of unit coordinates
+    def parameters(self, point):
+        values = dict(self.fixed)
+        for j, name in enumerate(self.names):
+            value = self.lower[j] + point[j] * (self.upper[j] - self.lower[j])
+            if name in self.logNames:
+                value = math.exp(value)
+            values[name] = value
+        values["N"] = int(round(values["N"]))
+        return tuple(values[x] for x in parameterNames)
+
+    # a parameter set from a dictionary of the varying parameters (the
+    # others are as in the cells), or the parameter set itself
+    def parameterSet(self, query):
+        if isinstance(query, dict):
+            assert all(x in query for x in self.names)
+            values = dict(self.fixed)
+            values.update(query)
+            return tuple(values[x] for x in parameterNames)
+        return tuple(query)
+
+    def __kernel(self, points1, points2):
+        distances = ((points1[:, np.newaxis, :] -
+                      points2[np.newaxis, :, :]) ** 2).sum(axis=2)
+        return np.exp(-distances / (2. * self.lengthScale ** 2))
+
+    # log likelihood (up to a constant) of the standardised bins of the
+    # cells, with a length scale
+    def __likelihood(self, lengthScale, values):
+        self.lengthScale = lengthScale
+        matrix = self.__kernel(self.points, self.points) + \
+                 self.nugget * np.eye(len(self.points))
+        sign, logDet = np.linalg.slogdet(matrix)
+        if sign <= 0:
+            return -float("inf")
+        fit = (values * np.linalg.solve(matrix, values)).sum()
+        return -0.5 * values.shape[1] * logDet - 0.5 * fit
+
+    # the part of the kernel's variance at some points (unit
+    # coordinates) that the cells don't explain
+    def __residual(self, points):
+        cross = self.__kernel(points, self.points)
+        return np.clip(1. - (cross.dot(self.inverse) * cross).sum(axis=1),
+                       0., 1.)
+
+    ##################################################################
+    # the predicted mean histogram of a replicate at a parameter set
+    # (see parameterSet), and the standard deviation of each bin, as
+    # two Histograms
+    ##################################################################
+    def predict(self, query):
+        point = self.unit(self.parameterSet(query))
+        cross = self.__kernel(point, self.points)
+        mean = self.binMeans + self.binScales * cross.dot(self.weights)[0]
+        std = self.binScales * self.varying * \
+              math.sqrt(self.__residual(point)[0])
+        res = (Histogram(self.scheme), Histogram(self.scheme))
+        for i in np.flatnonzero(mean > 0):
+            res[0].addBin(int(self.bins[i]), mean[i])
+        for i in np.flatnonzero(std):
+            res[1].addBin(int(self.bins[i]), std[i])
+        return res
+
+    # the standard deviation of the predicted number of contigs (summed
+    # over the bins) at a parameter set
+    def uncertainty(self, query):
+        point = self.unit(self.parameterSet(query))
+        return float(np.sqrt(self.__residual(point)[0]) *
+                     self.binScales[self.varying].sum())
+
+    ##################################################################
+    # the count parameter sets (of candidates, random points within the
+    # range of the cells by default) where simulating would reduce the
+    # predicted uncertainty the most, best first
+    ##################################################################
+    def suggest(self, count=1, candidates=None, samples=1000, seed=0):
+        if candidates is None:
+            rand = random.Random(seed)
+            candidates = np.array([[rand.random() for x in self.names]
+                                   for y in xrange(samples)])
+        else:
+            candidates = self.unit([self.parameterSet(x) for x in candidates])
+        points = self.points
+        inverse = self.inverse
+        res = []
+        for i in xrange(min(count, len(candidates))):
+            cross = self.__kernel(candidates, points)
+            residual = 1. - (cross.dot(inverse) * cross).sum(axis=1)
+            best = int(np.argmax(residual))
+            res.append(self.parameters(candidates[best]))
+            # the picked point counts as simulated for the next ones
+            points = np.vstack([points, candidates[best]])
+            inverse = np.linalg.inv(self.__kernel(points, points) +
+                                    self.nugget * np.eye(len(points)))
+            candidates = np.delete(candidates, best, axis=0)
+        return res
+
+# parse a name=value[,name=value...] query
+def parseQuery(text):
+    return dict((x.split("=")[0], float(x.split("=")[1]))
+                for x in text.split(","))
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    parser = argparse.ArgumentParser(
+        description='Predict histograms at parameter sets that were not '
+        'simulated from the results of a sweep.')
+    parser.add_argument('experiment', type=str,
+                        help='Pickle of the experiment (as saved by runSim).')
+    parser.add_argument('--query', type=str, action='append', default=[],
+                        help='Parameter set to predict, as name=value,... for '
+                        'each parameter that varies in the sweep (repeat for '
+                        'several).')
+    parser.add_argument('--suggest', type=int, default=0,
+                        help='Number of parameter sets to suggest simulating. '
+                        'default=%(default)s')
+    parser.add_argument('--category', type=str, default='alive',
+                        help='Category of the histograms. default=%(default)s')
+    parser.add_argument('--state', type=str, default=None,
+                        help='Starting state garbageSize,numLinear,numCircular '
+                        'of the cells. default=the only one')
+    parser.add_argument('--log', type=str, action='append', default=[],
+                        help='Parameter to interpolate on a log scale (repeat '
+                        'for several).')
+    parser.add_argument('--lengthScale', type=float, default=None,
+                        help='Length scale of the kernel. default=fitted')
+    args = parser.parse_args(argv[1:])
+
+    inFile = open(args.experiment, "rb")
+    exp = cPickle.load(inFile)
+    inFile.close()
+    state = None
+    if args.state is not None:
+        state = [int(x) for x in args.state.split(",")]
+    emulator = Emulator(exp, args.category, state, args.log,
+                        args.lengthScale)
+    print "dimensions %s, length scale %g, nugget %g" % (
+        " ".join(emulator.names), emulator.lengthScale, emulator.nugget)
+    for query in args.query:
+        mean, std = emulator.predict(parseQuery(query))
+        print "%s (uncertainty %g)" % (query,
+                                       emulator.uncertainty(parseQuery(query)))
+        for index in sorted(set(mean.keys()) | set(std.keys())):
+            print "%d\t%g\t%g" % (emulator.scheme.binLower(index),
+                                  mean[index], std[index])
+    for params in emulator.suggest(args.suggest):
+        print "suggest %s" % " ".join(
+            "%s=%g" % (x, params[parameterNames.index(x)])
+            for x in emulator.names)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
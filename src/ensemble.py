@@ -0,0 +1,439 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey
+#
+#Released under the MIT license, see LICENSE.txt
+
+import os
+import sys
+import math
+from collections import defaultdict
+import numpy as np
+
+from histogram import BinScheme
+from histogram import Histogram
+
+""" Run many independent replicates of the Model in lockstep.  Every
+replicate is a row in a set of padded 2-D arrays (contig size, linear flag,
+dead flag and slot occupancy).  At each step all replicates that have not
+yet reached the end time draw their next event together, so sampling, the
+choice of dcj case and the size updates are numpy operations over the batch
+instead of one python call per replicate.
+
+The event rules are exactly those of Model (and the sizes produced are
+those of dcj.py), so the histograms of a run with R replicates are
+distributed the same as those of R runs of Model.simulate.
+
+"""
+
+# event types (indices into the rate vector)
+LL = 0
+LD = 1
+DD = 2
+
+class Ensemble(object):
+    def __init__(self, replicates=1, seed=None):
+        assert replicates > 0
+        self.replicates = replicates
+        self.random = np.random.RandomState(seed)
+        self.rates = np.zeros(3)
+        self.time = np.zeros(replicates)
+        self.__allocate(1)
+        self.__resetCounts()
+
+    ##################################################################
+    # same parameters as Model.setParameters
+    ##################################################################
+    def setParameters(self, N, rll, rld = 0, rdd = 0, fl = 0, fg = 0,
+                      pgain = 0):
+        self.N = N
+        self.fl = fl
+        self.fg = fg
+        self.pgain = pgain
+        self.rates = np.array([N * max(rll, 0), N * max(rld, 0),
+                               N * max(rdd, 0)], dtype=float)
+
+    ##################################################################
+    # same starting state as Model.setStartingState, copied into
+    # every replicate
+    ##################################################################
+    def setStartingState(self, garbageSize, numLinear, numCircular):
+        sizes, linear, dead = startingContigs(self.N, garbageSize, numLinear,
+                                              numCircular)
+        n = len(sizes)
+        self.__allocate(max(2 * n, 4))
+        self.size[:, :n] = np.array(sizes, dtype=np.int64)
+        self.linear[:, :n] = np.array(linear, dtype=bool)
+        self.dead[:, :n] = np.array(dead, dtype=bool)
+        self.used[:, :n] = True
+
+    ##################################################################
+    # run all the replicates for the specified time
+    ##################################################################
+    def simulate(self, time):
+        self.__resetCounts()
+        self.time = np.zeros(self.replicates)
+        totalRate = self.rates.sum()
+        if totalRate <= 0:
+            self.time[:] = time
+            return
+        cumRates = np.cumsum(self.rates) / totalRate
+        active = np.arange(self.replicates)
+        while len(active) > 0:
+            # the event queue is a superposition of poisson processes,
+            # so the next event is exponential in the total rate and
+            # its type is chosen in proportion to the individual rates
+            nextTime = self.time[active] + \
+                       self.random.exponential(1.0 / totalRate, len(active))
+            done = nextTime > time
+            self.time[active[done]] = time
+            active = active[~done]
+            if len(active) == 0:
+                break
+            self.time[active] = nextTime[~done]
+            eventType = np.searchsorted(cumRates,
+                                        self.random.random_sample(len(active)),
+                                        side='right')
+            eventType = np.minimum(eventType, DD)
+            self.__step(active, eventType)
+
+    ##################################################################
+    # one histogram dictionary (in the format made by Experiment)
+    # for each replicate, binned by scheme (or in linear bins of
+    # binSize if it is None)
+    ##################################################################
+    def histograms(self, binSize = 1, scheme = None):
+        if scheme is None:
+            scheme = BinScheme(binSize)
+        results = []
+        weight = self.__weights()
+        categories = [("overall", self.used),
+                      ("dead", self.used & self.dead),
+                      ("alive", self.used & ~self.dead),
+                      ("aliveLinear", self.used & ~self.dead & self.linear),
+                      ("aliveCircular", self.used & ~self.dead & ~self.linear),
+                      ("deadLinear", self.used & self.dead & self.linear),
+                      ("deadCircular", self.used & self.dead & ~self.linear)]
+        for rep in xrange(self.replicates):
+            res = dict()
+            for name, mask in categories:
+                hist = Histogram(scheme)
+                bins = scheme.binIndices(weight[rep, mask[rep]])
+                for key, count in zip(*np.unique(bins, return_counts=True)):
+                    hist.addBin(int(key), int(count))
+                res[name] = hist
+            results.append(res)
+        return results
+
+    # number of contigs in each replicate's pool
+    def poolSizes(self):
+        return self.used.sum(axis=1)
+
+    # total weight (number of bases) in each replicate's pool
+    def poolWeights(self):
+        return self.__weights().sum(axis=1)
+
+    # the counters of replicate rep, in the same order as Experiment
+    # prints them for Model
+    def counts(self, rep):
+        return (int(self.llCount[rep]),
+                int(self.fgCount[rep]),
+                int(self.flCount[rep]),
+                int(self.ldLossCount[rep]),
+                int(self.ldSwapCount[rep]),
+                int(self.ddGainCount[rep]),
+                int(self.ddSwapCount[rep]))
+
+    ##################################################################
+    # make empty pools with room for width contigs each
+    ##################################################################
+    def __allocate(self, width):
+        shape = (self.replicates, width)
+        self.size = np.zeros(shape, dtype=np.int64)
+        self.linear = np.zeros(shape, dtype=bool)
+        self.dead = np.zeros(shape, dtype=bool)
+        self.used = np.zeros(shape, dtype=bool)
+
+    # double the width of the pools
+    def __grow(self):
+        width = self.size.shape[1]
+        pad = ((0, 0), (0, width))
+        self.size = np.pad(self.size, pad, 'constant')
+        self.linear = np.pad(self.linear, pad, 'constant')
+        self.dead = np.pad(self.dead, pad, 'constant')
+        self.used = np.pad(self.used, pad, 'constant')
+
+    # sampling weight of each slot (number of bases, as in Model)
+    def __weights(self):
+        weight = np.where(self.linear, self.size - 1, self.size)
+        return np.where(self.used, np.maximum(weight, 0), 0)
+
+    ##################################################################
+    # sample a contig index and an edge offset in each of the given rows
+    # with probability proportional to the contig weights.  offsets are
+    # moved to the right telomere half the time like Model.__drawSamples
+    ##################################################################
+    def __sample(self, rows, cumWeight, total):
+        x = np.floor(self.random.random_sample(len(rows)) * total)
+        x = np.minimum(x.astype(np.int64), total - 1)
+        idx = (cumWeight <= x[:, None]).sum(axis=1)
+        r = np.arange(len(rows))
+        offset = x - (cumWeight[r, idx] - self.__w[r, idx])
+        return idx, offset
+
+    ##################################################################
+    # advance the given replicates by one event each
+    ##################################################################
+    def __step(self, rows, eventType):
+        self.__w = self.__weights()[rows]
+        cumWeight = np.cumsum(self.__w, axis=1)
+        total = cumWeight[:, -1]
+        count = self.used[rows].sum(axis=1)
+
+        # Model ignores events on empty pools or pools of weight 1
+        ok = (count > 0) & (total != 1)
+        rows = rows[ok]
+        eventType = eventType[ok]
+        cumWeight = cumWeight[ok]
+        total = total[ok]
+        self.__w = self.__w[ok]
+        if len(rows) == 0:
+            return
+
+        idx1, o1 = self.__sample(rows, cumWeight, total)
+        idx2, o2 = self.__sample(rows, cumWeight, total)
+        ev = resolveEvents(self.random, eventType,
+                           self.size[rows, idx1], o1, self.linear[rows, idx1],
+                           self.dead[rows, idx1],
+                           self.size[rows, idx2], o2, self.linear[rows, idx2],
+                           self.dead[rows, idx2],
+                           idx1 == idx2, self.fl, self.fg, self.pgain)
+
+        self.llCount[rows] += ev.llNormal
+        self.fgCount[rows] += ev.gain
+        self.flCount[rows] += ev.loss
+        self.ldLossCount[rows] += ev.ldLoss
+        self.ldSwapCount[rows] += ev.ldSwap
+        self.ddGainCount[rows] += ev.ddGain
+        self.ddSwapCount[rows] += ev.ddSwap
+
+        c = ev.changed
+        self.__apply(rows[c], idx1[c], idx2[c], ev.same[c], ev.n[c],
+                     ev.sA[c], ev.lA[c], ev.dA[c],
+                     ev.sB[c], ev.lB[c], ev.dB[c])
+
+    ##################################################################
+    # write the results of the events back into the pools.  the first
+    # result replaces the first sampled contig, the second result
+    # replaces the second sampled contig (or goes to a free slot)
+    ##################################################################
+    def __apply(self, rows, idx1, idx2, same, n, sA, lA, dA, sB, lB, dB):
+        if len(rows) == 0:
+            return
+        self.size[rows, idx1] = sA
+        self.linear[rows, idx1] = lA
+        self.dead[rows, idx1] = dA
+
+        # one result from two contigs: free the second slot
+        free = (n == 1) & ~same
+        self.used[rows[free], idx2[free]] = False
+
+        # two results from one contig: need a new slot
+        new = (n == 2) & same
+        if np.any(new):
+            while np.any(self.used[rows[new]].all(axis=1)):
+                self.__grow()
+            slot = np.argmin(self.used[rows[new]], axis=1)
+            idx2 = idx2.copy()
+            idx2[new] = slot
+        two = n == 2
+        r = rows[two]
+        i = idx2[two]
+        self.size[r, i] = sB[two]
+        self.linear[r, i] = lB[two]
+        self.dead[r, i] = dB[two]
+        self.used[r, i] = True
+
+    ##################################################################
+    # all counters set to zero.
+    ##################################################################
+    def __resetCounts(self):
+        self.llCount = np.zeros(self.replicates, dtype=np.int64)
+        self.fgCount = np.zeros(self.replicates, dtype=np.int64)
+        self.flCount = np.zeros(self.replicates, dtype=np.int64)
+        self.ldLossCount = np.zeros(self.replicates, dtype=np.int64)
+        self.ldSwapCount = np.zeros(self.replicates, dtype=np.int64)
+        self.ddGainCount = np.zeros(self.replicates, dtype=np.int64)
+        self.ddSwapCount = np.zeros(self.replicates, dtype=np.int64)
+
+
+##################################################################
+# the contigs of Model.setStartingState as lists of size (number of
+# edges), linear flag and dead flag
+##################################################################
+def startingContigs(N, garbageSize, numLinear, numCircular):
+    assert N > garbageSize + numLinear + numCircular
+    sizes = []
+    linear = []
+    dead = []
+    if garbageSize > 0:
+        sizes.append(garbageSize)
+        linear.append(False)
+        dead.append(True)
+
+    lrat = float(numLinear) / (numLinear + numCircular)
+    crat = float(numCircular) / (numLinear + numCircular)
+    linearBases = math.floor((N - garbageSize) * lrat)
+    circularBases = math.ceil((N - garbageSize) * crat)
+    assert linearBases + circularBases + garbageSize == N
+
+    if numLinear > 0:
+        linSize = math.floor(linearBases / numLinear)
+        extra = linearBases % numLinear
+        for i in range(numLinear):
+            size = linSize
+            if i < extra:
+                size += 1
+            # plus 1 since number of adjacencies is 1 + number of bases
+            sizes.append(size + 1)
+            linear.append(True)
+            dead.append(False)
+
+    if numCircular > 0:
+        circSize = math.floor(circularBases / numCircular)
+        extra = circularBases % numCircular
+        for i in range(numCircular):
+            size = circSize
+            if i < extra:
+                size += 1
+            sizes.append(size)
+            linear.append(False)
+            dead.append(False)
+    return sizes, linear, dead
+
+##################################################################
+# the outcome of a batch of independent events (one per array entry).
+# the changed mask says which events modify the pool; for those the
+# sampled contig(s) are replaced by n results (size, linear, dead) A
+# and, if n == 2, B.  the remaining masks are the event counters of
+# Model
+##################################################################
+class EventOutcome(object):
+    pass
+
+##################################################################
+# apply the rules of Model.__llEvent, __ldEvent and __ddEvent to a
+# batch of sampled position pairs.  offsets are as drawn from the
+# weights (number of bases); the telomere flip of Model.__drawSamples
+# is done here
+##################################################################
+def resolveEvents(random, eventType, s1, o1, l1, d1, s2, o2, l2, d2, same,
+                  fl, fg, pgain):
+    count = len(eventType)
+    flip1 = l1 & (o1 == 0) & (random.random_sample(count) < 0.5)
+    o1 = np.where(flip1, s1 - 1, o1)
+    flip2 = ~same & l2 & (o2 == 0) & (random.random_sample(count) < 0.5)
+    o2 = np.where(flip2, s2 - 1, o2)
+
+    isLL = eventType == LL
+    isLD = eventType == LD
+    isDD = eventType == DD
+
+    # LIVE-DEAD: swap so that the first sample is the live one
+    swap = isLD & d1
+    s1, s2 = np.where(swap, s2, s1), np.where(swap, s1, s2)
+    l1, l2 = np.where(swap, l2, l1), np.where(swap, l1, l2)
+    d1, d2 = np.where(swap, d2, d1), np.where(swap, d1, d2)
+    o1, o2 = np.where(swap, o2, o1), np.where(swap, o1, o2)
+
+    rand = random.random_sample(count)
+    telo1 = l1 & ((o1 == 0) | (o1 == s1 - 1))
+    telo2 = l2 & ((o2 == 0) | (o2 == s2 - 1))
+
+    # LIVE-LIVE: gain, loss or regular dcj
+    llOk = isLL & ~d1 & ~d2
+    gain = llOk & same & (o1 == o2)
+    gainOk = gain & (~l1 | ~telo1) & (fg > rand)
+    loss = llOk & ~gain & l1 & l2 & telo1 & telo2
+    lossOk = loss & (np.where(same, fl / 4.0, fl / 2.0) > rand)
+    llNormal = llOk & ~gain & ~loss
+
+    # LIVE-DEAD and DEAD-DEAD
+    ldOk = isLD & (d1 != d2)
+    ddOk = isDD & d1 & d2 & (o1 != o2)
+    assert np.all(same[ddOk])
+
+    forward = np.where(isDD, rand > pgain, rand < 0.5)
+    forward = forward | gainOk
+    n, sA, lA, sB, lB = dcjSizes(s1, o1, l1, s2, o2, l2, same, forward)
+
+    # telomere loss: circularize the first contig then join
+    n = np.where(lossOk, 1, n)
+    sA = np.where(lossOk, np.where(same, s1 + 1, s1 + s2 + 1), sA)
+    lA = np.where(lossOk, ~same, lA)
+
+    # the dead flag goes to one of the results, chosen by size
+    deadB = (n == 2) & \
+            (np.floor(random.random_sample(count) * (sA + sB + 1)) >= sA)
+    hasDead = ldOk | ddOk
+
+    ev = EventOutcome()
+    ev.same = same
+    ev.n = n
+    ev.sA = sA
+    ev.lA = lA
+    ev.dA = hasDead & ~deadB
+    ev.sB = sB
+    ev.lB = lB
+    ev.dB = hasDead & deadB
+    ev.changed = gainOk | lossOk | llNormal | ldOk | ddOk
+    ev.llNormal = llNormal
+    ev.gain = gainOk
+    ev.loss = lossOk
+    ev.ldLoss = ldOk & (n == 1)
+    ev.ldSwap = ldOk & (n == 2)
+    ev.ddGain = ddOk & ~forward
+    ev.ddSwap = ddOk & forward
+    return ev
+
+##################################################################
+# the sizes produced by dcj.py for every combination of contig
+# types, as arrays.  returns the number of results and the
+# (size, linear) of the first and second result
+##################################################################
+def dcjSizes(s1, o1, l1, s2, o2, l2, same, forward):
+    p1 = np.minimum(o1, o2)
+    p2 = np.maximum(o1, o2)
+    eq = p1 == p2
+    gap = p2 - p1
+    zero = np.zeros_like(s1)
+
+    # single linear contig
+    linN = np.where(eq == forward, 2, 1)
+    linA = np.where(eq, np.where(forward, p1 + 1, s1),
+                    np.where(forward, s1, s1 - gap))
+    linB = np.where(eq, s1 - p1, gap)
+    linLB = eq
+
+    # single circular contig
+    cirN = np.where(~eq & ~forward, 2, 1)
+    cirA = np.where(~eq & ~forward, gap, s1)
+    cirLA = eq & forward
+    cirB = s1 - gap
+
+    # two linear contigs
+    llA = np.where(forward, o1 + o2 + 1, o1 + s2 - o2)
+    llB = np.where(forward, s1 + s2 - o1 - o2 - 1, o2 + s1 - o1)
+
+    # linear with circular, or two circulars, make one contig
+    joinLA = l1 | l2
+
+    sl = same & l1
+    sc = same & ~l1
+    ll = ~same & l1 & l2
+    n = np.where(sl, linN, np.where(sc, cirN, np.where(ll, 2, 1)))
+    sA = np.where(sl, linA, np.where(sc, cirA, np.where(ll, llA, s1 + s2)))
+    lA = np.where(sl, True, np.where(sc, cirLA, np.where(ll, True, joinLA)))
+    sB = np.where(sl, linB, np.where(sc, cirB, np.where(ll, llB, zero)))
+    lB = np.where(sl, linLB, ll)
+    return n, sA, lA, sB, lB
@@ -14,44 +14,81 @@ from heapq import heappush, heappop
 """ Generate events over time.  There can be different types of events
 with different (exponential) rates.  
 
+The rate of an event type can be changed during a simulation with
+setRate().  Since the times are exponential (memoryless), its next time
+is then simply drawn again with the new rate.  The old heap entry is
+left where it is and skipped by next() (each type's valid next time is
+kept in self.pending).
+
 """
 class EventQueue(object):
     def __init__(self):
         self.time = 0
         self.rates = dict()
         self.heap = []
+        # the next time of each event type (None if its rate is 0)
+        self.pending = dict()
+        # optional Metrics object to count calls to next() in
+        self.metrics = None
 
     # zap everything
     def reset(self):
         self.time = 0
         self.rates = dict()
         self.heap  = []
+        self.pending = dict()
 
     # add a new event (with an exponential rate and a unique name)
     def addEventType(self, rate, name):
         assert name not in self.rates
         self.rates[name] = rate
 
-    # begin the simulation at time=0
-    def begin(self):
-        self.time = 0
+    # begin the simulation at time=0 (or at startTime, drawing the next
+    # times afresh, which the exponential times allow)
+    def begin(self, startTime=0):
+        self.time = startTime
         self.heap = []
-        for item in self.rates.items():
-            delta = random.expovariate(item[1])
-            heappush(self.heap, (delta, item[0]))
+        self.pending = dict()
+        for name in self.rates.keys():
+            self.__schedule(name)
+
+    # change the rate of an event type (0 to stop it).  if the
+    # simulation has begun, its next time is drawn with the new rate
+    def setRate(self, name, rate):
+        assert name in self.rates
+        self.rates[name] = rate
+        if name in self.pending:
+            self.__schedule(name)
+
+    # draw the next time of an event type
+    def __schedule(self, name):
+        rate = self.rates[name]
+        if rate > 0:
+            nextTime = self.time + random.expovariate(rate)
+            self.pending[name] = nextTime
+            heappush(self.heap, (nextTime, name))
+        else:
+            self.pending[name] = None
 
     # move clock forward to next event and return its name
     def next(self, maxTime=sys.maxint):
-        if len(self.heap) == 0:
-            return None
-        item = heappop(self.heap)
-        name = item[1]
+        while True:
+            if len(self.heap) == 0:
+                return None
+            item = heappop(self.heap)
+            name = item[1]
+            # skip the entries made stale by setRate
+            if self.pending[name] == item[0]:
+                break
         assert self.time <= item[0]
         self.time = item[0]
+        if self.metrics is not None:
+            self.metrics.count("eventQueue.next")
         if self.time > maxTime:
             self.time = maxTime
             return None
         else:
             nextTime = random.expovariate(self.rates[name]) + self.time
+            self.pending[name] = nextTime
             heappush(self.heap, (nextTime, name))
             return name
@@ -12,16 +12,21 @@ Dent Earl, dearl (a) soe ucsc edu
 #Released under the MIT license, see LICENSE.txt
 import argparse
 import cPickle
+import json
 import os
 import sys
 import copy
 import random
 import math
+import multiprocessing
 from collections import defaultdict
 
 
 from model import Model
 from sampleTree import SampleTree
+from bucketSampler import BucketSampler
+from journal import JournalWriter
+from histogram import BinScheme
 
 
 # framework for generating experimental results from the simulation,
@@ -32,7 +37,19 @@ class Experiment(object):
         self.parameterSpace = []
         self.startingStateSpace = []
         self.results = dict()
+        # per-replicate dictionaries of run information (such as the
+        # tuned SampleTree degree), keyed like results
+        self.metadata = dict()
         self.binSize = 1
+        # bins of the histograms (None for linear bins of binSize)
+        self.binScheme = None
+        self.engine = "model"
+        self.poolType = SampleTree
+        self.tuneEvents = 0
+        self.collectMetrics = False
+        self.journalDir = None
+        self.pauseGC = False
+        self.thinning = False
 
     def addParameterSet(self, t, N, rll, rld = 0, rdd = 0, fl = 0, fg = 0,
                         pgain = 0):
@@ -44,6 +61,62 @@ class Experiment(object):
     def setNumReplicates(self, n):
         self.replicates = n
 
+    # "model" runs each replicate with its own Model, "ensemble" runs
+    # all the replicates of a cell together in a single Ensemble and
+    # "population" runs each replicate with a PopulationModel whose size
+    # classes are the histogram bins
+    def setEngine(self, engine):
+        assert engine in ("model", "ensemble", "population")
+        self.engine = engine
+
+    # the pool class used by Model (SampleTree or BucketSampler)
+    def setPoolType(self, poolType):
+        self.poolType = poolType
+
+    # tune the SampleTree degree of each Model after this many events
+    # (0 to keep the default degree)
+    def setTuneEvents(self, tuneEvents):
+        self.tuneEvents = tuneEvents
+
+    # record Metrics for each Model run (in metadata["metrics"])
+    def setCollectMetrics(self, collectMetrics):
+        self.collectMetrics = collectMetrics
+
+    # disable the cyclic garbage collector while each Model simulates
+    def setPauseGC(self, pauseGC):
+        self.pauseGC = pauseGC
+
+    # skip the null LIVE-LIVE events of each Model (see Model)
+    def setThinning(self, thinning):
+        self.thinning = thinning
+
+    # write a journal of each Model run to this directory (see
+    # journalPath for the file names), or None to not
+    def setJournalDir(self, journalDir):
+        self.journalDir = journalDir
+
+    # bin the results by a BinScheme (such as log bins for large contigs)
+    # rather than linearly by binSize.  its binSize is used for the
+    # population engine's size classes
+    def setBinScheme(self, scheme):
+        self.binScheme = scheme
+
+    def getBinScheme(self):
+        # (experiments pickled before bin schemes existed have none)
+        scheme = getattr(self, "binScheme", None)
+        if scheme is None:
+            return BinScheme(self.binSize)
+        return scheme
+
+    def journalPath(self, key, rep):
+        name = "_".join(str(x) for x in key)
+        return os.path.join(self.journalDir, "%s_rep%d.csj" % (name, rep))
+
+    # the metrics dictionaries of the replicates of a cell, as json
+    def metricsJson(self, key):
+        return json.dumps([x.get("metrics") for x in self.metadata[key]],
+                          indent=1, sort_keys=True)
+
     def reset():
         self.parameterSpace = []
         self.startingStateSpace = []
@@ -51,42 +124,143 @@ class Experiment(object):
         self.replicates = 1
 
     def run(self, replicates = 1, binSize = 1):
+        for cell in self.runCells(replicates, binSize):
+            pass
+
+    # run the experiment one cell (parameter set and starting state) at a
+    # time, yielding (key, list of replicate results) as each one finishes
+    def runCells(self, replicates = 1, binSize = 1):
         self.replicates = replicates
         self.binSize = binSize
+        if self.binScheme is not None:
+            assert self.binScheme.binSize == binSize
         for params in self.parameterSpace:
             for state in self.startingStateSpace:
                 self.__runInstance(params, state)
+                key = params + state
+                yield (key, self.results[key])
+
+    ##################################################################
+    # run the experiment like runCells, but with the replicates of each
+    # cell split among some (forked) processes, which add their pools
+    # straight into a SharedAccumulator in shared memory rather than
+    # sending back the histograms of every replicate.  the results of
+    # each cell are then its accumulator (see sharedHistogram.py), which
+    # only has the sums of the replicates, reduced into its first
+    # stripe.  process i is seeded with seed + i (a random seed if
+    # None).  not for the ensemble engine
+    ##################################################################
+    def runCellsShared(self, replicates = 1, binSize = 1, processes = 2,
+                       seed = None):
+        from sharedHistogram import SharedAccumulator
+        assert self.engine != "ensemble"
+        self.replicates = replicates
+        self.binSize = binSize
+        if self.binScheme is not None:
+            assert self.binScheme.binSize == binSize
+        if seed is None:
+            seed = random.randint(0, sys.maxint - 1)
+        for params in self.parameterSpace:
+            for state in self.startingStateSpace:
+                # (telomere gains can add a few bases.  only the first
+                # bins are dense, the others go in the overflow)
+                accumulator = SharedAccumulator(processes, 2 * params[1],
+                                                self.getBinScheme())
+                workers = [multiprocessing.Process(
+                    target=self.__runSharedWorker,
+                    args=(params, state, accumulator, i, processes, seed + i))
+                           for i in xrange(processes)]
+                for worker in workers:
+                    worker.start()
+                accumulator.reduce(workers)
+                for worker in workers:
+                    worker.join()
+                    assert worker.exitcode == 0
+                assert accumulator.replicates() == replicates
+                seed += processes
+                key = params + state
+                self.results[key] = accumulator
+                self.metadata[key] = [dict() for rep in xrange(replicates)]
+                yield (key, accumulator)
+
+    # add the replicates of another experiment (with the same bins)
+    # to this one's
+    def merge(self, other):
+        assert other.binSize == self.binSize
+        assert other.getBinScheme() == self.getBinScheme()
+        if not hasattr(self, "metadata"):
+            self.metadata = dict((k, [dict() for x in v]) for k, v in
+                                 self.results.items())
+        otherMetadata = getattr(other, "metadata", dict())
+        for key, results in other.results.items():
+            if key not in self.results:
+                self.results[key] = []
+                self.metadata[key] = []
+            # (summed replicates of runCellsShared take in the others)
+            if not isinstance(self.results[key], list):
+                self.results[key].extend(results)
+            elif not isinstance(results, list):
+                from sharedHistogram import SharedAccumulator
+                accumulator = SharedAccumulator(1, results.scheme.binUpper(
+                    results.numBins - 1) - 1, results.scheme)
+                accumulator.extend(self.results[key])
+                accumulator.extend(results)
+                self.results[key] = accumulator
+            else:
+                self.results[key].extend(results)
+            self.metadata[key].extend(otherMetadata.get(
+                key, [dict() for x in xrange(len(results))]))
+        for params in other.parameterSpace:
+            if params not in self.parameterSpace:
+                self.parameterSpace.append(params)
+        for state in other.startingStateSpace:
+            if state not in self.startingStateSpace:
+                self.startingStateSpace.append(state)
 
     def __extractResultsFromModel(self, model):
+        scheme = self.getBinScheme()
+        # the population engine makes its own histograms
+        if not isinstance(model, Model):
+            return model.histograms(scheme=scheme)
         res = dict()
-        res["overall"] = model.pool.histogram(binSize=self.binSize)
-        res["dead"] = model.pool.histogram(binSize=self.binSize,
+        res["overall"] = model.pool.histogram(scheme=scheme)
+        res["dead"] = model.pool.histogram(scheme=scheme,
             checkFn = lambda x : x.isDead() == True)
-        res["alive"] =  model.pool.histogram(binSize=self.binSize,
+        res["alive"] =  model.pool.histogram(scheme=scheme,
             checkFn = lambda x : x.isDead() == False)
-        res["aliveLinear"] = model.pool.histogram(binSize=self.binSize,
+        res["aliveLinear"] = model.pool.histogram(scheme=scheme,
             checkFn = lambda x : not x.isDead() and x.isLinear())
-        res["aliveCircular"] = model.pool.histogram(binSize=self.binSize,
+        res["aliveCircular"] = model.pool.histogram(scheme=scheme,
             checkFn = lambda x : not x.isDead() and x.isCircular())
-        res["deadLinear"] = model.pool.histogram(binSize=self.binSize,
+        res["deadLinear"] = model.pool.histogram(scheme=scheme,
             checkFn = lambda x : x.isDead() == True and x.isLinear())
-        res["deadCircular"] = model.pool.histogram(binSize=self.binSize,
+        res["deadCircular"] = model.pool.histogram(scheme=scheme,
             checkFn = lambda x : x.isDead() ==True and x.isCircular())
         return res
 
     def __runInstance(self, parameters, startState):
+        if self.engine == "ensemble":
+            return self.__runEnsembleInstance(parameters, startState)
+        model = None
         for rep in xrange(0, self.replicates):
-            model = Model()
-            model.setParameters(parameters[1], parameters[2], parameters[3],
-                                parameters[4], parameters[5], parameters[6],
-                                parameters[7])
-            model.setStartingState(startState[0], startState[1], startState[2])
-            model.simulate(parameters[0])
+            model = self.__nextModel(model)
+            if isinstance(model, Model) and self.journalDir is not None:
+                model.setJournal(JournalWriter(self.journalPath(
+                    parameters + startState, rep)))
+            self.__simulate(model, parameters, startState)
+            if isinstance(model, Model) and model.journal is not None:
+                model.journal.close()
+                model.setJournal(None)
             results = self.__extractResultsFromModel(model)
             key = parameters + startState
             if rep is 0:
                 self.results[key] = []
+                self.metadata[key] = []
             self.results[key].append(results)
+            if isinstance(model, Model):
+                self.metadata[key].append(model.metadata)
+            else:
+                self.metadata[key].append(dict())
             print (model.llCount,
                    model.fgCount,
                    model.flCount,
@@ -94,3 +268,66 @@ class Experiment(object):
                    model.ldSwapCount,
                    model.ddGainCount,
                    model.ddSwapCount)
+
+    # the model of the next replicate, given the last one (or None)
+    def __nextModel(self, model):
+        if self.engine == "population":
+            # (numpy is only imported by the engines that need it)
+            from populationModel import PopulationModel
+            return PopulationModel(classWidth=self.binSize)
+        # the replicates share a Model, which is reset (keeping its
+        # nodes and contigs for reuse) between them
+        if model is None:
+            model = Model(poolType=self.poolType,
+                          tuneEvents=self.tuneEvents,
+                          pauseGC=getattr(self, "pauseGC", False),
+                          thinning=getattr(self, "thinning", False))
+            if self.collectMetrics:
+                model.enableMetrics()
+        else:
+            model.reset()
+        return model
+
+    def __simulate(self, model, parameters, startState):
+        model.setParameters(parameters[1], parameters[2], parameters[3],
+                            parameters[4], parameters[5], parameters[6],
+                            parameters[7])
+        model.setStartingState(startState[0], startState[1], startState[2])
+        model.simulate(parameters[0])
+
+    # run replicates worker, worker + numWorkers, ... of a cell into
+    # the worker's stripe of the accumulator (in a forked process)
+    def __runSharedWorker(self, parameters, startState, accumulator, worker,
+                          numWorkers, seed):
+        random.seed(seed)
+        model = None
+        for rep in xrange(worker, self.replicates, numWorkers):
+            model = self.__nextModel(model)
+            self.__simulate(model, parameters, startState)
+            if isinstance(model, Model):
+                accumulator.addPool(worker, model.pool)
+            else:
+                accumulator.addHistograms(worker, model.histograms(
+                    scheme=self.getBinScheme()))
+            print (model.llCount,
+                   model.fgCount,
+                   model.flCount,
+                   model.ldLossCount,
+                   model.ldSwapCount,
+                   model.ddGainCount,
+                   model.ddSwapCount)
+        accumulator.send()
+
+    def __runEnsembleInstance(self, parameters, startState):
+        from ensemble import Ensemble
+        ensemble = Ensemble(self.replicates)
+        ensemble.setParameters(parameters[1], parameters[2], parameters[3],
+                               parameters[4], parameters[5], parameters[6],
+                               parameters[7])
+        ensemble.setStartingState(startState[0], startState[1], startState[2])
+        ensemble.simulate(parameters[0])
+        key = parameters + startState
+        self.results[key] = ensemble.histograms(scheme=self.getBinScheme())
+        self.metadata[key] = [dict() for rep in xrange(self.replicates)]
+        for rep in xrange(0, self.replicates):
+            print ensemble.counts(rep)
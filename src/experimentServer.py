@@ -0,0 +1,534 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey
+#
+#Released under the MIT license, see LICENSE.txt
+
+import argparse
+import cPickle
+import hashlib
+import json
+import os
+import sys
+import random
+import socket
+import threading
+import time
+import traceback
+import multiprocessing
+from multiprocessing.queues import SimpleQueue
+import SocketServer
+import Queue
+
+from experiment import Experiment
+from bucketSampler import BucketSampler
+from histogram import BinScheme
+from histogram import Histogram
+
+""" Local experiment server.  Several scripts (or notebooks) driving
+Experiment at once send their sweeps to one server instead of each
+simulating the cells itself.  The server splits a sweep into tasks, one
+per cell (parameter set and starting state) and seed, runs them on a
+pool of worker processes, and keeps the results, so a task that is
+already running or finished for one client is never run again for
+another.  Results are also pickled to a cache directory (if given) so
+they outlive the server.
+
+The protocol is one json object per line over a localhost TCP socket
+(the server is threaded, as python 2 has no asyncio).  A request is one
+of
+  {"op" : "submit", "sweep" : sweep}  run a sweep, streaming events
+  {"op" : "fetch", "sweep" : sweep}   get the results of a sweep that
+                                      are ready, without running anything
+  {"op" : "status"}                   number of tasks in each state
+where a sweep is
+  {"parameterSets" : [[t, N, rll, rld, rdd, fl, fg, pgain], ...],
+   "startingStates" : [[garbageSize, numLinear, numCircular], ...],
+   "replicates" : 1, "seed" : 0, "binSize" : 1, "logBase" : null,
+   "linearLimit" : null, "engine" : "model", "pool" : "tree",
+   "thinning" : false}
+(parameter sets and starting states can also be objects with the
+argument names of Experiment.addParameterSet and addStartingState).
+A submit is answered with an "accepted" event, then a "cell" event as
+each of its cells finishes, with the mean histograms of its replicates
+and the number of cells done so far, and finally a "done" event.
+
+A worker tells the server which task it starts (through a queue given
+to the pool's initializer), and a watcher thread checks that the
+workers running tasks are still alive: a task whose worker died (which
+the pool never reports) fails instead of staying queued forever.
+Failed tasks are not kept, so submitting them again runs them again.
+
+Only the model engine is reproducible from the seed (the ensemble and
+population engines draw their own), but their tasks are shared all the
+same.
+
+"""
+
+# the arguments of a parameter set and a starting state
+parameterNames = ["t", "N", "rll", "rld", "rdd", "fl", "fg", "pgain"]
+stateNames = ["garbageSize", "numLinear", "numCircular"]
+
+# seconds between the watcher's checks of the workers
+checkInterval = 0.2
+
+# the sweep settings (and defaults) that change the results of a cell
+optionNames = [("replicates", 1), ("binSize", 1), ("logBase", None),
+               ("linearLimit", None), ("engine", "model"), ("pool", "tree"),
+               ("thinning", False)]
+
+##################################################################
+# the tasks of a sweep as (params, state, seed, options) tuples, with
+# the numbers normalized so that equal cells get equal keys
+##################################################################
+def sweepTasks(sweep):
+    options = tuple(sweep.get(name, default) for name, default in
+                    optionNames)
+    seed = int(sweep.get("seed", 0))
+    tasks = []
+    for params in sweep["parameterSets"]:
+        if isinstance(params, dict):
+            params = [params.get(x, 0) for x in parameterNames]
+        params = list(params) + [0] * (len(parameterNames) - len(params))
+        params = (float(params[0]), int(params[1])) + \
+                 tuple(float(x) for x in params[2:])
+        for state in sweep["startingStates"]:
+            if isinstance(state, dict):
+                state = [state[x] for x in stateNames]
+            state = tuple(int(x) for x in state)
+            tasks.append((params, state, seed, options))
+    return tasks
+
+# the json form of a task key
+def taskJson(task):
+    return {"params" : list(task[0]), "state" : list(task[1]),
+            "seed" : task[2]}
+
+# the Experiment that runs a task's cell
+def taskExperiment(task):
+    params, state, seed, options = task
+    replicates, binSize, logBase, linearLimit, engine, pool, thinning = \
+                options
+    exp = Experiment()
+    exp.setEngine(engine)
+    if pool == "bucket":
+        exp.setPoolType(BucketSampler)
+    exp.setThinning(thinning)
+    if logBase is not None:
+        exp.setBinScheme(BinScheme(binSize, logBase, linearLimit))
+    exp.addParameterSet(*params)
+    exp.addStartingState(*state)
+    return exp
+
+# the queue a worker process tells the server of the tasks it starts
+# on, as (task, pid)
+startQueue = None
+
+# (the initializer of the worker processes)
+def initWorker(queue):
+    global startQueue
+    startQueue = queue
+
+##################################################################
+# run a task (in a worker process).  returns ("done", results,
+# metadata) with the histograms of the replicates as lists of
+# [bin, count], or ("failed", traceback)
+##################################################################
+def runTask(task):
+    if startQueue is not None:
+        startQueue.put((task, os.getpid()))
+    try:
+        random.seed(task[2])
+        exp = taskExperiment(task)
+        for key, results in exp.runCells(task[3][0], task[3][1]):
+            pass
+        encoded = [dict((name, [[int(i), c] for i, c in hist.iteritems()])
+                        for name, hist in res.items()) for res in results]
+        return ("done", encoded, json.loads(json.dumps(exp.metadata[key])))
+    except Exception:
+        return ("failed", traceback.format_exc())
+
+# the histograms (in the format made by Experiment) of a replicate
+# encoded by runTask
+def decodeResult(result, scheme):
+    hists = dict()
+    for name, pairs in result.items():
+        hists[name] = Histogram(scheme)
+        for index, count in pairs:
+            hists[name].addBin(index, count)
+    return hists
+
+# mean over the replicates of the encoded histograms of a result
+def meanHistograms(results):
+    total = dict()
+    for res in results:
+        for name, pairs in res.items():
+            hist = total.setdefault(name, dict())
+            for index, count in pairs:
+                hist[index] = hist.get(index, 0) + count
+    n = float(max(len(results), 1))
+    return dict((name, [[i, c / n] for i, c in sorted(hist.items())])
+                for name, hist in total.items())
+
+class Task(object):
+    def __init__(self, key):
+        self.key = key
+        # "queued" (waiting for or in a worker), "done" or "failed"
+        self.status = "queued"
+        self.results = None
+        self.metadata = None
+        self.error = None
+        # functions called with the task when it finishes
+        self.listeners = []
+
+    # the json event of a finished task
+    def event(self):
+        res = {"event" : "cell", "key" : taskJson(self.key),
+               "status" : self.status}
+        if self.status == "done":
+            res["aggregate"] = meanHistograms(self.results)
+        else:
+            res["error"] = self.error
+        return res
+
+##################################################################
+# the server: the tasks (by key), the worker pool and the socket
+# server that feeds them.  address port 0 picks a free port (see
+# address())
+##################################################################
+class ExperimentServer(object):
+    def __init__(self, address=("localhost", 0), processes=None,
+                 cacheDir=None):
+        self.tasks = dict()
+        self.lock = threading.Lock()
+        self.cacheDir = cacheDir
+        # number of tasks given to the workers, and of those that failed
+        self.launched = 0
+        self.failed = 0
+        # (a SimpleQueue writes before put returns, so the start of a
+        # task is known even if its worker dies right after)
+        self.started = SimpleQueue()
+        # the task each worker (by pid) last started
+        self.running = dict()
+        self.pool = multiprocessing.Pool(processes, initWorker,
+                                         (self.started,))
+        self.server = ThreadingServer(address, RequestHandler)
+        self.server.experimentServer = self
+        self.thread = None
+        self.closing = threading.Event()
+        self.watcher = threading.Thread(target=self.__watch)
+        self.watcher.daemon = True
+        self.watcher.start()
+
+    def address(self):
+        return self.server.server_address
+
+    # serve in a background thread
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serveForever(self):
+        self.server.serve_forever()
+
+    def close(self):
+        if self.thread is not None:
+            self.server.shutdown()
+            self.thread.join()
+        self.server.server_close()
+        self.closing.set()
+        self.watcher.join()
+        self.pool.terminate()
+        self.pool.join()
+
+    ##################################################################
+    # make sure the tasks of a sweep are run.  listener is called with
+    # each task as it finishes (right away for finished ones, from the
+    # calling thread).  returns the list of task keys
+    ##################################################################
+    def submit(self, sweep, listener):
+        keys = sweepTasks(sweep)
+        finished = []
+        self.lock.acquire()
+        try:
+            for key in keys:
+                task = self.tasks.get(key)
+                if task is None:
+                    task = self.__loadCached(key)
+                if task is None:
+                    task = Task(key)
+                    self.tasks[key] = task
+                    self.launched += 1
+                    self.pool.apply_async(
+                        runTask, (key,),
+                        callback=lambda res, key=key : self.__finish(key, res))
+                if task.status == "queued":
+                    task.listeners.append(listener)
+                else:
+                    finished.append(task)
+        finally:
+            self.lock.release()
+        for task in finished:
+            listener(task)
+        return keys
+
+    # the finished task of a key (None if it isn't)
+    def result(self, key):
+        self.lock.acquire()
+        try:
+            task = self.tasks.get(key)
+            if task is None:
+                task = self.__loadCached(key)
+        finally:
+            self.lock.release()
+        if task is None or task.status == "queued":
+            return None
+        return task
+
+    # the number of tasks in each state
+    def status(self):
+        self.lock.acquire()
+        try:
+            res = {"queued" : 0, "done" : 0, "failed" : self.failed}
+            for task in self.tasks.values():
+                res[task.status] += 1
+            res["launched"] = self.launched
+            return res
+        finally:
+            self.lock.release()
+
+    ##################################################################
+    # (called by the pool's result thread, or the watcher for a task
+    # whose worker died).  a failed task is dropped, to be run again
+    # if it's submitted again
+    ##################################################################
+    def __finish(self, key, result):
+        self.lock.acquire()
+        try:
+            task = self.tasks.get(key)
+            if task is None or task.status != "queued":
+                return
+            task.status = result[0]
+            if task.status == "done":
+                task.results, task.metadata = result[1], result[2]
+            else:
+                task.error = result[1]
+                del self.tasks[key]
+                self.failed += 1
+            listeners = task.listeners
+            task.listeners = []
+        finally:
+            self.lock.release()
+        if task.status == "done" and self.cacheDir is not None:
+            self.__writeCached(task)
+        for listener in listeners:
+            listener(task)
+
+    ##################################################################
+    # (the watcher thread) keep track of the task each worker runs, and
+    # fail the queued tasks of the workers that died.  the pool
+    # replaces a dead worker, but has no public list of them, so this
+    # reads its private one
+    ##################################################################
+    def __watch(self):
+        while not self.closing.wait(checkInterval):
+            while not self.started.empty():
+                key, pid = self.started.get()
+                self.running[pid] = key
+            alive = set(x.pid for x in list(self.pool._pool) if x.is_alive())
+            for pid, key in self.running.items():
+                if pid not in alive:
+                    del self.running[pid]
+                    self.__finish(key, ("failed", "the worker process "
+                                        "(pid %d) died while running the "
+                                        "task" % pid))
+
+    def __cachePath(self, key):
+        return os.path.join(self.cacheDir,
+                            hashlib.md5(repr(key)).hexdigest() + ".pickle")
+
+    # the task of a key from the cache directory (None if it isn't
+    # there).  the lock is held
+    def __loadCached(self, key):
+        if self.cacheDir is None or not os.path.exists(self.__cachePath(key)):
+            return None
+        cacheFile = open(self.__cachePath(key), "rb")
+        cachedKey, results, metadata = cPickle.load(cacheFile)
+        cacheFile.close()
+        if cachedKey != key:
+            return None
+        task = Task(key)
+        task.status = "done"
+        task.results = results
+        task.metadata = metadata
+        self.tasks[key] = task
+        return task
+
+    def __writeCached(self, task):
+        if not os.path.isdir(self.cacheDir):
+            os.makedirs(self.cacheDir)
+        path = self.__cachePath(task.key)
+        cacheFile = open(path + ".tmp", "wb")
+        cPickle.dump((task.key, task.results, task.metadata), cacheFile,
+                     cPickle.HIGHEST_PROTOCOL)
+        cacheFile.close()
+        os.rename(path + ".tmp", path)
+
+class ThreadingServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+##################################################################
+# one client connection: json requests in, json events out, a line
+# each
+##################################################################
+class RequestHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        server = self.server.experimentServer
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            try:
+                request = json.loads(line)
+                op = request.get("op")
+                if op == "submit":
+                    self.__submit(server, request["sweep"])
+                elif op == "fetch":
+                    self.__fetch(server, request["sweep"])
+                elif op == "status":
+                    event = server.status()
+                    event["event"] = "status"
+                    self.__send(event)
+                else:
+                    self.__send({"event" : "error",
+                                 "error" : "unknown op %s" % op})
+            except (KeyError, ValueError, TypeError), e:
+                self.__send({"event" : "error", "error" : str(e)})
+
+    def __submit(self, server, sweep):
+        finished = Queue.Queue()
+        keys = server.submit(sweep, finished.put)
+        self.__send({"event" : "accepted", "total" : len(keys),
+                     "keys" : [taskJson(x) for x in keys]})
+        for completed in xrange(1, len(keys) + 1):
+            event = finished.get().event()
+            event["completed"] = completed
+            event["total"] = len(keys)
+            self.__send(event)
+        self.__send({"event" : "done", "total" : len(keys)})
+
+    def __fetch(self, server, sweep):
+        keys = sweepTasks(sweep)
+        for key in keys:
+            task = server.result(key)
+            event = {"event" : "result", "key" : taskJson(key)}
+            if task is None:
+                event["status"] = "missing"
+            else:
+                event["status"] = task.status
+                event["results"] = task.results
+                event["metadata"] = task.metadata
+                event["error"] = task.error
+            self.__send(event)
+        self.__send({"event" : "done", "total" : len(keys)})
+
+    def __send(self, event):
+        self.wfile.write(json.dumps(event) + "\n")
+        self.wfile.flush()
+
+##################################################################
+# a client of an ExperimentServer
+##################################################################
+class ExperimentClient(object):
+    def __init__(self, address):
+        self.address = tuple(address)
+
+    # iterate through the events of a request, up to its "done"
+    def request(self, request):
+        connection = socket.create_connection(self.address)
+        stream = connection.makefile("rw")
+        try:
+            stream.write(json.dumps(request) + "\n")
+            stream.flush()
+            while True:
+                line = stream.readline()
+                if not line:
+                    raise IOError("experiment server closed the connection")
+                event = json.loads(line)
+                yield event
+                if event["event"] in ("done", "error", "status"):
+                    return
+        finally:
+            stream.close()
+            connection.close()
+
+    # run a sweep, iterating through its events as they come
+    def submit(self, sweep):
+        return self.request({"op" : "submit", "sweep" : sweep})
+
+    # the result events of a sweep's cells (without running them)
+    def fetch(self, sweep):
+        return [x for x in self.request({"op" : "fetch", "sweep" : sweep})
+                if x["event"] == "result"]
+
+    def status(self):
+        return list(self.request({"op" : "status"}))[-1]
+
+    ##################################################################
+    # run a sweep to completion and return it as an Experiment (as if
+    # it had been run locally), with the metadata of each replicate
+    ##################################################################
+    def experiment(self, sweep):
+        for event in self.submit(sweep):
+            if event["event"] == "cell" and event["status"] == "failed":
+                raise RuntimeError(event["error"])
+        tasks = sweepTasks(sweep)
+        exp = taskExperiment(tasks[0])
+        exp.parameterSpace = []
+        exp.startingStateSpace = []
+        exp.replicates = tasks[0][3][0]
+        exp.binSize = tasks[0][3][1]
+        scheme = exp.getBinScheme()
+        for task, event in zip(tasks, self.fetch(sweep)):
+            if task[0] not in exp.parameterSpace:
+                exp.parameterSpace.append(task[0])
+            if task[1] not in exp.startingStateSpace:
+                exp.startingStateSpace.append(task[1])
+            key = task[0] + task[1]
+            exp.results[key] = [decodeResult(x, scheme) for x in
+                                event["results"]]
+            exp.metadata[key] = event["metadata"]
+        return exp
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    parser = argparse.ArgumentParser(
+        description='Serve experiment sweeps to local clients, running '
+        'each cell once.')
+    parser.add_argument('--host', type=str, default='localhost',
+                        help='Address to listen on. default=%(default)s')
+    parser.add_argument('--port', type=int, default=8537,
+                        help='Port to listen on. default=%(default)s')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Number of worker processes. default=number of '
+                        'cpus')
+    parser.add_argument('--cacheDir', type=str, default=None,
+                        help='Keep the results of the cells in this directory, '
+                        'so they are never recomputed.')
+    args = parser.parse_args(argv[1:])
+
+    server = ExperimentServer((args.host, args.port), args.processes,
+                              args.cacheDir)
+    print "serving on %s:%d" % server.address()
+    try:
+        server.serveForever()
+    except KeyboardInterrupt:
+        pass
+    server.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
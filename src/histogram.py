@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey
+#
+#Released under the MIT license, see LICENSE.txt
+
+import os
+import sys
+import math
+from collections import defaultdict
+
+""" Histograms of contig sizes.  A BinScheme maps sizes to bin indices:
+linear bins of binSize, or (given a logBase) linear bins of binSize up to
+linearLimit followed by bins that grow by a factor of logBase, so both
+small and very large contigs are resolved.  A Histogram holds the count
+of each bin index, sparsely (in a dictionary) while few of its bins are
+occupied and densely (in a list) otherwise, switching as it fills up or
+empties.  It reads like the {bin : count} dictionaries we used before
+(so histogram[i], items() etc. work as they did), and histograms of the
+same scheme can be merged in time linear in their number of bins.
+
+"""
+
+class BinScheme(object):
+    def __init__(self, binSize=1, logBase=None, linearLimit=None):
+        self.binSize = int(binSize)
+        self.logBase = logBase
+        if linearLimit is None:
+            linearLimit = self.binSize
+        self.linearLimit = int(linearLimit)
+        assert self.binSize > 0
+        if logBase is not None:
+            assert logBase > 1
+            assert self.linearLimit >= self.binSize and \
+                   self.linearLimit % self.binSize == 0
+        # number of linear bins before the log bins start
+        self.numLinear = self.linearLimit / self.binSize
+
+    def isLog(self):
+        return self.logBase is not None
+
+    # bin index of a size
+    def binIndex(self, value):
+        if self.logBase is None or value < self.linearLimit:
+            return int(value) / self.binSize
+        k = int(math.log(float(value) / self.linearLimit, self.logBase))
+        # correct the rounding of the log at the bin edges
+        while self.linearLimit * self.logBase ** (k + 1) <= value:
+            k += 1
+        while k > 0 and self.linearLimit * self.logBase ** k > value:
+            k -= 1
+        return self.numLinear + k
+
+    # bin indices of a numpy array of sizes
+    def binIndices(self, values):
+        import numpy as np
+        values = np.asarray(values)
+        linear = (values.astype(np.int64) / self.binSize).astype(np.int64)
+        if self.logBase is None:
+            return linear
+        big = values >= self.linearLimit
+        ratio = np.maximum(values, self.linearLimit) / float(self.linearLimit)
+        k = np.floor(np.log(ratio) / math.log(self.logBase)).astype(np.int64)
+        k += self.linearLimit * self.logBase ** (k + 1.) <= values
+        k -= (k > 0) & (self.linearLimit * self.logBase ** (k * 1.) > values)
+        return np.where(big, self.numLinear + k, linear)
+
+    # smallest size in a bin
+    def binLower(self, index):
+        if self.logBase is None or index < self.numLinear:
+            return index * self.binSize
+        return self.linearLimit * self.logBase ** (index - self.numLinear)
+
+    # smallest size of the next bin
+    def binUpper(self, index):
+        return self.binLower(index + 1)
+
+    def __eq__(self, other):
+        return isinstance(other, BinScheme) and \
+               self.binSize == other.binSize and \
+               self.logBase == other.logBase and \
+               self.linearLimit == other.linearLimit
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "BinScheme(%d, %s, %d)" % (self.binSize, self.logBase,
+                                          self.linearLimit)
+
+class Histogram(object):
+    # switch to dense storage when at least denseFraction of the bins up
+    # to the largest occupied one are occupied, and back to sparse when
+    # fewer than sparseFraction are
+    denseFraction = 0.5
+    sparseFraction = 0.25
+
+    def __init__(self, scheme=None):
+        if scheme is None:
+            scheme = BinScheme()
+        self.scheme = scheme
+        self.sparse = dict()
+        self.dense = None
+        # number of bins with non-zero counts
+        self.occupied = 0
+        self.nextCheck = 16
+
+    # add count contigs of the given size
+    def add(self, value, count=1):
+        self.addBin(self.scheme.binIndex(value), count)
+
+    # add count to the bin with the given index
+    def addBin(self, index, count=1):
+        self[index] = self[index] + count
+
+    def isDense(self):
+        return self.dense is not None
+
+    # number of bins from 0 to the largest occupied one
+    def span(self):
+        if self.dense is not None:
+            return len(self.dense)
+        if len(self.sparse) == 0:
+            return 0
+        return 1 + max(self.sparse.iterkeys())
+
+    # sum of the counts
+    def total(self):
+        return sum(self.itervalues())
+
+    ##################################################################
+    # add the counts of another histogram (or {bin : count} dictionary)
+    # to this one, in time linear in the number of bins
+    ##################################################################
+    def merge(self, other):
+        if isinstance(other, Histogram):
+            assert other.scheme == self.scheme
+            if self.dense is not None and other.dense is not None:
+                if len(other.dense) > len(self.dense):
+                    self.dense.extend([0] * (len(other.dense) -
+                                             len(self.dense)))
+                for i, count in enumerate(other.dense):
+                    if count != 0:
+                        self.__set(i, self.dense[i] + count)
+                self.__adapt()
+                return
+        for index, count in other.iteritems():
+            self.addBin(index, count)
+        self.__adapt()
+
+    def copy(self):
+        res = Histogram(self.scheme)
+        res.merge(self)
+        return res
+
+    # a {bin : count} defaultdict
+    def toDict(self):
+        res = defaultdict(int)
+        for index, count in self.iteritems():
+            res[index] = count
+        return res
+
+    ##################################################################
+    # dictionary interface over the occupied bins
+    ##################################################################
+    def __getitem__(self, index):
+        if self.dense is not None:
+            if 0 <= index < len(self.dense):
+                return self.dense[index]
+            return 0
+        return self.sparse.get(index, 0)
+
+    def __setitem__(self, index, count):
+        assert index >= 0
+        if self.dense is not None and index >= len(self.dense):
+            # don't let a far away bin blow up the dense list
+            if self.occupied + 1 < self.sparseFraction * (index + 1):
+                self.__toSparse()
+            else:
+                self.dense.extend([0] * (index + 1 - len(self.dense)))
+        self.__set(index, count)
+        if self.occupied >= self.nextCheck:
+            self.__adapt()
+
+    def __set(self, index, count):
+        old = self[index]
+        if old == 0 and count != 0:
+            self.occupied += 1
+        elif old != 0 and count == 0:
+            self.occupied -= 1
+        if self.dense is not None:
+            self.dense[index] = count
+        elif count == 0:
+            self.sparse.pop(index, None)
+        else:
+            self.sparse[index] = count
+
+    def iteritems(self):
+        if self.dense is not None:
+            for index, count in enumerate(self.dense):
+                if count != 0:
+                    yield (index, count)
+        else:
+            for item in sorted(self.sparse.iteritems()):
+                yield item
+
+    def iterkeys(self):
+        for index, count in self.iteritems():
+            yield index
+
+    def itervalues(self):
+        for index, count in self.iteritems():
+            yield count
+
+    def items(self):
+        return list(self.iteritems())
+
+    def keys(self):
+        return list(self.iterkeys())
+
+    def values(self):
+        return list(self.itervalues())
+
+    def __iter__(self):
+        return self.iterkeys()
+
+    def __len__(self):
+        return self.occupied
+
+    def __contains__(self, index):
+        return self[index] != 0
+
+    def __eq__(self, other):
+        if not isinstance(other, (Histogram, dict)):
+            return False
+        return dict(self.iteritems()) == \
+               dict((k, v) for k, v in other.iteritems() if v != 0)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "Histogram(%s, %s)" % (self.scheme, dict(self.iteritems()))
+
+    # choose the storage from the occupancy
+    def __adapt(self):
+        span = self.span()
+        if self.dense is None and span > 0 and \
+           self.occupied >= self.denseFraction * span:
+            self.dense = [0] * span
+            for index, count in self.sparse.iteritems():
+                self.dense[index] = count
+            self.sparse = dict()
+        elif self.dense is not None and \
+             self.occupied < self.sparseFraction * span:
+            self.__toSparse()
+        elif self.dense is not None:
+            while len(self.dense) > 0 and self.dense[-1] == 0:
+                self.dense.pop()
+        self.nextCheck = 2 * max(self.occupied, 8)
+
+    def __toSparse(self):
+        self.sparse = dict((i, c) for i, c in enumerate(self.dense) if c != 0)
+        self.dense = None
+
+# the sum of some histograms (of the same scheme)
+def mergeHistograms(histograms, scheme=None):
+    res = Histogram(scheme)
+    for hist in histograms:
+        if scheme is None and isinstance(hist, Histogram):
+            res.scheme = hist.scheme
+            scheme = hist.scheme
+        res.merge(hist)
+    return res
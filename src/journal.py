@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey
+#
+#Released under the MIT license, see LICENSE.txt
+
+import os
+import sys
+import struct
+import zlib
+from collections import defaultdict
+
+from histogram import BinScheme
+from histogram import Histogram
+
+""" Binary journal of the accepted events of a Model run, and a replay
+engine that rebuilds the pool from it.
+
+Every record holds the time, the event type, the two sampled offsets,
+the forward flag, and the (size, linear, dead) of the contigs the event
+consumed and produced (at most two of each).  The contigs in the pool at
+the start of a run are written as INIT records, so the replay needs
+nothing but the journal, and since it only adds and removes contigs
+(no sampling, rates or dcj) it is much faster than the simulation.
+
+Records are fixed size and written in chunks of chunkSize records,
+each compressed with zlib.  A file is the magic string followed by
+chunks, each of which is a header of (compressed length, number of
+records) and the compressed records.
+
+"""
+
+# event types
+INIT = 0
+LL = 1
+GAIN = 2
+LOSS = 3
+LD = 4
+DD = 5
+
+MAGIC = "CSJ1"
+
+# time, type, forward, offset1, offset2, number in, number out, then
+# (size, flags) of two inputs and two outputs.  flags is
+# 1 for linear + 2 for dead
+RECORD = struct.Struct("<dBBqqBB" + "qB" * 4)
+CHUNK = struct.Struct("<II")
+
+def contigFlags(contig):
+    return int(contig.isLinear()) + 2 * int(contig.isDead())
+
+##################################################################
+# writes records to a journal file.  only the Model should need to
+# call write()
+##################################################################
+class JournalWriter(object):
+    def __init__(self, path, chunkSize=65536, level=6):
+        self.path = path
+        self.chunkSize = chunkSize
+        self.level = level
+        self.buffer = []
+        self.count = 0
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+
+    # write an event given the lists of contigs it consumed and produced
+    def write(self, time, eventType, offset1, offset2, forward, inputs,
+              outputs):
+        assert len(inputs) <= 2 and len(outputs) <= 2
+        fields = [time, eventType, int(forward), int(offset1), int(offset2),
+                  len(inputs), len(outputs)]
+        for contigs in (inputs, outputs):
+            for i in xrange(2):
+                if i < len(contigs):
+                    fields += [int(contigs[i].size), contigFlags(contigs[i])]
+                else:
+                    fields += [0, 0]
+        self.buffer.append(RECORD.pack(*fields))
+        self.count += 1
+        if len(self.buffer) >= self.chunkSize:
+            self.flush()
+
+    # write the contigs of a pool as INIT records
+    def writePool(self, time, pool):
+        for contig in pool.dataElements():
+            self.write(time, INIT, 0, 0, False, [], [contig])
+
+    def flush(self):
+        if len(self.buffer) == 0:
+            return
+        data = zlib.compress("".join(self.buffer), self.level)
+        self.file.write(CHUNK.pack(len(data), len(self.buffer)))
+        self.file.write(data)
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+##################################################################
+# iterate through the records of a journal file as tuples of
+# (time, type, forward, offset1, offset2, inputs, outputs) where
+# inputs and outputs are lists of (size, linear, dead) tuples
+##################################################################
+def readJournal(path):
+    journalFile = open(path, "rb")
+    assert journalFile.read(len(MAGIC)) == MAGIC
+    while True:
+        header = journalFile.read(CHUNK.size)
+        if len(header) < CHUNK.size:
+            break
+        length, count = CHUNK.unpack(header)
+        data = zlib.decompress(journalFile.read(length))
+        assert len(data) == count * RECORD.size
+        for i in xrange(count):
+            f = RECORD.unpack_from(data, i * RECORD.size)
+            inputs = [(f[7 + 2 * j], f[8 + 2 * j] & 1 == 1,
+                       f[8 + 2 * j] & 2 == 2) for j in xrange(f[5])]
+            outputs = [(f[11 + 2 * j], f[12 + 2 * j] & 1 == 1,
+                        f[12 + 2 * j] & 2 == 2) for j in xrange(f[6])]
+            yield (f[0], f[1], f[2] == 1, f[3], f[4], inputs, outputs)
+    journalFile.close()
+
+##################################################################
+# rebuild pool states from a journal.  the state is a dictionary
+# mapping (size, linear, dead) to number of contigs.  an INIT record
+# coming after events starts a new run (the state is cleared)
+##################################################################
+class Replay(object):
+    def __init__(self, path):
+        self.path = path
+
+    # the state after every event with time <= t of the first run
+    # of the journal
+    def stateAt(self, t):
+        for time, state in self.states([t]):
+            return state
+
+    ##################################################################
+    # iterate over (time, state) for the given times (in increasing
+    # order) of the first run of the journal.  the states are copies
+    ##################################################################
+    def states(self, times):
+        times = sorted(times)
+        state = defaultdict(int)
+        i = 0
+        started = False
+        for record in readJournal(self.path):
+            if record[1] == INIT and started:
+                break
+            started = started or record[1] != INIT
+            while i < len(times) and record[0] > times[i]:
+                yield (times[i], self.__copy(state))
+                i += 1
+            if i == len(times):
+                return
+            applyRecord(state, record)
+        while i < len(times):
+            yield (times[i], self.__copy(state))
+            i += 1
+
+    # the histogram dictionary (in the format made by Experiment)
+    # of the state at time t
+    def histograms(self, t, binSize = 1, scheme = None):
+        return stateHistograms(self.stateAt(t), binSize, scheme)
+
+    def __copy(self, state):
+        return dict((k, v) for k, v in state.items() if v != 0)
+
+# remove a record's inputs from a state and add its outputs
+def applyRecord(state, record):
+    for contig in record[5]:
+        state[contig] -= 1
+        assert state[contig] >= 0
+    for contig in record[6]:
+        state[contig] += 1
+
+# number of bases (the pool weight) of a (size, linear, dead) contig
+def stateWeight(contig):
+    if contig[1]:
+        return max(contig[0] - 1, 0)
+    return max(contig[0], 0)
+
+def stateHistograms(state, binSize = 1, scheme = None):
+    if scheme is None:
+        scheme = BinScheme(binSize)
+    checks = {"overall" : lambda l, d : True,
+              "dead" : lambda l, d : d,
+              "alive" : lambda l, d : not d,
+              "aliveLinear" : lambda l, d : not d and l,
+              "aliveCircular" : lambda l, d : not d and not l,
+              "deadLinear" : lambda l, d : d and l,
+              "deadCircular" : lambda l, d : d and not l}
+    res = dict()
+    for name, check in checks.items():
+        hist = Histogram(scheme)
+        for contig, count in state.items():
+            if count > 0 and check(contig[1], contig[2]):
+                hist.add(int(stateWeight(contig)), count)
+        res[name] = hist
+    return res
@@ -0,0 +1,356 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey
+#
+#Released under the MIT license, see LICENSE.txt
+
+import os
+import sys
+import math
+from collections import defaultdict
+import numpy as np
+
+from ensemble import startingContigs
+from histogram import BinScheme
+from histogram import Histogram
+from histogram import mergeHistograms
+
+""" Deterministic (mean-field) version of the Model.  Instead of drawing
+events, we integrate the expected rate of change of the number of live
+linear and circular contigs in each size bin, along with the expected size
+of the dead contig and the probability that it is linear.  The rates are
+those of the events of Model (and the sizes those of dcj.py), taken in the
+continuum limit where contigs are much bigger than one base:
+
+LIVE-LIVE on one contig: half of the time a circle is cut out (reverse dcj)
+  leaving, for a linear contig, a linear remainder.  The other half changes
+  nothing.
+LIVE-LIVE on two contigs: two linears exchange uniformly chosen ends, a
+  linear and a circle make a linear and two circles make a circle.
+fg / fl: same-edge and telomere-telomere events, which are O(1/N).
+LIVE-DEAD: the dead contig absorbs the live one, unless both are linear in
+  which case they exchange ends and the dead flag goes to a result in
+  proportion to its size.
+DEAD-DEAD: with probability pgain a circle is cut out of the dead contig,
+  and one of the two results (by size) stays dead.
+
+The state is integrated with fixed-step RK4 on a grid of bins.  Results are
+expected counts, in the same histogram categories that Experiment makes.
+
+"""
+class MeanFieldModel(object):
+    def __init__(self, binSize=None, maxBins=500, steps=100):
+        self.binSize = binSize
+        self.maxBins = maxBins
+        self.steps = steps
+        self.time = 0
+
+    ##################################################################
+    # same parameters as Model.setParameters
+    ##################################################################
+    def setParameters(self, N, rll, rld = 0, rdd = 0, fl = 0, fg = 0,
+                      pgain = 0):
+        self.N = N
+        self.rll = N * max(rll, 0)
+        self.rld = N * max(rld, 0)
+        self.rdd = N * max(rdd, 0)
+        self.fl = fl
+        self.fg = fg
+        self.pgain = pgain
+
+        width = 1
+        if self.binSize is not None:
+            width = int(self.binSize)
+        self.width = max(width, int(math.ceil(float(N) / self.maxBins)))
+        self.numBins = int(N / self.width) + 1
+        # contigs are kept on the grid points j * width.  a size between
+        # two points is split between them so that its mean is kept
+        self.grid = np.arange(self.numBins) * float(self.width)
+
+        # fragment distributions of a contig at point i over points j.
+        # uniform point, remainder of a cut-out (density 2r/x^2) and
+        # the cut-out itself (density 2(x-g)/x^2)
+        x = self.grid
+        self.uniform = self.__distribution(uniformIntegral, x)
+        self.remainder = self.__distribution(remainderIntegral, x)
+        self.cutOut = self.__distribution(cutOutIntegral, x)
+
+    ##################################################################
+    # same starting state as Model.setStartingState
+    ##################################################################
+    def setStartingState(self, garbageSize, numLinear, numCircular):
+        sizes, linear, dead = startingContigs(self.N, garbageSize, numLinear,
+                                              numCircular)
+        self.linear = np.zeros(self.numBins)
+        self.circular = np.zeros(self.numBins)
+        self.deadWeight = 0.
+        self.deadLinear = 0.
+        for size, lin, isDead in zip(sizes, linear, dead):
+            weight = size - 1 if lin else size
+            if isDead:
+                self.deadWeight = float(weight)
+                self.deadLinear = 1. if lin else 0.
+            elif lin:
+                self.linear += self.__place(weight)
+            else:
+                self.circular += self.__place(weight)
+        self.hasDead = garbageSize > 0
+        self.time = 0
+
+    ##################################################################
+    # integrate the rate equations up to the specified time
+    ##################################################################
+    def simulate(self, time):
+        self.__integrate(time - self.time)
+        self.time = time
+
+    ##################################################################
+    # the expected histograms at each of the given (increasing) times
+    ##################################################################
+    def trajectory(self, times, binSize = 1, scheme = None):
+        results = []
+        for time in times:
+            self.simulate(time)
+            results.append(self.histograms(binSize, scheme))
+        return results
+
+    ##################################################################
+    # the histogram dictionary (in the format made by Experiment) of
+    # expected counts per bin of scheme (or linear bins of binSize if
+    # it is None)
+    ##################################################################
+    def histograms(self, binSize = 1, scheme = None):
+        if scheme is None:
+            scheme = BinScheme(binSize)
+        bins = scheme.binIndices(self.grid)
+        res = dict()
+        res["aliveLinear"] = self.__table(bins, self.linear, scheme)
+        res["aliveCircular"] = self.__table(bins, self.circular, scheme)
+        res["deadLinear"] = Histogram(scheme)
+        res["deadCircular"] = Histogram(scheme)
+        if self.hasDead:
+            deadBin = scheme.binIndex(int(self.deadWeight))
+            res["deadLinear"].addBin(deadBin, self.deadLinear)
+            res["deadCircular"].addBin(deadBin, 1. - self.deadLinear)
+        res["alive"] = mergeHistograms([res["aliveLinear"],
+                                        res["aliveCircular"]], scheme)
+        res["dead"] = mergeHistograms([res["deadLinear"],
+                                       res["deadCircular"]], scheme)
+        res["overall"] = mergeHistograms([res["alive"], res["dead"]], scheme)
+        return res
+
+    # expected number of contigs in the pool
+    def poolSize(self):
+        return self.linear.sum() + self.circular.sum() + self.hasDead
+
+    # expected weight (number of bases) of the pool
+    def poolWeight(self):
+        return (self.linear + self.circular).dot(self.grid) + \
+               self.deadWeight
+
+    # a contig of the given weight split between its two grid points
+    def __place(self, weight):
+        point = np.zeros(self.numBins)
+        j = min(int(weight / self.width), self.numBins - 1)
+        frac = min(float(weight) / self.width - j, 1.0)
+        if j + 1 < self.numBins:
+            point[j] = 1.0 - frac
+            point[j + 1] = frac
+        else:
+            point[j] = 1.0
+        return point
+
+    # distributions over the grid of the sizes drawn from contigs of
+    # the given weights, where integral(y, x) is the integral of the
+    # cumulative distribution from 0 to y.  each size is split between
+    # its two neighbouring grid points, which keeps the mean exact
+    def __distribution(self, integral, x, total = 1.0):
+        x = np.maximum(np.asarray(x, dtype=float), 1e-9)[:, None]
+        h = float(self.width)
+        y = self.grid[None, :]
+        dist = (integral(y + h, x) - 2 * integral(y, x) +
+                integral(y - h, x)) / h
+        # the last point also takes anything beyond the grid
+        dist[:, -1] = total - dist[:, :-1].sum(axis=1)
+        return dist
+
+    def __table(self, bins, counts, scheme):
+        table = Histogram(scheme)
+        for i in np.flatnonzero(counts > 1e-12):
+            table.addBin(int(bins[i]), counts[i])
+        return table
+
+    ##################################################################
+    # RK4 over the packed state.  a contig of weight x is hit at rate at
+    # most 2 x / W times the total event rate, so the step is kept below
+    # the stability limit of the biggest occupied point (and at least
+    # self.steps steps are taken)
+    ##################################################################
+    def __integrate(self, duration):
+        if duration <= 0:
+            return
+        n = self.numBins
+        y = np.concatenate((self.linear, self.circular,
+                            [self.deadWeight, self.deadLinear]))
+        totalRate = self.rll + self.rld + self.rdd
+        elapsed = 0.
+        while elapsed < duration:
+            dt = float(duration) / self.steps
+            occupied = np.flatnonzero(y[:n] + y[n:2 * n] > 1e-12)
+            weight = (y[:n] + y[n:2 * n]).dot(self.grid) + y[2 * n]
+            if len(occupied) > 0 and weight > 0:
+                biggest = max(self.grid[occupied[-1]], y[2 * n])
+                fastest = 2.0 * totalRate * biggest / weight
+                if fastest > 0:
+                    dt = min(dt, 2.0 / fastest)
+            dt = min(dt, duration - elapsed)
+            k1 = self.__rates(y)
+            k2 = self.__rates(y + 0.5 * dt * k1)
+            k3 = self.__rates(y + 0.5 * dt * k2)
+            k4 = self.__rates(y + dt * k3)
+            y = y + dt / 6.0 * (k1 + 2 * k2 + 2 * k3 + k4)
+            y[:2 * n] = np.maximum(y[:2 * n], 0)
+            y[2 * n] = max(y[2 * n], 0)
+            y[2 * n + 1] = min(max(y[2 * n + 1], 0), 1)
+            elapsed += dt
+        self.linear = y[:n]
+        self.circular = y[n:2 * n]
+        self.deadWeight = y[2 * n]
+        self.deadLinear = y[2 * n + 1]
+
+    # sum of independent sizes from distributions p and q over the grid
+    def __convolve(self, p, q):
+        c = np.convolve(p, q)
+        c[self.numBins - 1] += c[self.numBins:].sum()
+        return c[:self.numBins]
+
+    # distributions over the grid of the size of the live result when
+    # a linear at each point exchanges uniform ends with a dead linear
+    # of weight d (the dead flag going to a result by its size)
+    def __swapDistribution(self, d):
+        a = np.minimum(self.grid, d)[:, None]
+        b = np.maximum(np.maximum(self.grid, d), 1e-9)[:, None]
+        a = np.maximum(a, 1e-9)
+        total = a + b
+        y = self.grid[None, :]
+        density = np.where(y < a, y / (a * b),
+                           np.where(y < b, 1.0 / b, (total - y) / (a * b)))
+        density = np.maximum(density, 0) * np.maximum(total - y, 0) / total
+        norm = density.sum(axis=1)[:, None]
+        return density / np.where(norm > 0, norm, 1)
+
+    ##################################################################
+    # expected rate of change of the packed state
+    ##################################################################
+    def __rates(self, y):
+        n = self.numBins
+        x = self.grid
+        L = y[:n]
+        C = y[n:2 * n]
+        D = y[2 * n] if self.hasDead else 0.
+        qL = y[2 * n + 1]
+        mL = L.dot(x)
+        mC = C.dot(x)
+        W = mL + mC + D
+        dL = np.zeros(n)
+        dC = np.zeros(n)
+        dD = 0.
+        dq = 0.
+        if W <= 0:
+            return np.zeros(len(y))
+        W2 = W * W
+
+        if self.rll > 0:
+            lam = self.rll / W2
+            # both breaks on one contig, reverse dcj cuts out a circle
+            rateL = 0.5 * lam * x * x * L
+            rateC = 0.5 * lam * x * x * C
+            dL += -rateL + rateL.dot(self.remainder)
+            dC += rateL.dot(self.cutOut)
+            dC += -rateC + 2 * rateC.dot(self.uniform)
+            # linear-linear exchange uniform ends: two linears whose
+            # sizes are each the sum of two uniform pieces
+            g = (L * x).dot(self.uniform)
+            dL += -2 * lam * x * L * mL + 2 * lam * self.__convolve(g, g)
+            # linear-circular make a linear, circular-circular a circular
+            dL += -2 * lam * x * L * mC + \
+                  2 * lam * self.__convolve(L * x, C * x)
+            dC += -2 * lam * x * C * mL
+            dC += -2 * lam * x * C * mC + lam * self.__convolve(C * x, C * x)
+            # fg: same edge breaks a linear in two or opens a circle
+            gainL = self.fg * lam * x * L
+            gainC = self.fg * lam * x * C
+            dL += -gainL + 2 * gainL.dot(self.uniform) + gainC
+            dC += -gainC
+            # fl: telomere-telomere fuses two linears or closes one
+            nL = L.sum()
+            dL += -self.fl * lam * L * nL + \
+                  0.5 * self.fl * lam * self.__convolve(L, L)
+            dL += -self.fl * lam * L / 8.0
+            dC += self.fl * lam * L / 8.0
+
+        if self.rld > 0 and D > 0:
+            rate = 2 * self.rld * x * D / W2
+            # circular is absorbed by the dead contig
+            dC += -rate * C
+            dD += (rate * C).dot(x)
+            # linear is absorbed by a dead circular (which linearizes)
+            absorbed = rate * L * (1 - qL)
+            dL += -absorbed
+            dD += absorbed.dot(x)
+            dq += absorbed.sum()
+            # linear exchanges ends with a dead linear
+            swapped = rate * L * qL
+            swap = self.__swapDistribution(D)
+            dL += -swapped + swapped.dot(swap)
+            dD += swapped.dot(x) - swapped.dot(swap.dot(x))
+
+        if self.rdd > 0 and D > 0:
+            rate = self.pgain * self.rdd * D * D / W2
+            # dead circular: the live circle has density 2(D-y)/D^2
+            live = self.__distribution(cutOutIntegral, [D])[0]
+            dC += rate * (1 - qL) * live
+            # dead linear: the live result is the circle (density
+            # 2(D-y)^2/D^3) or the linear remainder (2y(D-y)/D^3)
+            liveC = self.__distribution(deadCircleIntegral, [D], 2.0 / 3)[0]
+            liveL = self.__distribution(deadLinearIntegral, [D], 1.0 / 3)[0]
+            dC += rate * qL * liveC
+            dL += rate * qL * liveL
+            dq += -rate * qL * liveL.sum()
+            dD += -rate * ((1 - qL) * live + qL * (liveC + liveL)).dot(x)
+
+        return np.concatenate((dL, dC, [dD, dq]))
+
+##################################################################
+# integrals from 0 to y of the cumulative distributions of the sizes
+# made from a contig of weight x (see the density of each)
+##################################################################
+
+# uniform on [0, x]
+def uniformIntegral(y, x):
+    y = np.maximum(y, 0)
+    return np.where(y <= x, y * y / (2 * x), x / 2.0 + (y - x))
+
+# density 2y/x^2
+def remainderIntegral(y, x):
+    y = np.maximum(y, 0)
+    return np.where(y <= x, y ** 3 / (3 * x * x), x / 3.0 + (y - x))
+
+# density 2(x-y)/x^2
+def cutOutIntegral(y, x):
+    y = np.maximum(y, 0)
+    r = 1.0 - np.minimum(y, x) / x
+    return np.where(y <= x, y - x / 3.0 * (1 - r ** 3), y - x / 3.0)
+
+# density 2(x-y)^2/x^3 (total probability 2/3)
+def deadCircleIntegral(y, x):
+    y = np.maximum(y, 0)
+    r = 1.0 - np.minimum(y, x) / x
+    return np.where(y <= x, 2.0 / 3.0 * (y - x / 4.0 * (1 - r ** 4)),
+                    2.0 / 3.0 * (y - x / 4.0))
+
+# density 2y(x-y)/x^3 (total probability 1/3)
+def deadLinearIntegral(y, x):
+    y = np.maximum(y, 0)
+    return np.where(y <= x, y ** 3 / (3 * x * x) - y ** 4 / (6 * x ** 3),
+                    x / 6.0 + (y - x) / 3.0)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey
+#
+#Released under the MIT license, see LICENSE.txt
+
+import os
+import sys
+import math
+import time
+from collections import defaultdict
+
+""" Optional instrumentation for the simulation.  A Metrics object is
+handed to the Model (which passes it on to its SampleTree and
+EventQueue), and each of them records into it only if it has one, so a
+run without metrics only pays for an "is not None" check on the hot path.
+
+Three kinds of measurements are kept: counters (number of times
+something happened), timers (total wall time along with a histogram of
+the times, in power-of-two buckets of nanoseconds) and histograms of
+integer values (such as the depth of SampleTree descents).
+
+"""
+class Metrics(object):
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.timers = defaultdict(lambda : [0, 0., defaultdict(int)])
+        self.histograms = defaultdict(lambda : defaultdict(int))
+        self.events = 0
+        self.elapsed = 0.
+
+    # add n to a counter
+    def count(self, name, n = 1):
+        self.counters[name] += n
+
+    # add a wall time (in seconds) to a timer
+    def addTime(self, name, seconds):
+        timer = self.timers[name]
+        timer[0] += 1
+        timer[1] += seconds
+        timer[2][timeBucket(seconds)] += 1
+
+    # add an integer value to a histogram
+    def addValue(self, name, value):
+        self.histograms[name][value] += 1
+
+    # add a number of events done in the given wall time (in seconds)
+    def addRun(self, events, seconds):
+        self.events += events
+        self.elapsed += seconds
+
+    def eventsPerSecond(self):
+        if self.elapsed <= 0:
+            return 0.
+        return self.events / self.elapsed
+
+    # add all the measurements of another Metrics object to this one
+    def merge(self, other):
+        for name, value in other.counters.items():
+            self.counters[name] += value
+        for name, (count, total, hist) in other.timers.items():
+            timer = self.timers[name]
+            timer[0] += count
+            timer[1] += total
+            for bucket, value in hist.items():
+                timer[2][bucket] += value
+        for name, hist in other.histograms.items():
+            for key, value in hist.items():
+                self.histograms[name][key] += value
+        self.addRun(other.events, other.elapsed)
+
+    ##################################################################
+    # everything in a dictionary of plain types (for json).  timer
+    # histograms are keyed on the lower bound of their buckets in
+    # nanoseconds
+    ##################################################################
+    def toDict(self):
+        timers = dict()
+        for name, (count, total, hist) in self.timers.items():
+            mean = 0.
+            if count > 0:
+                mean = total / count
+            timers[name] = {"count" : count, "total" : total, "mean" : mean,
+                            "histogram" : dict((str(2 ** b), v) for b, v in
+                                               hist.items())}
+        histograms = dict()
+        for name, hist in self.histograms.items():
+            histograms[name] = dict((str(k), v) for k, v in hist.items())
+        return {"counters" : dict(self.counters),
+                "timers" : timers,
+                "histograms" : histograms,
+                "events" : self.events,
+                "elapsed" : self.elapsed,
+                "eventsPerSecond" : self.eventsPerSecond()}
+
+# power-of-two bucket (of nanoseconds) of a time given in seconds
+def timeBucket(seconds):
+    ns = int(seconds * 1e9)
+    if ns < 1:
+        return 0
+    return int(math.log(ns, 2))
@@ -9,23 +9,140 @@ import sys
 import copy
 import random
 import math
+import gc
 from heapq import heappush, heappop
+from time import time as wallTime
 
 from contig import CircularContig
 from contig import LinearContig
 from contig import Contig
+from contig import ContigPool
 from dcj import dcj
 from eventQueue import EventQueue
 from sampleTree import SampleTree
+from sampleTree import tuneDegree
+from metrics import Metrics
+import journal
 
 
 # simple rearrangment model with a pool of contigs (circular and linear)
-# and a circular garbage contig
+# and a circular garbage contig.  the pool can be any class with the
+# interface of SampleTree (such as BucketSampler)
+#
+# if tuneEvents > 0 (and the pool is a SampleTree), the costs of
+# sampling and updating the pool are measured after the first tuneEvents
+# events of simulate() and the pool is rebuilt with the cheapest degree.
+# the choice is stored in self.metadata
+#
+# the number of events simulate() ran (those popped from the event
+# queue, so not the null LIVE-LIVE events skipped by thinning) is
+# stored in self.metadata["events"]
+#
+# after enableMetrics(), the outcome (including rejections) and wall time
+# of every event, and the pool and event queue operations, are recorded
+# in self.metrics and copied to self.metadata["metrics"] by simulate()
+#
+# after setJournal(), the starting pool and every accepted event of
+# simulate() are written to the given JournalWriter (see journal.py)
+#
+# the contigs consumed by events are given back to a ContigPool, from
+# which dcj makes new ones, and the pool keeps its removed nodes, so a
+# long simulation allocates very little.  reset() empties the model for
+# another replicate while keeping all of these for reuse.  the number
+# of nodes and contigs allocated by a run (setStartingState() and
+# simulate()) is stored in self.metadata["allocations"].  if pauseGC is True, the cyclic garbage
+# collector is disabled while simulate() runs (the model makes no cycles
+# that need it)
+#
+# if thinning is True, the LIVE-LIVE events that wouldn't change the pool
+# (samples on dead contigs, rejected gains and losses) are skipped: the
+# event queue runs them at the rate of the effective ones only (see
+# llEffective()), which gives the same dynamics with fewer events
 class Model(object):
-    def __init__(self):
-        self.pool = SampleTree()
+    def __init__(self, poolType=SampleTree, tuneEvents=0,
+                 tuneDegrees=(2, 3, 4, 6, 8, 16), pauseGC=False,
+                 thinning=False):
+        self.poolType = poolType
+        self.pool = poolType()
+        self.contigPool = ContigPool()
+        self.pauseGC = pauseGC
+        self.thinning = thinning
+        self.llRate = 0
+        # weight of the live contigs in the pool and number of the live
+        # linear ones with at least one base (for llEffective())
+        self.liveWeight = 0
+        self.liveLinear = 0
+        self.allocationStart = (self.pool.allocations(),
+                                self.contigPool.counts())
         self.eventQueue = EventQueue()
+        self.tuneEvents = tuneEvents
+        self.tuneDegrees = tuneDegrees
+        self.metadata = dict()
+        self.metrics = None
+        self.journal = None
+        self.eventNames = dict()
+        self.__resetCounts()
+
+    # write the simulation to a JournalWriter (None to stop)
+    def setJournal(self, journalWriter):
+        self.journal = journalWriter
+
+    # start recording into the given Metrics object (a new one if None)
+    def enableMetrics(self, metrics = None):
+        if metrics is None:
+            metrics = Metrics()
+        self.metrics = metrics
+        self.pool.metrics = metrics
+        self.eventQueue.metrics = metrics
+        return metrics
+
+    ##################################################################
+    # get ready to run another replicate: the pool is emptied (keeping
+    # its nodes and contigs for reuse) and the counters, metadata and
+    # journal are cleared (and metrics, if enabled, start over).  the
+    # parameters are kept, so setStartingState() and simulate() are all
+    # that's needed for the next run
+    ##################################################################
+    def reset(self):
+        self.__clearPool()
         self.__resetCounts()
+        self.metadata = dict()
+        self.journal = None
+        if self.metrics is not None:
+            self.enableMetrics()
+
+    # empty the pool, giving its contigs back to the contig pool
+    def __clearPool(self):
+        for contig in self.pool.dataElements():
+            self.contigPool.release(contig)
+        self.pool.clear()
+        self.liveWeight = 0
+        self.liveLinear = 0
+
+    # insert a contig in the pool, keeping track of the live totals
+    def __insert(self, contig):
+        bases = contig.numBases()
+        self.pool.insert(contig, bases)
+        if not contig.isDead():
+            self.liveWeight += bases
+            if bases > 0 and contig.isLinear():
+                self.liveLinear += 1
+
+    # remove a node (and its contig) from the pool
+    def __remove(self, node):
+        contig = node.data
+        if not contig.isDead():
+            bases = contig.numBases()
+            self.liveWeight -= bases
+            if bases > 0 and contig.isLinear():
+                self.liveLinear -= 1
+        self.pool.remove(node)
+
+    # give the contigs consumed by an event back to the contig pool
+    def __releaseContigs(self, c1, c2):
+        self.contigPool.release(c1)
+        if c2 is not c1:
+            self.contigPool.release(c2)
 
     ##################################################################
     # there are five kinds of rates:
@@ -45,7 +162,10 @@ class Model(object):
         self.fl = fl
         self.fg = fg
         self.pgain = pgain
+        self.llRate = N * rll if rll > 0 else 0
 
+        self.eventNames = {self.__llEvent : "ll", self.__ldEvent : "ld",
+                           self.__ddEvent : "dd"}
         if rll > 0:
             self.eventQueue.addEventType(N * rll, self.__llEvent)
         if rld > 0:
@@ -60,13 +180,16 @@ class Model(object):
     ##################################################################
     def setStartingState(self, garbageSize, numLinear, numCircular):
         assert self.N > garbageSize + numLinear + numCircular
-        self.pool = SampleTree()
+        self.__clearPool()
+        self.pool.metrics = self.metrics
+        self.allocationStart = (self.pool.allocations(),
+                                self.contigPool.counts())
 
         numGarbage = 0
         if garbageSize > 0:
-            garbage = CircularContig(garbageSize)
+            garbage = self.contigPool.make(CircularContig, garbageSize)
             garbage.setDead()
-            self.pool.insert(garbage, garbage.numBases())
+            self.__insert(garbage)
             numGarbage = 1
         
         lrat = float(numLinear) / (numLinear + numCircular)
@@ -84,8 +207,8 @@ class Model(object):
                 if i < extra:
                     size += 1
                 # plus 1 since number of adjacencies is 1 + number of bases
-                contig = LinearContig(size + 1)
-                self.pool.insert(contig, contig.numBases())
+                contig = self.contigPool.make(LinearContig, size + 1)
+                self.__insert(contig)
                 added += contig.size
             assert added == linearBases + numLinear
             assert self.pool.size() == numLinear + numGarbage
@@ -99,8 +222,8 @@ class Model(object):
                 size = circSize
                 if i < extra:
                     size += 1
-                contig = CircularContig(size)
-                self.pool.insert(contig, contig.numBases())
+                contig = self.contigPool.make(CircularContig, size)
+                self.__insert(contig)
                 added += contig.size
             assert added == circularBases
             assert self.pool.size() == numLinear + numCircular + numGarbage
@@ -108,26 +231,138 @@ class Model(object):
             garbageSize
 
     ##################################################################
-    # run the simulation for the specified time
+    # run the simulation for the specified time.  with resume, carry on
+    # a run that was stopped at an earlier time, up to this one
     ##################################################################
-    def simulate(self, time):
-        self.eventQueue.begin()
-        self.__resetCounts()
-        while True:
-            nextEvent = self.eventQueue.next(time)
-            if nextEvent is not None:
-                nextEvent()
-            else:
-                break
+    def simulate(self, time, resume=False):
+        # with thinning, the LIVE-LIVE rate follows the fraction of
+        # effective events, which is updated after every event
+        thin = self.thinning and self.llRate > 0
+        if self.llRate > 0:
+            llProb = self.llEffective() if thin else 1.
+            self.eventQueue.setRate(self.__llEvent, self.llRate * llProb)
+        # a resumed run carries on from where the last one stopped
+        # (keeping its counters)
+        if resume:
+            self.eventQueue.begin(self.eventQueue.time)
+        else:
+            self.eventQueue.begin()
+            self.__resetCounts()
+        tune = self.tuneEvents > 0 and isinstance(self.pool, SampleTree) \
+               and not resume
+        if tune:
+            self.pool.sampleCount = 0
+            self.pool.updateCount = 0
+        if self.journal is not None and not resume:
+            self.journal.writePool(0, self.pool)
+        events = 0
+        metrics = self.metrics
+        pauseGC = self.pauseGC and gc.isenabled()
+        if pauseGC:
+            gc.disable()
+        start = wallTime()
+        try:
+            while True:
+                nextEvent = self.eventQueue.next(time)
+                if nextEvent is not None:
+                    if metrics is None:
+                        nextEvent()
+                    else:
+                        eventStart = wallTime()
+                        nextEvent()
+                        metrics.addTime(self.eventNames[nextEvent],
+                                        wallTime() - eventStart)
+                    events += 1
+                    if thin:
+                        p = self.llEffective()
+                        if p != llProb:
+                            llProb = p
+                            self.eventQueue.setRate(self.__llEvent,
+                                                    self.llRate * p)
+                    if tune and events == self.tuneEvents:
+                        self.__tunePool()
+                else:
+                    break
+        finally:
+            if pauseGC:
+                gc.enable()
+        self.metadata["allocations"] = self.__allocations()
+        if resume:
+            events += self.metadata.get("events", 0)
+        self.metadata["events"] = events
+        if metrics is not None:
+            metrics.addRun(events, wallTime() - start)
+            self.metadata["metrics"] = metrics.toDict()
+
+    # number of nodes and contigs allocated and reused since the run
+    # started
+    def __allocations(self):
+        nodes, contigs = self.allocationStart
+        nodesNow = self.pool.allocations()
+        contigsNow = self.contigPool.counts()
+        return {"nodesAllocated" : nodesNow["allocated"] - nodes["allocated"],
+                "nodesReused" : nodesNow["reused"] - nodes["reused"],
+                "contigsAllocated" : contigsNow["allocated"] -
+                contigs["allocated"],
+                "contigsReused" : contigsNow["reused"] - contigs["reused"]}
+
+    ##################################################################
+    # rebuild the pool with the degree that is cheapest for the mix of
+    # samples and updates seen so far
+    ##################################################################
+    def __tunePool(self):
+        degree, tuning = tuneDegree(self.pool, self.tuneDegrees)
+        tuning["events"] = self.tuneEvents
+        self.metadata["tuning"] = tuning
+        self.metadata["degree"] = degree
+        if degree != self.pool.degree:
+            # the new tree carries on with the old one's free nodes
+            # and allocation counts
+            pool = SampleTree(degree)
+            pool.freeNodes = self.pool.freeNodes
+            pool.allocCount = self.pool.allocCount
+            pool.reuseCount = self.pool.reuseCount
+            for data, weight in self.pool.snapshot():
+                pool.insert(data, weight)
+            pool.metrics = self.metrics
+            self.pool = pool
+
+    # write an accepted event on contigs c1 and c2 to the journal
+    def __record(self, eventType, c1, offset1, c2, offset2, forward,
+                 dcjResult):
+        inputs = [c1]
+        if c2 is not c1:
+            inputs.append(c2)
+        self.journal.write(self.eventQueue.time, eventType, offset1, offset2,
+                           forward, inputs, dcjResult)
 
     ##################################################################
     # draw (and remove) two random adajcenies and their
     # contigs from the pool (only if they are not dead)
     ##################################################################
     def __drawSamples(self):
-        sampleNode1, offset1 = self.pool.uniformSample()
-        sampleNode2, offset2 = self.pool.uniformSample()
+        (sampleNode1, offset1), (sampleNode2, offset2) = \
+                                self.pool.uniformSampleMany(2)
+        return self.__edgeSamples(sampleNode1, offset1, sampleNode2, offset2)
 
+    ##################################################################
+    # as __drawSamples, but both samples are on live contigs: a sample
+    # on a dead contig is redrawn on its own (the two are independent,
+    # so this is the same as redrawing the pair until both are live),
+    # and the descents of the other sample aren't repeated
+    ##################################################################
+    def __drawLiveSamples(self):
+        samples = self.pool.uniformSampleMany(2)
+        for i in xrange(2):
+            while samples[i][0].data.isDead():
+                if self.metrics is not None:
+                    self.metrics.count("ll.deadRedrawn")
+                samples[i] = self.pool.uniformSample()
+        (sampleNode1, offset1), (sampleNode2, offset2) = samples
+        return self.__edgeSamples(sampleNode1, offset1, sampleNode2, offset2)
+
+    # the samples of base offsets as samples of edges
+    def __edgeSamples(self, sampleNode1, offset1, sampleNode2, offset2):
         # the offset is weighted based on the number of bases
         # we want to translate this into number of edges (splitting)
         # the probability between linear and telomere edges.
@@ -154,7 +389,11 @@ class Model(object):
     #modifiy the number of telomeres
     ##################################################################
     def __llEvent(self):
+        if self.thinning:
+            return self.__llEventThinned()
         if self.pool.size() == 0 or self.pool.weight() == 1:
+            if self.metrics is not None:
+                self.metrics.count("ll.empty")
             return
         
         # draw (and remove) two random adajcenies and their
@@ -165,11 +404,13 @@ class Model(object):
 
         # don't deal with dead contigs in this event
         if c1.isDead() == True or c2.isDead() == True:
+            if self.metrics is not None:
+                self.metrics.count("ll.dead")
             return
 
-        self.pool.remove(sampleNode1)
+        self.__remove(sampleNode1)
         if c1 is not c2:
-            self.pool.remove(sampleNode2)
+            self.__remove(sampleNode2)
 
         # case 1) gain of telomere
         if sampleNode1 is sampleNode2 and offset1 == offset2:
@@ -177,72 +418,180 @@ class Model(object):
             
           
         # case 2) loss of telomere
-        elif c1.isLinear() and c2.isLinear() and \
-                 (offset1 == 0 or offset1 == c1.size - 1) and \
-                 (offset2 == 0 or offset2 == c2.size - 1):
+        elif self.__isLoss(c1, offset1, c2, offset2):
             return self.__llLoss(c1, c2, offset1, offset2)
 
         # case 3) no gain or loss
+        self.__llNormal(c1, offset1, c2, offset2)
+
+    ##################################################################
+    # LIVE-LIVE event when null events are thinned out.  The event queue
+    # only fires the LIVE-LIVE events that change the pool, at rate
+    # rll * N * llEffective(), so samples are drawn on live contigs
+    # (see __drawLiveSamples) and rejected here until they make such an
+    # event.  This gives the distribution of the first effective event
+    # of the unthinned model, without the event queue and pool updates
+    # of the null ones
+    ##################################################################
+    def __llEventThinned(self):
+        while True:
+            sampleNode1, offset1, sampleNode2, offset2 = \
+                         self.__drawLiveSamples()
+            c1 = sampleNode1.data
+            c2 = sampleNode2.data
+            if sampleNode1 is sampleNode2 and offset1 == offset2:
+                if self.__gainAccepted(c1, offset1):
+                    self.__remove(sampleNode1)
+                    return self.__applyGain(c1, c2, offset1, offset2)
+            elif self.__isLoss(c1, offset1, c2, offset2):
+                if self.__lossAccepted(c1 is c2):
+                    self.__remove(sampleNode1)
+                    if c1 is not c2:
+                        self.__remove(sampleNode2)
+                    return self.__applyLoss(c1, c2, offset1, offset2)
+            else:
+                self.__remove(sampleNode1)
+                if c1 is not c2:
+                    self.__remove(sampleNode2)
+                return self.__llNormal(c1, offset1, c2, offset2)
+            if self.metrics is not None:
+                self.metrics.count("ll.skipped")
+
+    ##################################################################
+    # probability that a LIVE-LIVE event changes the pool.  with W the
+    # pool weight, L the live weight and nL the number of live linear
+    # contigs with at least one base, the (ordered) pairs of samples
+    # on two different live contigs are all effective except those on
+    # telomeres of two linear contigs (accepted with fl / 2), and the
+    # pairs on the same contig are effective unless they are on the
+    # same edge (a gain, accepted with fg unless it's a telomere) or on
+    # its two telomeres (a loss, accepted with fl / 4).  since the
+    # second sample of a contig isn't moved to its right telomere (see
+    # __drawSamples) only one of its two telomere pairs is a loss, so
+    # the sum over contigs doesn't depend on their sizes:
+    # [L^2 - L + fg (L - nL) + fl nL / 8 - (1 - fl / 2) (nL^2 - nL)] / W^2
+    ##################################################################
+    def llEffective(self):
+        weight = float(self.pool.weight())
+        if self.pool.size() == 0 or weight <= 1:
+            return 0.
+        live = float(self.liveWeight)
+        linear = float(self.liveLinear)
+        p = (live * live - live + self.fg * (live - linear) +
+             self.fl * linear / 8. -
+             (1. - self.fl / 2.) * (linear * linear - linear)) / \
+             (weight * weight)
+        return min(max(p, 0.), 1.)
+
+    # are the samples on telomeres of linear contigs (a telomere loss)
+    def __isLoss(self, c1, offset1, c2, offset2):
+        return c1.isLinear() and c2.isLinear() and \
+               (offset1 == 0 or offset1 == c1.size - 1) and \
+               (offset2 == 0 or offset2 == c2.size - 1)
+
+    # the normal dcj of a LIVE-LIVE event (no gain or loss)
+    def __llNormal(self, c1, offset1, c2, offset2):
         self.llCount += 1
+        if self.metrics is not None:
+            self.metrics.count("ll.normal")
         forward = random.randint(0, 1) == 1
 
         # do the dcj
-        dcjResult = dcj(c1, offset1, c2, offset2, forward)
+        dcjResult = dcj(c1, offset1, c2, offset2, forward, self.contigPool)
+        if self.journal is not None:
+            self.__record(journal.LL, c1, offset1, c2, offset2, forward,
+                          dcjResult)
+        self.__releaseContigs(c1, c2)
             
         # add the resulting contigs back to the pool
         for res in dcjResult:
-            self.pool.insert(res, res.numBases())
+            self.__insert(res)
             
     ##################################################################
     # Do the fission telomere gain operation (if fg check passes)
     ##################################################################
     def __llGain(self, c1, c2, offset1, offset2):
-        # correct "not composite check below"
-        if c1.isCircular() or (offset1 != 0 and offset1 != c1.size - 1):
-            forward = self.fg > random.random()
-            if forward:
-                self.fgCount += 1
-                dcjResult = dcj(c1, offset1, c2, offset2, forward)
-                if c1.isCircular():
-                    assert len(dcjResult) == 1 and dcjResult[0].isLinear()
-                else:
-                    assert len(dcjResult) == 2 and dcjResult[0].isLinear() \
-                           and dcjResult[1].isLinear()
-                # add the resulting contigs back to the pool
-                for res in dcjResult:
-                    self.pool.insert(res, res.numBases())
-                return
-
-        self.pool.insert(c1, c1.numBases())
+        if self.__gainAccepted(c1, offset1):
+            return self.__applyGain(c1, c2, offset1, offset2)
+
+        if self.metrics is not None:
+            self.metrics.count("ll.gainRejected")
+        self.__insert(c1)
         if c2 is not c1:
-            self.pool.insert(c2, c2.numBases())
+            self.__insert(c2)
+
+    # does the fg check pass for a gain at offset of c1
+    def __gainAccepted(self, c1, offset1):
+        # correct "not composite check below"
+        return (c1.isCircular() or (offset1 != 0 and offset1 != c1.size - 1))\
+               and self.fg > random.random()
+
+    def __applyGain(self, c1, c2, offset1, offset2):
+        forward = True
+        self.fgCount += 1
+        if self.metrics is not None:
+            self.metrics.count("ll.gain")
+        dcjResult = dcj(c1, offset1, c2, offset2, forward, self.contigPool)
+        if c1.isCircular():
+            assert len(dcjResult) == 1 and dcjResult[0].isLinear()
+        else:
+            assert len(dcjResult) == 2 and dcjResult[0].isLinear() \
+                   and dcjResult[1].isLinear()
+        if self.journal is not None:
+            self.__record(journal.GAIN, c1, offset1, c2, offset2,
+                          forward, dcjResult)
+        self.__releaseContigs(c1, c2)
+        # add the resulting contigs back to the pool
+        for res in dcjResult:
+            self.__insert(res)
                      
     ##################################################################
     # Do the fission telomer loss operation (if fl check passes)
     ##################################################################
     def __llLoss(self, c1, c2, offset1, offset2):
-        if c1 is c2:
-            forward = self.fl / 4.0 > random.random()
-        else:
-            forward = self.fl / 2.0 > random.random()
-        if forward:
-            c1 = c1.circularize()
-            if c1 is not c2:
-                c2 = c2.circularize()
-            dcjResult = dcj(c1, offset1, c2, offset2, forward)
-            self.flCount += 1
-            assert len(dcjResult) == 1
-            if c1 is not c2:
-                assert dcjResult[0].isLinear()
-            else:
-                assert dcjResult[0].isCircular()
-            # add the resulting contigs back to the pool
-            for res in dcjResult:
-                self.pool.insert(res, res.numBases())
+        if self.__lossAccepted(c1 is c2):
+            self.__applyLoss(c1, c2, offset1, offset2)
         else:
-            self.pool.insert(c1, c1.numBases())
+            if self.metrics is not None:
+                self.metrics.count("ll.lossRejected")
+            self.__insert(c1)
             if c2 is not c1:
-                self.pool.insert(c2, c2.numBases())
+                self.__insert(c2)
+
+    # does the fl check pass for a loss (on the same contig or not)
+    def __lossAccepted(self, same):
+        if same:
+            return self.fl / 4.0 > random.random()
+        return self.fl / 2.0 > random.random()
+
+    def __applyLoss(self, c1, c2, offset1, offset2):
+        forward = True
+        same = c1 is c2
+        original1 = c1
+        # only the first contig is closed up (the second stays linear
+        # so that the dcj fuses them into a single linear contig)
+        c1 = c1.circularize(self.contigPool)
+        if same:
+            c2 = c1
+        dcjResult = dcj(c1, offset1, c2, offset2, forward, self.contigPool)
+        self.flCount += 1
+        if self.metrics is not None:
+            self.metrics.count("ll.loss")
+        assert len(dcjResult) == 1
+        if not same:
+            assert dcjResult[0].isLinear()
+        else:
+            assert dcjResult[0].isCircular()
+        if self.journal is not None:
+            self.__record(journal.LOSS, original1, offset1,
+                          original1 if same else c2, offset2, forward,
+                          dcjResult)
+        self.__releaseContigs(original1, c1)
+        if not same:
+            self.contigPool.release(c2)
+        # add the resulting contigs back to the pool
+        for res in dcjResult:
+            self.__insert(res)
 
 
     ##################################################################
@@ -252,6 +601,8 @@ class Model(object):
     ##################################################################
     def __ldEvent(self):
         if self.pool.size() == 0 or self.pool.weight() == 1:
+            if self.metrics is not None:
+                self.metrics.count("ld.empty")
             return
         
         # draw (and remove) two random adajcenies and their
@@ -262,11 +613,13 @@ class Model(object):
 
         # only deal with live / dead contigs in this event
         if (c1.isDead() == c2.isDead()):
+            if self.metrics is not None:
+                self.metrics.count("ld.rejected")
             return
 
-        self.pool.remove(sampleNode1)
+        self.__remove(sampleNode1)
         if c1 is not c2:
-            self.pool.remove(sampleNode2)
+            self.__remove(sampleNode2)
 
         # make sure c1 is alive and c2 is dead
         if c1.isDead():
@@ -274,7 +627,8 @@ class Model(object):
             offset1, offset2 = offset2, offset1
 
         # do the dcj
-        dcjResult = dcj(c1, offset1, c2, offset2, random.randint(0, 1) == 1)
+        forward = random.randint(0, 1) == 1
+        dcjResult = dcj(c1, offset1, c2, offset2, forward, self.contigPool)
 
         deadIdx = 0;
         if len(dcjResult) == 2 and \
@@ -282,18 +636,24 @@ class Model(object):
                dcjResult[0].size:
             deadIdx = 1
         dcjResult[deadIdx].setDead(True)
+        if self.journal is not None:
+            self.__record(journal.LD, c1, offset1, c2, offset2, forward,
+                          dcjResult)
+        self.__releaseContigs(c1, c2)
 
         if len(dcjResult) == 1:
             self.ldLossCount += 1
         else:
             self.ldSwapCount += 1
+        if self.metrics is not None:
+            self.metrics.count("ld.loss" if len(dcjResult) == 1 else "ld.swap")
             
         # add the resulting contigs back to the pool
         deadCount = 0
         for res in dcjResult:
             if res.isDead():
                 deadCount += 1
-            self.pool.insert(res, res.numBases())
+            self.__insert(res)
         assert deadCount == 1
             
     ##################################################################
@@ -303,6 +663,8 @@ class Model(object):
     ##################################################################
     def __ddEvent(self):
         if self.pool.size() == 0 or self.pool.weight() == 1:
+            if self.metrics is not None:
+                self.metrics.count("dd.empty")
             return
         
         sampleNode1, offset1, sampleNode2, offset2 = self.__drawSamples()
@@ -311,6 +673,8 @@ class Model(object):
 
         # only deal with dead / dead contigs in this event
         if (c1.isDead() == False or c2.isDead() == False):
+            if self.metrics is not None:
+                self.metrics.count("dd.rejected")
             return
 
         # only support single dead contig
@@ -318,17 +682,19 @@ class Model(object):
 
         # don't know what to do here
         if (offset1 == offset2):
+            if self.metrics is not None:
+                self.metrics.count("dd.sameOffset")
             return        
 
-        self.pool.remove(sampleNode1)
+        self.__remove(sampleNode1)
         if c1 is not c2:
-            self.pool.remove(sampleNode2)
+            self.__remove(sampleNode2)
 
         #forward means do not cut
         forward = random.random() > self.pgain
 
         # do the dcj
-        dcjResult = dcj(c1, offset1, c2, offset2, forward)
+        dcjResult = dcj(c1, offset1, c2, offset2, forward, self.contigPool)
 
         deadIdx = 0;
         if len(dcjResult) == 2 and \
@@ -337,6 +703,12 @@ class Model(object):
                     deadIdx = 1
         dcjResult[deadIdx].setDead(True)
 
+        if self.journal is not None:
+            self.__record(journal.DD, c1, offset1, c2, offset2, forward,
+                          dcjResult)
+        self.__releaseContigs(c1, c2)
+        if self.metrics is not None:
+            self.metrics.count("dd.swap" if forward else "dd.gain")
         if forward:
             self.ddSwapCount += 1
             assert len(dcjResult) == 1
@@ -347,7 +719,7 @@ class Model(object):
         
          # add the resulting contigs back to the pool
         for res in dcjResult:
-            self.pool.insert(res, res.numBases())
+            self.__insert(res)
 
           
     ##################################################################
@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey
+#
+#Released under the MIT license, see LICENSE.txt
+
+import os
+import sys
+import math
+from collections import defaultdict
+import numpy as np
+
+from ensemble import LL, LD, DD
+from ensemble import resolveEvents
+from ensemble import startingContigs
+from histogram import BinScheme
+from histogram import Histogram
+from histogram import mergeHistograms
+
+""" Model for very large genomes where only the binned size distribution
+matters.  Instead of individual contigs the state is the number of contigs
+(and their total weight) in each (linear, dead, size-class) cell, where the
+size classes are intervals of classWidth bases.  A contig drawn from a class
+is given the mean weight of that class, so results are exact at the
+resolution of the classes.
+
+When there are many live contigs, LIVE-LIVE events are tau-leaped: all the
+events of a short interval are drawn from the state at its start and their
+effects are applied together.  The interval is kept small enough that only
+a fraction (epsilon) of the contigs can be touched, and is halved whenever
+a leap would empty a class more than it holds.  LIVE-DEAD and DEAD-DEAD
+events, which all involve the single dead contig, are always done one at
+a time.
+
+"""
+# times the pair of a single event is drawn before giving up
+maxRedraws = 1000
+
+class PopulationModel(object):
+    def __init__(self, classWidth=None, maxClasses=100000, epsilon=0.03,
+                 leapThreshold=1000, seed=None):
+        self.classWidth = classWidth
+        self.maxClasses = maxClasses
+        self.epsilon = epsilon
+        self.leapThreshold = leapThreshold
+        self.random = np.random.RandomState(seed)
+        self.time = 0
+        self.leapCount = 0
+        self.__resetCounts()
+
+    ##################################################################
+    # same parameters as Model.setParameters
+    ##################################################################
+    def setParameters(self, N, rll, rld = 0, rdd = 0, fl = 0, fg = 0,
+                      pgain = 0):
+        self.N = N
+        self.fl = fl
+        self.fg = fg
+        self.pgain = pgain
+        self.llRate = N * max(rll, 0)
+        self.ldRate = N * max(rld, 0)
+        self.ddRate = N * max(rdd, 0)
+        width = 1
+        if self.classWidth is not None:
+            width = int(self.classWidth)
+        self.width = max(width, int(math.ceil(float(N) / self.maxClasses)))
+        self.numClasses = int(N / self.width) + 2
+        self.lo, self.hi = self.__bounds()
+
+    ##################################################################
+    # same starting state as Model.setStartingState
+    ##################################################################
+    def setStartingState(self, garbageSize, numLinear, numCircular):
+        sizes, linear, dead = startingContigs(self.N, garbageSize, numLinear,
+                                              numCircular)
+        # flat arrays indexed by (2 * linear + dead) * numClasses + class
+        self.count = np.zeros(4 * self.numClasses, dtype=np.int64)
+        self.weight = np.zeros(4 * self.numClasses, dtype=np.int64)
+        # contigs with no bases (counted in class 0, but never sampled)
+        self.empty = np.zeros(4, dtype=np.int64)
+        self.__add(np.array(sizes, dtype=np.int64), np.array(linear),
+                   np.array(dead))
+
+    ##################################################################
+    # run the simulation for the specified time
+    ##################################################################
+    def simulate(self, time):
+        self.__resetCounts()
+        self.time = 0.
+        otherRate = self.ldRate + self.ddRate
+        nextOther = self.__nextTime(otherRate)
+        while True:
+            live = self.__liveCount()
+            if self.llRate > 0 and live >= self.leapThreshold:
+                # leap over LL events up to the next LD/DD event
+                tau = self.epsilon * live / self.llRate
+                end = min(self.time + tau, nextOther, time)
+                while not self.__leap(end - self.time):
+                    end = self.time + (end - self.time) / 2.0
+                self.time = end
+                if self.time >= time:
+                    self.time = time
+                    break
+                if self.time < nextOther:
+                    continue
+            else:
+                nextLL = self.__nextTime(self.llRate)
+                if min(nextLL, nextOther) > time:
+                    self.time = time
+                    break
+                if nextLL < nextOther:
+                    self.time = nextLL
+                    self.__event(LL)
+                    continue
+                self.time = nextOther
+            if self.random.random_sample() * otherRate < self.ldRate:
+                self.__event(LD)
+            else:
+                self.__event(DD)
+            nextOther = self.__nextTime(otherRate)
+
+    ##################################################################
+    # the histogram dictionary (in the format made by Experiment).
+    # each class is binned (by scheme, or in linear bins of binSize if
+    # it is None) by its mean weight
+    ##################################################################
+    def histograms(self, binSize = 1, scheme = None):
+        if scheme is None:
+            scheme = BinScheme(binSize)
+        hists = dict()
+        for lin in (0, 1):
+            for dead in (0, 1):
+                hists[(lin, dead)] = self.__histogram(lin, dead, scheme)
+        res = dict()
+        res["overall"] = mergeHistograms(hists.values(), scheme)
+        res["dead"] = mergeHistograms([hists[(0, 1)], hists[(1, 1)]], scheme)
+        res["alive"] = mergeHistograms([hists[(0, 0)], hists[(1, 0)]], scheme)
+        res["aliveLinear"] = hists[(1, 0)]
+        res["aliveCircular"] = hists[(0, 0)]
+        res["deadLinear"] = hists[(1, 1)]
+        res["deadCircular"] = hists[(0, 1)]
+        return res
+
+    # how many contigs are in the pool
+    def poolSize(self):
+        return int(self.count.sum())
+
+    # total weight (number of bases) of the pool
+    def poolWeight(self):
+        return int(self.weight.sum())
+
+    # the counters in the same order as Experiment prints them for Model
+    def counts(self):
+        return (self.llCount, self.fgCount, self.flCount, self.ldLossCount,
+                self.ldSwapCount, self.ddGainCount, self.ddSwapCount)
+
+    def __histogram(self, lin, dead, scheme):
+        hist = Histogram(scheme)
+        cell = 2 * lin + dead
+        begin = cell * self.numClasses
+        count = self.count[begin:begin + self.numClasses].copy()
+        weight = self.weight[begin:begin + self.numClasses]
+        if self.empty[cell] > 0:
+            hist.addBin(0, int(self.empty[cell]))
+            count[0] -= self.empty[cell]
+        for c in np.flatnonzero(count):
+            hist.add(int(weight[c] / count[c]), int(count[c]))
+        return hist
+
+    def __nextTime(self, rate):
+        if rate <= 0:
+            return float('inf')
+        return self.time + self.random.exponential(1.0 / rate)
+
+    # number of contigs that can be drawn (they have at least one base)
+    # in the given flat indices
+    def __sampleable(self, flat):
+        empty = np.where(flat % self.numClasses == 0,
+                         self.empty[flat / self.numClasses], 0)
+        return self.count[flat] - empty
+
+    # smallest and largest weight of a sampleable contig in each class
+    # (the last class of each cell holds everything too big for the others)
+    def __bounds(self):
+        cls = np.arange(4 * self.numClasses) % self.numClasses
+        lo = np.maximum(cls * self.width, 1)
+        hi = np.where(cls == self.numClasses - 1, 4 * self.N,
+                      cls * self.width + self.width - 1)
+        return lo, hi
+
+    def __liveCount(self):
+        c = self.numClasses
+        return self.count[0:c].sum() + self.count[2 * c:3 * c].sum() - \
+               self.empty[0] - self.empty[2]
+
+    ##################################################################
+    # flat index, weight and cell of contigs given as arrays of
+    # size, linear and dead
+    ##################################################################
+    def __classify(self, size, linear, dead):
+        weight = np.maximum(np.where(linear, size - 1, size), 0)
+        cell = 2 * linear.astype(np.int64) + dead.astype(np.int64)
+        cls = np.minimum(weight / self.width, self.numClasses - 1)
+        return cell * self.numClasses + cls, weight, cell
+
+    # add contigs to the classes
+    def __add(self, size, linear, dead):
+        flat, weight, cell = self.__classify(size, linear, dead)
+        np.add.at(self.count, flat, 1)
+        np.add.at(self.weight, flat, weight)
+        np.add.at(self.empty, cell[weight == 0], 1)
+
+    ##################################################################
+    # draw k weighted (class, weight, offset) samples from the frozen
+    # state.  the second sample of each pair falls on the same contig
+    # as the first with probability weight / total
+    ##################################################################
+    def __samplePairs(self, k):
+        occupied = np.flatnonzero(self.weight)
+        cum = np.cumsum(self.weight[occupied])
+        total = cum[-1]
+        sampleable = self.__sampleable(occupied)
+        mean = np.clip(np.round(self.weight[occupied] /
+                                np.maximum(sampleable, 1).astype(float)),
+                       self.lo[occupied],
+                       self.hi[occupied]).astype(np.int64)
+
+        x1 = self.random.random_sample(k) * total
+        i1 = np.minimum(np.searchsorted(cum, x1, side='right'),
+                        len(occupied) - 1)
+        x2 = self.random.random_sample(k) * total
+        i2 = np.minimum(np.searchsorted(cum, x2, side='right'),
+                        len(occupied) - 1)
+        w1 = mean[i1]
+        same = (i1 == i2) & (self.random.random_sample(k) *
+                             self.weight[occupied[i1]] < w1)
+        w2 = np.where(same, w1, mean[i2])
+        o1 = np.floor(self.random.random_sample(k) * w1).astype(np.int64)
+        o2 = np.floor(self.random.random_sample(k) * w2).astype(np.int64)
+        return occupied[i1], w1, o1, occupied[i2], w2, o2, same, total
+
+    ##################################################################
+    # do a single event of the given type.  a pair that is inconsistent
+    # with the classes (two contigs from a class holding one) is drawn
+    # again, rather than dropping the event
+    ##################################################################
+    def __event(self, eventType):
+        for attempt in xrange(maxRedraws):
+            if self.__events(np.array([eventType])):
+                return
+        raise RuntimeError("no consistent pair for event type %d in %d "
+                           "draws (%d contigs in %d classes)" % (
+                               eventType, maxRedraws, self.poolSize(),
+                               len(np.flatnonzero(self.count))))
+
+    ##################################################################
+    # do a batch of events (of the given types) on the frozen state.
+    # returns False, leaving the state untouched, if the batch would
+    # remove more contigs from a class than it holds
+    ##################################################################
+    def __events(self, eventType):
+        k = len(eventType)
+        if k == 0:
+            return True
+        if self.count.sum() == 0 or self.weight.sum() <= 1:
+            return True
+        f1, w1, o1, f2, w2, o2, same, total = self.__samplePairs(k)
+        cell1 = f1 / self.numClasses
+        cell2 = f2 / self.numClasses
+        l1 = cell1 >= 2
+        l2 = cell2 >= 2
+        d1 = cell1 % 2 == 1
+        d2 = cell2 % 2 == 1
+        s1 = np.where(l1, w1 + 1, w1)
+        s2 = np.where(l2, w2 + 1, w2)
+        ev = resolveEvents(self.random, eventType, s1, o1, l1, d1,
+                           s2, o2, l2, d2, same, self.fl, self.fg, self.pgain)
+
+        c = ev.changed
+        other = c & ~same
+        two = c & (ev.n == 2)
+        added, addedWeight, addedCell = self.__classify(
+            np.concatenate((ev.sA[c], ev.sB[two])),
+            np.concatenate((ev.lA[c], ev.lB[two])),
+            np.concatenate((ev.dA[c], ev.dB[two])))
+        touched = np.unique(np.concatenate((f1[c], f2[other], added)))
+        count = self.count[touched]
+        weight = self.weight[touched]
+        empty = self.empty.copy()
+        np.add.at(self.count, added, 1)
+        np.add.at(self.weight, added, addedWeight)
+        np.add.at(self.empty, addedCell[addedWeight == 0], 1)
+        np.add.at(self.count, f1[c], -1)
+        np.add.at(self.weight, f1[c], -w1[c])
+        np.add.at(self.count, f2[other], -1)
+        np.add.at(self.weight, f2[other], -w2[other])
+        sampleable = self.__sampleable(touched)
+        if np.any(sampleable < 0):
+            self.count[touched] = count
+            self.weight[touched] = weight
+            self.empty = empty
+            return False
+
+        # keep the class weights consistent with their counts
+        self.weight[touched] = np.clip(self.weight[touched],
+                                       sampleable * self.lo[touched],
+                                       sampleable * self.hi[touched])
+
+        self.llCount += int(ev.llNormal.sum())
+        self.fgCount += int(ev.gain.sum())
+        self.flCount += int(ev.loss.sum())
+        self.ldLossCount += int(ev.ldLoss.sum())
+        self.ldSwapCount += int(ev.ldSwap.sum())
+        self.ddGainCount += int(ev.ddGain.sum())
+        self.ddSwapCount += int(ev.ddSwap.sum())
+        return True
+
+    # all the LL events of an interval of length tau, at once
+    def __leap(self, tau):
+        k = self.random.poisson(self.llRate * tau)
+        if self.__events(np.zeros(k, dtype=np.int64) + LL):
+            self.leapCount += 1
+            return True
+        return False
+
+    ##################################################################
+    # all counters set to zero.
+    ##################################################################
+    def __resetCounts(self):
+        self.llCount = 0
+        self.fgCount = 0
+        self.flCount = 0
+        self.ldLossCount = 0
+        self.ldSwapCount = 0
+        self.ddGainCount = 0
+        self.ddSwapCount = 0
@@ -17,48 +17,142 @@ import sys
 import copy
 import random
 import math
+import multiprocessing
 from collections import defaultdict
-import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.backends.backend_pdf as pltBack
-import matplotlib.lines as lines
-import matplotlib.patches as patches
-import matplotlib.pylab  as pylab
-import matplotlib.pyplot as plt
-from matplotlib.ticker import MultipleLocator, FormatStrFormatter, LogLocator, LogFormatter # minor tick marks
-import matplotlib.mlab as mlab
 
 from contigSim.src.model import Model
 from contigSim.src.sampleTree import SampleTree
+from contigSim.src.bucketSampler import BucketSampler
 from contigSim.src.experiment import Experiment
+from contigSim.src.histogram import BinScheme
+
+# numpy and matplotlib are only needed to plot, so they are imported by
+# loadPlotting() (and simulation workers start without them)
+def loadPlotting():
+    global np, plt, pltBack, LogLocator
+    import numpy as np
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.backends.backend_pdf as pltBack
+    import matplotlib.pyplot as plt
+    from matplotlib.ticker import LogLocator # minor tick marks
 
 def initOptions():
     parser = argparse.ArgumentParser(description='Run an experiment.')
+    addSimulateOptions(parser)
+    addPlotOptions(parser)
+    parser.add_argument('--saveSim', type=str, help='Location to save pickle.')
+    parser.add_argument('--loadSim', type=str, help='Location to load pickle.')
+    return parser
+
+##################################################################
+# the simulate, aggregate and plot subcommands.  simulate only imports
+# the model code, so many short simulation jobs can each save a pickle
+# that is aggregated and plotted once
+##################################################################
+def initSubcommandOptions():
+    parser = argparse.ArgumentParser(description='Run an experiment.')
+    subparsers = parser.add_subparsers(dest='command')
+    simParser = subparsers.add_parser('simulate',
+                                      help='Run an experiment and save it.')
+    addSimulateOptions(simParser)
+    simParser.add_argument('--out', type=str, required=True,
+                           help='Location to save pickle.')
+    simParser.add_argument('--queueDir', type=str, default=None,
+                           help='Run the replicates through a work queue in this '
+                           '(shared) directory, to be claimed by workQueue.py workers '
+                           'on any host, instead of locally.')
+    simParser.add_argument('--queueWorkers', type=int, default=0,
+                           help='Number of local worker processes to run on the '
+                           '--queueDir queue. default=%(default)s')
+    simParser.add_argument('--seed', type=int, default=0,
+                           help='Seed of the first replicate of each cell with '
+                           '--queueDir. default=%(default)s')
+    aggParser = subparsers.add_parser('aggregate',
+                                      help='Merge the replicates of saved '
+                                      'experiments.')
+    aggParser.add_argument('inputs', nargs='+', help='Saved pickles.')
+    aggParser.add_argument('--out', type=str, required=True,
+                           help='Location to save merged pickle.')
+    plotParser = subparsers.add_parser('plot',
+                                       help='Plot saved experiments '
+                                       '(merging their replicates).')
+    plotParser.add_argument('inputs', nargs='+', help='Saved pickles.')
+    addPlotOptions(plotParser)
+    return parser
+
+def addPlotOptions(parser):
     parser.add_argument('--showPlot', default=False, action='store_true',
                         help='show plots instead of saving to pdfs')
+    parser.add_argument('--linearY', default=False, action='store_true',
+                        help='Plot y-axis in linear scale. default=%(default)s')
+    parser.add_argument('--countY', default=False, action='store_true',
+                        help='Y-axis shows counts per bin instead of frequency per bin. default=%(default)s')
+    parser.add_argument('--alpha', type=float, default=0.3, 
+                        help='Alpha transparency for plot, [0, 1]. default=%(default)s')
+    parser.add_argument('--meanField', default=False, action='store_true',
+                        help='Also solve the deterministic mean-field equations for each result and '
+                        'plot the expected histograms as lines. default=%(default)s')
+    parser.add_argument('--plotProcesses', type=int, default=1,
+                        help='Number of processes to render the results in parallel. '
+                        'default=%(default)s')
+    parser.add_argument('--multipage', type=str, default=None,
+                        help='Write all the results as pages of this single PDF (reusing one '
+                        'figure) instead of one PDF per result.')
+    parser.add_argument('--preview', default=False, action='store_true',
+                        help='Fast preview: rasterized low resolution plots, written as PNGs '
+                        '(or rasterized pages with --multipage). default=%(default)s')
+
+def addSimulateOptions(parser):
     parser.add_argument('--replicates', type=int, default=50, 
                         help='Number of replicates to run. default=%(default)s')
     parser.add_argument('--binSize', type=int, default=1000000,
                         help='Size of bins. default=%(default)s')
+    parser.add_argument('--logBase', type=float, default=None,
+                        help='Bin contig sizes of at least --linearLimit in bins growing by this '
+                        'factor (log bins) rather than all in bins of --binSize. default=%(default)s')
+    parser.add_argument('--linearLimit', type=int, default=None,
+                        help='Size at which the log bins of --logBase start (a multiple of '
+                        '--binSize). default=--binSize')
     parser.add_argument('--N', type=int, default=3000000000,
                         help='Number of bases. default=%(default)s')
     parser.add_argument('--t', type=float, default=10000,
                         help='Time. default=%(default)s')
-    parser.add_argument('--linearY', default=False, action='store_true',
-                        help='Plot y-axis in linear scale. default=%(default)s')
-    parser.add_argument('--countY', default=False, action='store_true',
-                        help='Y-axis shows counts per bin instead of frequency per bin. default=%(default)s')
-    parser.add_argument('--saveSim', type=str, help='Location to save pickle.')
-    parser.add_argument('--loadSim', type=str, help='Location to load pickle.')
-    parser.add_argument('--alpha', type=float, default=0.3, 
-                        help='Alpha transparency for plot, [0, 1]. default=%(default)s')
     parser.add_argument('--numParamSets', type=int, default=1,
                         help='Number of predefined parameter sets to use. default=%(default)s')
     parser.add_argument('--numStartingStates', type=int, default=1,
                         help='Number of predefined starting states to use. default=%(default)s')
+    parser.add_argument('--pool', type=str, default='tree', choices=['tree', 'bucket'],
+                        help='Contig pool used by the model engine: b-tree (SampleTree) or '
+                        'composition-rejection buckets (BucketSampler). default=%(default)s')
+    parser.add_argument('--tuneEvents', type=int, default=0,
+                        help='Measure the SampleTree sampling and update costs over this many '
+                        'events at the start of each run and rebuild it with the cheapest '
+                        'degree (0 to disable). default=%(default)s')
+    parser.add_argument('--metrics', default=False, action='store_true',
+                        help='Record event outcomes, timings and pool statistics for each '
+                        'model run and write them to a .metrics.json file per result. '
+                        'default=%(default)s')
+    parser.add_argument('--pauseGC', default=False, action='store_true',
+                        help='Disable the cyclic garbage collector while each model run '
+                        'simulates. default=%(default)s')
+    parser.add_argument('--thinning', default=False, action='store_true',
+                        help='Skip the live-live events that do not change the pool by '
+                        'running them at the rate of the effective ones only. '
+                        'default=%(default)s')
+    parser.add_argument('--journalDir', type=str, default=None,
+                        help='Write a compressed binary journal of the events of each model '
+                        'run to this directory, for replay without re-simulating.')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Run the replicates of each cell in this many processes, '
+                        'which sum their histograms in shared memory (only the sums '
+                        'of the replicates are kept). default=%(default)s')
+    parser.add_argument('--engine', type=str, default='model',
+                        choices=['model', 'ensemble', 'population'],
+                        help='Simulation engine: one Model per replicate, all replicates of a cell '
+                        'in one vectorized Ensemble, or a PopulationModel of binned size classes '
+                        'per replicate. default=%(default)s')
 
-    return parser
 def checkOptions(args, parser):
     if args.saveSim is not None and args.loadSim is not None:
         parser.error('Error, you cannot invoke both --loadSim and --saveSim. Pick one.')
@@ -79,18 +173,63 @@ def unpackData(file):
    obj = cPickle.load(f)
    f.close()
    return obj
-def avgHistogram(results, cat, args):
-    table = defaultdict(int)
+# the categories of the tables made by histogramTables, in order
+tableCategories = ["aliveCircular", "aliveLinear", "deadCircular",
+                   "deadLinear"]
+
+##################################################################
+# sum the histograms of the replicates of a result into a dense array
+# with a row for each of tableCategories and a column for each bin, in
+# a single pass over the replicates, and a tail for each row.  only the
+# first maxDenseBins bins (of sharedHistogram) are dense, so fine bins
+# over a big genome don't take gigabytes: the tail of a row is a
+# dictionary of its counts in the later bins.  the sums are divided by
+# the number of replicates unless args.countY is set.  the results can
+# also be a SharedAccumulator (of runCellsShared), whose table is read
+# as is.  returns (tables, tails)
+##################################################################
+def histogramTables(results, args):
+    from contigSim.src.sharedHistogram import SharedAccumulator
+    from contigSim.src.sharedHistogram import maxDenseBins
+    if isinstance(results, SharedAccumulator):
+        tables, tails = results.fullTable()
+        if not args.countY:
+            tables = tables / float(len(results))
+            tails = [dict((index, count / float(len(results))) for
+                          index, count in tail.iteritems()) for tail in tails]
+        return tables, tails
+    keys = [[] for cat in tableCategories]
+    values = [[] for cat in tableCategories]
     for rep in results:
-        res = rep[cat]
-        for key,value in res.items():
-            table[key] += value
-    for key,value in table.items():
-        if args.countY:
-            table[key] = float(table[key])
-        else:
-            table[key] = float(table[key]) / float(len(results))
-    return table
+        for i, cat in enumerate(tableCategories):
+            keys[i].extend(rep[cat].iterkeys())
+            values[i].extend(rep[cat].itervalues())
+    size = min(1 + max([max(k) for k in keys if len(k) > 0] + [0]),
+               maxDenseBins)
+    tables = np.zeros((len(tableCategories), size))
+    tails = [dict() for cat in tableCategories]
+    for i in xrange(len(tableCategories)):
+        if len(keys[i]) > 0:
+            bins = np.array(keys[i], dtype=np.int64)
+            weights = np.array(values[i], dtype=float)
+            dense = bins < size
+            tables[i] = np.bincount(bins[dense], weights=weights[dense],
+                                    minlength=size)
+            for index, weight in zip(bins[~dense], weights[~dense]):
+                tails[i][int(index)] = tails[i].get(int(index), 0.) + weight
+    if not args.countY:
+        tables /= float(len(results))
+        for tail in tails:
+            for index in tail:
+                tail[index] /= float(len(results))
+    return tables, tails
+
+# a histogram dictionary as a dense array
+def denseTable(table):
+    dense = np.zeros(1 + max(table.keys() + [0]))
+    for key, value in table.items():
+        dense[key] += value
+    return dense
 
 def cumulative(table):
     xAxis = []
@@ -102,7 +241,11 @@ def cumulative(table):
 def initImage(width, height, filename, args):
     """
     initImage takes a width and height and returns both a fig and pdf object.
+    (the pdf is None for previews, which are saved as PNGs)
     """
+    if args.preview:
+        return (plt.figure(figsize=(width, height), dpi=72, facecolor='w'),
+                None)
     pdf = pltBack.PdfPages(filename)
     fig = plt.figure(figsize=(width, height), dpi=300, facecolor='w')
     return (fig, pdf)
@@ -114,34 +257,108 @@ def initAxis(fig, args):
     ax = fig.add_axes([args.axLeft, args.axBottom,
                        args.axWidth, args.axHeight])
     return ax
-def writeImage(fig, pdf, args):
+def writeImage(fig, pdf, args, filename=None):
+    if pdf is None:
+        fig.savefig(filename, format = 'png', dpi = 72)
+        return
     fig.savefig(pdf, format = 'pdf')
     pdf.close()
-def doPlot(ctable, ltable, dctable, dltable, title, args):
+def meanFieldTables(key, replicates, args):
+    """meanFieldTables() solves the mean-field model for the parameters
+    and starting state of a result key and returns its expected tables
+    (scaled like histogramTables) in the order doPlot takes them.
+    """
+    from contigSim.src.meanField import MeanFieldModel
+    model = MeanFieldModel(binSize=args.binSize)
+    model.setParameters(*key[1:8])
+    model.setStartingState(*key[8:11])
+    model.simulate(key[0])
+    res = model.histograms(scheme=args.binScheme)
+    tables = []
+    for cat in tableCategories:
+        table = denseTable(res[cat])
+        if args.countY:
+            table *= replicates
+        tables.append(table)
+    return tables
+def doPlot(ctable, ltable, dctable, dltable, title, args, mfTables=None,
+           tails=None):
     fig, pdf = initImage(9.0, 4.0, title, args)
     ax = initAxis(fig, args)
-    drawData(ax, ctable, ltable, dctable, dltable, title, args)
+    drawData(ax, ctable, ltable, dctable, dltable, title, args, mfTables,
+             tails)
     if args.showPlot is True:
         plt.show()
     else:
-        writeImage(fig, pdf, args)
-def extractPlottables(table, binSize):
-    keylist = table.keys()
-    keylist.sort()
-    x = []
-    y = []
-    for key in keylist:
-        x.append(key)
-        y.append(table[key])
-    # center the x values in the middle of their bin
-    x = (np.array(x) * binSize) - binSize / 2.0
-    y = np.array(y)
-    return x, y 
-def drawData(ax, ctable, ltable, dctable, dltable, title, args):
-    cx, cy = extractPlottables(ctable, args.binSize)
-    lx, ly = extractPlottables(ltable, args.binSize)
-    dcx, dcy = extractPlottables(dctable, args.binSize)
-    dlx, dly = extractPlottables(dltable, args.binSize)
+        writeImage(fig, pdf, args, title)
+    plt.close(fig)
+
+##################################################################
+# plot a result cell, given as (key, number of replicates, (tables,
+# tails) of histogramTables, file name, args).  module level so that it
+# can run in a process pool
+##################################################################
+def renderCell(cell):
+    key, replicates, (tables, tails), fname, args = cell
+    loadPlotting()
+    mfTables = None
+    if args.meanField:
+        mfTables = meanFieldTables(key, replicates, args)
+    ctable, ltable, dctable, dltable = tables
+    doPlot(ctable, ltable, dctable, dltable, fname, args, mfTables, tails)
+
+##################################################################
+# all the cells as the pages of one pdf, drawn on a single figure
+# and axes that are cleared between pages
+##################################################################
+def renderMultipage(cells, args):
+    loadPlotting()
+    dpi = 300
+    if args.preview:
+        dpi = 72
+    pdf = pltBack.PdfPages(args.multipage)
+    fig = plt.figure(figsize=(9.0, 4.0), dpi=dpi, facecolor='w')
+    ax = initAxis(fig, args)
+    for key, replicates, (tables, tails), fname, cellArgs in cells:
+        ax.cla()
+        plt.sca(ax)
+        mfTables = None
+        if args.meanField:
+            mfTables = meanFieldTables(key, replicates, args)
+        ctable, ltable, dctable, dltable = tables
+        drawData(ax, ctable, ltable, dctable, dltable, fname, args, mfTables,
+                 tails)
+        fig.savefig(pdf, format = 'pdf', dpi = dpi)
+    pdf.close()
+    plt.close(fig)
+
+# the points of a dense table and (optionally) its sparse tail of
+# later bins
+def extractPlottables(table, scheme, tail=None):
+    x = np.flatnonzero(table)
+    y = table[x]
+    if tail:
+        x = np.concatenate([x, np.array(sorted(tail), dtype=np.int64)])
+        y = np.concatenate([y, [tail[i] for i in sorted(tail)]])
+    if not scheme.isLog():
+        # center the x values in the middle of their bin
+        x = (x * scheme.binSize) - scheme.binSize / 2.0
+        return x, y
+    # (on the log axis) the middle of the linear bins and the
+    # geometric middle of the log bins
+    lower = np.array([scheme.binLower(i) for i in x], dtype=float)
+    upper = np.array([scheme.binUpper(i) for i in x], dtype=float)
+    linear = x < scheme.numLinear
+    x = np.where(linear, (lower + upper) / 2.0, np.sqrt(lower * upper))
+    return x, y
+def drawData(ax, ctable, ltable, dctable, dltable, title, args, mfTables=None,
+             tails=None):
+    if tails is None:
+        tails = [None] * 4
+    cx, cy = extractPlottables(ctable, args.binScheme, tails[0])
+    lx, ly = extractPlottables(ltable, args.binScheme, tails[1])
+    dcx, dcy = extractPlottables(dctable, args.binScheme, tails[2])
+    dlx, dly = extractPlottables(dltable, args.binScheme, tails[3])
     colorList = ['#1f77b4', # dark blue
                  '#aec7e8', # light blue
                  '#ff7f0e', # bright orange
@@ -159,20 +376,33 @@ def drawData(ax, ctable, ltable, dctable, dltable, title, args):
     # there is a bug in our version fo matplotlib that wont allow us to set markeredgecolor='none'
     plotlist.append(plt.plot(cx, cy, color=colorList[0], linestyle='none', marker='.', 
                              markeredgecolor=colorList[0], markeredgewidth=0, linewidth=0.5,
-                             markersize=10.0, alpha=args.alpha)[0])
+                             markersize=10.0, alpha=args.alpha,
+                             rasterized=args.preview)[0])
     plotlist.append(plt.plot(lx, ly, color=colorList[2], linestyle='none', marker='.', 
                              markeredgecolor=colorList[2], markeredgewidth=0, linewidth=0.5,
-                             markersize=10.0, alpha=args.alpha)[0])
+                             markersize=10.0, alpha=args.alpha,
+                             rasterized=args.preview)[0])
     plotlist.append(plt.plot(dcx, dcy, color=colorList[8], linestyle='none', marker='.', 
                              markeredgecolor=colorList[8], markeredgewidth=0, linewidth=0.5,
-                             markersize=10.0, alpha=args.alpha)[0])
+                             markersize=10.0, alpha=args.alpha,
+                             rasterized=args.preview)[0])
     plotlist.append(plt.plot(dlx, dly, color=colorList[10], linestyle='none', marker='.', 
                              markeredgecolor=colorList[10], markeredgewidth=0, linewidth=0.5,
-                             markersize=10.0, alpha=args.alpha)[0])
+                             markersize=10.0, alpha=args.alpha,
+                             rasterized=args.preview)[0])
+    if mfTables is not None:
+        # expected (mean-field) histograms as lines in the same colours
+        for table, color in zip(mfTables, [colorList[0], colorList[2],
+                                           colorList[8], colorList[10]]):
+            mx, my = extractPlottables(table, args.binScheme)
+            plt.plot(mx, my, color=color, linestyle='-', linewidth=0.75,
+                     rasterized=args.preview)
 
     xmin, xmax = plt.xlim()
     ymin, ymax = plt.ylim()
-    if xmin < -1.0:
+    if args.binScheme.isLog():
+        ax.set_xscale('log')
+    elif xmin < -1.0:
         plt.xlim(0 - .02 * xmax, xmax * 1.02)
     else:
         plt.xlim(xmax - ((xmax - xmin) * 1.02), xmax * 1.02)
@@ -201,111 +431,263 @@ def drawData(ax, ctable, ltable, dctable, dltable, title, args):
     plt.setp(leg.get_texts(), fontsize='x-small') # legend fontsize
     leg._drawFrame = False
 
+##################################################################
+# the Experiment of the predefined parameter sets and starting states
+# chosen by the simulate options (not yet run)
+##################################################################
+def initExperiment(args):
+    exp = Experiment()
+    exp.setEngine(args.engine)
+    if args.pool == 'bucket':
+        exp.setPoolType(BucketSampler)
+    exp.setTuneEvents(args.tuneEvents)
+    exp.setCollectMetrics(args.metrics)
+    exp.setPauseGC(args.pauseGC)
+    exp.setThinning(args.thinning)
+    if args.logBase is not None:
+        exp.setBinScheme(BinScheme(args.binSize, args.logBase,
+                                   args.linearLimit))
+    if args.journalDir is not None:
+        if not os.path.isdir(args.journalDir):
+            os.makedirs(args.journalDir)
+        exp.setJournalDir(args.journalDir)
+    if args.numParamSets > 0:
+        exp.addParameterSet(args.t, args.N, rll=1.0 / args.N,
+                            rld=0, rdd=0,
+                            fl = 0, fg = 0, pgain = 0.00)
+    if args.numParamSets > 1:
+        exp.addParameterSet(args.t, args.N, rll=1.0 / args.N,
+                            rld= 0.1/ args.N, rdd= 0.1 / args.N,
+                            fl = 0.5, fg = 0.5, pgain = 0.00)
+    if args.numParamSets > 2:
+        exp.addParameterSet(args.t, args.N, rll=1.0 / args.N,
+                            rld= 0.1/ args.N, rdd= 0.1 / args.N,
+                            fl = 0.5, fg = 0.5, pgain = 0.5)
+    if args.numStartingStates > 0:
+        exp.addStartingState(0, 25, 0)
+    if args.numStartingStates > 1:
+        exp.addStartingState(0, 0, 25)
+
+    if args.N > 3000025:
+        if args.numStartingStates > 2:
+            exp.addStartingState(3000000, 25, 0)
+        if args.numStartingStates > 3:
+            exp.addStartingState(3000000, 0, 25)
+        if args.numStartingStates > 4:
+            exp.addStartingState(3000000, 10, 10)
+    return exp
+
+##################################################################
+# run the replicates of an experiment through a shared directory work
+# queue (see workQueue.py), with some local workers, and read the
+# results back into it
+##################################################################
+def runQueued(exp, args):
+    from contigSim.src.workQueue import WorkQueue
+    queue = WorkQueue(args.queueDir)
+    tasks = queue.submit(exp, args.replicates, args.binSize, args.seed)
+    workers = [multiprocessing.Process(target=runWorker,
+                                       args=(args.queueDir,))
+               for i in xrange(args.queueWorkers)]
+    for worker in workers:
+        worker.start()
+    queue.wait([x for taskIds in tasks.values() for x in taskIds])
+    for worker in workers:
+        worker.join()
+    queue.collect(exp, tasks)
+
+def runWorker(queueDir):
+    from contigSim.src.workQueue import WorkQueue
+    from contigSim.src.workQueue import Worker
+    Worker(WorkQueue(queueDir)).run()
+
+# load pickled experiments and merge their replicates into one
+def loadExperiments(paths):
+    exp = unpackData(paths[0])
+    for path in paths[1:]:
+        exp.merge(unpackData(path))
+    return exp
+
+##################################################################
+# write the summary, metrics and plot of each result of an experiment
+##################################################################
+def plotExperiment(exp, args):
+    plotCells(exp, exp.results.items(), args)
+
+##################################################################
+# write the summary, metrics and plot of each (key, results) pair of
+# a stream of result cells, such as Experiment.runCells.  each cell
+# is sent to a process pool as soon as it arrives, where it is
+# summarized and its plot rendered, so that both overlap with the
+# making of the next cells (with --multipage the pages are all drawn
+# at the end, and with --showPlot everything is done in turn here)
+##################################################################
+def plotCells(exp, cellStream, args):
+    loadPlotting()
+    args.binScheme = plotScheme(exp, args)
+    render = args.multipage is None
+    pool = None
+    if not args.showPlot:
+        pool = multiprocessing.Pool(max(1, args.plotProcesses))
+    pending = []
+    cells = []
+    for result in cellStream:
+        task = cellTask(exp, result, args)
+        if pool is not None:
+            pending.append(pool.apply_async(processCell, (task, render)))
+        else:
+            cells.append(processCell(task, render))
+    if pool is not None:
+        pool.close()
+        cells = [res.get() for res in pending]
+        pool.join()
+    if args.multipage is not None:
+        renderMultipage(sorted(cells), args)
+
+# summarize a cell task (see cellTask) and render its plot if render
+# is set.  returns the cell to render.  module level so that it can
+# run in a process pool
+def processCell(task, render):
+    loadPlotting()
+    cell = summarizeTask(task)
+    if render:
+        renderCell(cell)
+    return cell
+
+# the bins of the results of an experiment: its own bin scheme if it
+# was given one, and linear bins of args.binSize otherwise
+def plotScheme(exp, args):
+    scheme = getattr(exp, "binScheme", None)
+    if scheme is None:
+        return BinScheme(args.binSize)
+    return scheme
+
+##################################################################
+# what summarizeTask needs of a (key, results) pair of an experiment,
+# which can be pickled without the experiment: (key, results, metadata
+# or None, metrics json or None, args)
+##################################################################
+def cellTask(exp, result, args):
+    key, results = result
+    metadata = None
+    metrics = None
+    if hasattr(exp, "metadata") and key in exp.metadata:
+        metadata = exp.metadata[key]
+        if any("metrics" in x for x in metadata):
+            metrics = exp.metricsJson(key)
+    return (key, results, metadata, metrics, args)
+
+# write the summary (and metrics) of a (key, results) pair and return
+# the cell to render
+def summarizeCell(exp, result, args):
+    return summarizeTask(cellTask(exp, result, args))
+
+##################################################################
+# write the summary (and metrics) of a cell task and return the cell
+# to render
+##################################################################
+def summarizeTask(task):
+    key, results, metadata, metrics, args = task
+    result = (key, results)
+    # make unique filename as function of parameters
+    fname = "t%d_N%d_rll%.2f_rld%.2f_rdd_%.2f_fl%.2f_fg%.2f_pgain_%.2f__gbg%d_nl%d_nc%d" % result[0]
+    # add extensions (pdf?)
+    txtname = fname + ".txt"
+    metricsname = fname + ".metrics.json"
+    if args.preview:
+        fname += ".png"
+    else:
+        fname += ".pdf"
+
+    # the results tables are lists of replicates, summed into
+    # the mean (or total for countY) of each category
+    tables, tails = histogramTables(result[1], args)
+
+    # basic counts for debugging purposes (bases in units of binSize,
+    # counting each contig as the smallest size of its bin)
+    numContigs = tables.sum(axis=1)
+    lower = np.array([args.binScheme.binLower(i) for i in
+                      xrange(tables.shape[1])], dtype=float)
+    numBases = tables.dot(lower / args.binScheme.binSize)
+    for cat, tail in enumerate(tails):
+        for index, count in tail.iteritems():
+            numContigs[cat] += count
+            numBases[cat] += count * args.binScheme.binLower(index) / \
+                             float(args.binScheme.binSize)
+    log = open(txtname, 'w')
+    for name, cat in [("linear", 1), ("circular", 0),
+                      ("deadLinear", 3), ("deadCircular", 2)]:
+        line = "%s: contigs=%.2f bases=%d" % (name, numContigs[cat],
+                                              numBases[cat])
+        print line
+        log.write(line + "\n")
+    if metadata is not None:
+        degrees = [x["degree"] for x in metadata if "degree" in x]
+        if len(degrees) > 0:
+            log.write("tunedDegrees: %s\n" % " ".join(map(str, degrees)))
+        allocations = [x["allocations"] for x in metadata
+                       if "allocations" in x]
+        for name in ("nodesAllocated", "contigsAllocated"):
+            if len(allocations) > 0:
+                log.write("%s: %s\n" % (name, " ".join(
+                    str(x[name]) for x in allocations)))
+    log.close()
+
+    if metrics is not None:
+        metricsFile = open(metricsname, 'w')
+        metricsFile.write(metrics)
+        metricsFile.close()
+
+    # sanity check since only one dead contig presently supported
+    assert numContigs[2] + numContigs[3] <= len(result[1])
+
+    return (result[0], len(result[1]), (tables, tails), fname, args)
+
+
 def main(argv=None):
     if argv is None:
         argv = sys.argv
+    if len(argv) > 1 and argv[1] in ("simulate", "aggregate", "plot"):
+        parser = initSubcommandOptions()
+        args = parser.parse_args(argv[1:])
+        if args.command == "simulate":
+            exp = initExperiment(args)
+            if args.queueDir is not None:
+                runQueued(exp, args)
+            elif args.processes > 1:
+                for cell in exp.runCellsShared(args.replicates, args.binSize,
+                                               args.processes):
+                    pass
+            else:
+                exp.run(args.replicates, args.binSize)
+            packData(exp, args.out)
+        elif args.command == "aggregate":
+            packData(loadExperiments(args.inputs), args.out)
+        else:
+            exp = loadExperiments(args.inputs)
+            args.binSize = exp.binSize
+            plotExperiment(exp, args)
+        return 0
+
+    # legacy usage: simulate (or load) and plot in one go
     parser = initOptions()
-    args = parser.parse_args()
+    args = parser.parse_args(argv[1:])
     checkOptions(args, parser)
 
+    # the cells are summarized and plotted as they are simulated
     if args.loadSim is None:
-        exp = Experiment()
-        if args.numParamSets > 0:
-            exp.addParameterSet(args.t, args.N, rll=1.0 / args.N,
-                                rld=0, rdd=0,
-                                fl = 0, fg = 0, pgain = 0.00)
-        if args.numParamSets > 1:
-            exp.addParameterSet(args.t, args.N, rll=1.0 / args.N,
-                                rld= 0.1/ args.N, rdd= 0.1 / args.N,
-                                fl = 0.5, fg = 0.5, pgain = 0.00)
-        if args.numParamSets > 2:
-            exp.addParameterSet(args.t, args.N, rll=1.0 / args.N,
-                                rld= 0.1/ args.N, rdd= 0.1 / args.N,
-                                fl = 0.5, fg = 0.5, pgain = 0.5)
-        if args.numStartingStates > 0:
-            exp.addStartingState(0, 25, 0)
-        if args.numStartingStates > 1:
-            exp.addStartingState(0, 0, 25)
-
-        if args.N > 3000025:
-            if args.numStartingStates > 2:
-                exp.addStartingState(3000000, 25, 0)
-            if args.numStartingStates > 3:
-                exp.addStartingState(3000000, 0, 25)
-            if args.numStartingStates > 4:
-                exp.addStartingState(3000000, 10, 10)
-        
-        exp.run(args.replicates, args.binSize)
+        exp = initExperiment(args)
+        if args.processes > 1:
+            cells = exp.runCellsShared(args.replicates, args.binSize,
+                                       args.processes)
+        else:
+            cells = exp.runCells(args.replicates, args.binSize)
+        plotCells(exp, cells, args)
     else:
         exp = unpackData(args.loadSim)
+        plotExperiment(exp, args)
     if args.saveSim is not None:
         packData(exp, args.saveSim)
 
-    # there iterate for each combination of starting state and parameters
-    # note there is only one for now.
-    # each result is a name - table pair
-    for result in exp.results.items():
-        # make unique filename as function of parameters
-        fname = "t%d_N%d_rll%.2f_rld%.2f_rdd_%.2f_fl%.2f_fg%.2f_pgain_%.2f__gbg%d_nl%d_nc%d" % result[0]
-        # add extensions (pdf?)
-        txtname = fname + ".txt"
-        fname += ".pdf"
-
-        # the results tables are lists of replicates
-        # use the crappy avgHistogram method to compute
-        # the avearge (mean) of each table
-        ctable = avgHistogram(result[1], "aliveCircular", args)
-        ltable = avgHistogram(result[1], "aliveLinear", args)
-        dctable = avgHistogram(result[1], "deadCircular", args)
-        dltable = avgHistogram(result[1], "deadLinear", args)
-
-        # run through some basic counts for debugging purposes
-        numLinearBases = 0
-        numLinearContigs = 0
-        for key,value in ltable.items():
-            numLinearBases += key * value
-            numLinearContigs += value
-        numCircularBases = 0
-        numCircularContigs = 0
-        for key,value in ctable.items():
-            numCircularBases += key * value
-            numCircularContigs += value
-        numDeadLinearBases = 0
-        numDeadLinearContigs = 0
-        for key,value in dltable.items():
-            numDeadLinearBases += key * value
-            numDeadLinearContigs += value
-        numDeadCircularBases = 0
-        numDeadCircularContigs = 0
-        for key,value in dctable.items():
-            numDeadCircularBases += key * value
-            numDeadCircularContigs += value
-
-        print "linear: contigs=%.2f bases=%d" % (numLinearContigs,
-                                               numLinearBases)
-        print "circular: contigs=%.2f bases=%d" % (numCircularContigs,
-                                                 numCircularBases)
-        print "deadLinear: contigs=%.2f bases=%d" % (numDeadLinearContigs,
-                                                   numDeadLinearBases)
-        print "deadCircular: contigs=%.2f bases=%d" % (numDeadCircularContigs,
-                                                     numDeadCircularBases)
-
-        log = open(txtname, 'w')
-        log.write("linear: contigs=%.2f bases=%d\n" % (numLinearContigs,
-                                                     numLinearBases))
-        log.write("circular: contigs=%.2f bases=%d\n" % (numCircularContigs,
-                                                       numCircularBases))
-        log.write("deadLinear: contigs=%.2f bases=%d\n" % (numDeadLinearContigs,
-                                                         numDeadLinearBases))
-        log.write("deadCircular: contigs=%.2f bases=%d\n" %(numDeadCircularContigs,
-                                                           numDeadCircularBases))
-        log.close()
-
-        # sanity check since only one dead contig presently supported
-        assert numDeadCircularContigs + numDeadLinearContigs <= args.replicates
-
-        # use dent's awesome functinos to plot the results
-        doPlot(ctable, ltable, dctable, dltable, fname, args)
-
 if __name__ == "__main__":
     sys.exit(main())
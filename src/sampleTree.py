@@ -8,12 +8,31 @@ import os
 import sys
 import copy
 import random
+import time
+import math
 from collections import defaultdict
 
+from histogram import BinScheme
+from histogram import Histogram
+
 """ In order to quickly sample contigs (uniformly based on their weights)
 we keep them in a b-tree.  This way sampling can be done in logN, as can
 updates due to rearrangements.  
 
+Removing a leaf collapses the internal nodes it leaves empty or with a
+single child, and every node keeps its height.  If the tree ever gets
+deeper than maxDepth() it is rebuilt (in linear time) into a complete
+tree, so the depth stays O(log_degree n) no matter the sequence of
+inserts and removes.
+
+Removed nodes are kept on a free list and reused by later inserts, so a
+simulation that keeps removing and inserting contigs doesn't allocate
+(and leave to the garbage collector) new nodes for every event.
+
+The leaves are also kept in a flat list (each knows its index, and a
+removed one is swapped with the last), so going through the elements,
+for histograms or snapshots, doesn't have to walk the tree.
+
 """
 
 class SampleTreeNode(object):
@@ -23,59 +42,241 @@ class SampleTreeNode(object):
         self.parent = parent
         self.children = []
         self.data = None
+        # length of the longest path down to a leaf
+        self.height = 0
+        # position in the tree's list of leaves (None if not a leaf)
+        self.index = None
 
 class SampleTree(object):
     def __init__(self, degree=4):
         self.degree = degree
         self.root = SampleTreeNode(None)
+        # the leaf nodes, in no particular order
+        self.leaves = []
+        # number of samples (descents) and updates (inserts and removes)
+        # done on the tree, used to tune the degree
+        self.sampleCount = 0
+        self.updateCount = 0
+        # number of times the tree was rebuilt to bound its depth
+        self.rebuildCount = 0
+        # optional Metrics object to record updates and descent depths in
+        self.metrics = None
+        # removed nodes, to be reused by insert (at most maxFreeNodes),
+        # and the number of nodes allocated and reused
+        self.freeNodes = []
+        self.maxFreeNodes = 65536
+        self.allocCount = 0
+        self.reuseCount = 0
         assert self.degree > 1
 
+    # a node from the free list (or a new one if it's empty)
+    def __newNode(self, parent):
+        if len(self.freeNodes) == 0:
+            self.allocCount += 1
+            return SampleTreeNode(parent)
+        node = self.freeNodes.pop()
+        node.parent = parent
+        self.reuseCount += 1
+        return node
+
+    # clear a node that is no longer in the tree and keep it for reuse
+    def __releaseNode(self, node):
+        node.weight = 0
+        node.count = 0
+        node.parent = None
+        node.data = None
+        node.height = 0
+        node.index = None
+        if len(node.children) > 0:
+            node.children = []
+        if len(self.freeNodes) < self.maxFreeNodes:
+            self.freeNodes.append(node)
+
     # find a free slot in the tree
     def __findSlot(self, node):
+        # case 3: go down full internal nodes
+        while node.data is None and len(node.children) >= self.degree:
+            node = min(node.children, key=lambda x: x.count)
         # case 1: internal node has room for another child
-        if node.data is None and len(node.children) < self.degree:
+        if node.data is None:
             return node
-        # case 2: on leaf: turn into an internal node and push leaf down
-        elif node.data is not None:
-            assert len(node.children) == 0
-            child = SampleTreeNode(node)
-            child.data = node.data
-            child.weight = node.weight
-            child.count = node.count
-            node.data = None
-            node.children.append(child)
-            return node
-        # case 3: recurse down full internal node
-        else:
-            child = min(node.children, key=lambda x: x.count)
-            return self.__findSlot(child)
+        # case 2: on leaf: put a new internal node in its place and push
+        # the leaf down under it (so the leaf node object stays valid)
+        assert len(node.children) == 0
+        parent = node.parent
+        internal = self.__newNode(parent)
+        internal.weight = node.weight
+        internal.count = node.count
+        internal.height = 1
+        parent.children[parent.children.index(node)] = internal
+        internal.children.append(node)
+        node.parent = internal
+        return internal
 
-    # update weight and count values on parents of node
+    # update weight, count and height values on parents of node
     def __updateUpwards(self, node):
-        if node is None:
-            return
-        assert node.data is None
+        while node is not None:
+            assert node.data is None
+            self.__updateNode(node)
+            node = node.parent
+
+    # update the weight, count and height of an internal node
+    # from its children
+    def __updateNode(self, node):
         node.weight = reduce(lambda x,y: x + y.weight, node.children, 0)
         node.count = reduce(lambda x,y: x + y.count, node.children, 0)
-        self.__updateUpwards(node.parent)
+        node.height = 0
+        if len(node.children) > 0:
+            node.height = 1 + max(x.height for x in node.children)
 
-    # insert a new leaf node with given data and weight
+    # insert a new leaf node with given data and weight and return it
     def insert(self, data, weight):
         parent = self.__findSlot(self.root)
         assert len(parent.children) < self.degree and parent.data is None
-        newNode = SampleTreeNode(parent)
+        newNode = self.__newNode(parent)
         newNode.data = data
         newNode.weight = weight
         newNode.count = 1
+        newNode.index = len(self.leaves)
+        self.leaves.append(newNode)
         parent.children.append(newNode)
         self.__updateUpwards(newNode.parent)
+        self.updateCount += 1
+        if self.metrics is not None:
+            self.metrics.count("sampleTree.insert")
+        self.__checkDepth()
+        return newNode
 
-    # remove a given leaf node
+    # remove a given leaf node.  internal nodes that are left empty are
+    # removed and those left with a single child are replaced by the child.
+    # the removed nodes go to the free list, so the leaf (and its data)
+    # must not be used after it is removed
     def remove(self, node):
         assert len(node.children) == 0 and node.data is not None
         assert node.parent is not None
-        node.parent.children = [x for x in node.parent.children if x != node]
-        self.__updateUpwards(node.parent)    
+        parent = node.parent
+        parent.children = [x for x in parent.children if x is not node]
+        last = self.leaves.pop()
+        if last is not node:
+            last.index = node.index
+            self.leaves[node.index] = last
+        self.__releaseNode(node)
+        while parent is not self.root and len(parent.children) < 2:
+            grandParent = parent.parent
+            i = grandParent.children.index(parent)
+            if len(parent.children) == 0:
+                del grandParent.children[i]
+            else:
+                child = parent.children[0]
+                child.parent = grandParent
+                grandParent.children[i] = child
+            self.__releaseNode(parent)
+            parent = grandParent
+        # a root with a single internal child is one level too deep
+        if len(self.root.children) == 1 and \
+           self.root.children[0].data is None:
+            child = self.root.children[0]
+            self.root.children = child.children
+            for grandChild in child.children:
+                grandChild.parent = self.root
+            child.children = []
+            self.__releaseNode(child)
+            parent = self.root
+        self.__updateUpwards(parent)    
+        self.updateCount += 1
+        if self.metrics is not None:
+            self.metrics.count("sampleTree.remove")
+        self.__checkDepth()
+
+    # the largest depth allowed before the tree is rebuilt
+    def maxDepth(self):
+        levels = int(math.ceil(math.log(max(self.root.count, 2)) /
+                               math.log(self.degree)))
+        return 2 * levels + 2
+
+    def __checkDepth(self):
+        if self.root.height > self.maxDepth():
+            self.rebuild()
+
+    ##################################################################
+    # rebuild the tree into a complete tree of the given degree with
+    # the existing leaf nodes (which stay valid), in linear time
+    ##################################################################
+    def rebuild(self):
+        # (the leaves are taken in tree order, not from self.leaves, so
+        # that the tree samples the same way after it is rebuilt)
+        level = []
+        internal = []
+        for node in self.nodes():
+            if node.data is not None:
+                level.append(node)
+            elif node is not self.root:
+                internal.append(node)
+        for node in internal:
+            self.__releaseNode(node)
+        while len(level) > self.degree:
+            parents = []
+            for i in xrange(0, len(level), self.degree):
+                # a lone node is passed up rather than given a parent
+                if i + 1 == len(level):
+                    parents.append(level[i])
+                    break
+                parent = self.__newNode(None)
+                parent.children = level[i:i + self.degree]
+                for child in parent.children:
+                    child.parent = parent
+                self.__updateNode(parent)
+                parents.append(parent)
+            level = parents
+        self.root.children = level
+        for child in level:
+            child.parent = self.root
+        self.__updateNode(self.root)
+        self.rebuildCount += 1
+        if self.metrics is not None:
+            self.metrics.count("sampleTree.rebuild")
+
+    # remove all the elements (their nodes go to the free list)
+    def clear(self):
+        for node in list(self.nodes()):
+            if node is not self.root:
+                self.__releaseNode(node)
+        self.root.children = []
+        self.leaves = []
+        self.__updateNode(self.root)
+
+    # number of nodes allocated and reused (by insert) in a dictionary
+    def allocations(self):
+        return {"allocated" : self.allocCount, "reused" : self.reuseCount}
+
+    # number of edges on the longest path from the root to a leaf
+    def depth(self):
+        return self.root.height
+
+    # number of nodes (root, internal and leaves) in the tree
+    def nodeCount(self):
+        return sum(1 for x in self.nodes())
+
+    # mean number of children of the internal nodes, as a fraction of the
+    # degree (1 for a complete tree, 0 for an empty one)
+    def fillFactor(self):
+        internal = 0
+        children = 0
+        for node in self.nodes():
+            if node.data is None and len(node.children) > 0:
+                internal += 1
+                children += len(node.children)
+        if internal == 0:
+            return 0.
+        return float(children) / (internal * self.degree)
+
+    # depth, node count and fill factor (along with the number of elements
+    # and rebuilds) in a dictionary
+    def stats(self):
+        return {"size" : self.size(), "depth" : self.depth(),
+                "nodeCount" : self.nodeCount(),
+                "fillFactor" : self.fillFactor(),
+                "rebuilds" : self.rebuildCount}
 
     # how many data elememnts are in the tree
     def size(self):
@@ -86,59 +287,174 @@ class SampleTree(object):
     def weight(self):
         return self.root.weight
 
-    # uniformly sample a data element based on its weight
+    # uniformly sample a data element based on its weight, by a single
+    # descent for one target (the same one as uniformSampleMany)
     def uniformSample(self, node=None):
         if node is None:
             node = self.root
+            self.sampleCount += 1
         if node.weight == 0:
             return None
         x = random.randint(0, node.weight - 1)
-        tally = int(0)
+        while len(node.children) > 0:
+            for child in node.children:
+                if x < child.weight:
+                    node = child
+                    break
+                x -= child.weight
+            else:
+                assert False
+        assert x < node.weight
+        if self.metrics is not None:
+            self.metrics.addValue("sampleTree.depth", self.__leafDepth(node))
+        return (node, x)
+
+    # draw k weighted samples at once.  the k targets are sorted and
+    # resolved in a single descent, so the path shared by the samples
+    # is only walked once.  each target x is mapped to the same
+    # (node, offset) as the descent of uniformSample for x, so this
+    # gives the same samples as k calls to uniformSample.  the samples
+    # are returned in the order they were drawn
+    def uniformSampleMany(self, k, node=None):
+        if node is None:
+            node = self.root
+        if node.weight == 0:
+            return None
+        self.sampleCount += 1
+        targets = [random.randint(0, node.weight - 1) for i in xrange(k)]
+        order = sorted(xrange(k), key=lambda i: targets[i])
+        samples = [None] * k
+        self.__resolveSamples(node, targets, order, 0, samples)
+        return samples
+
+    # find the leaves of the (sorted by order) targets in node's subtree,
+    # where tally is the total weight to the left of node
+    def __resolveSamples(self, node, targets, order, tally, samples):
+        if len(node.children) == 0:
+            for i in order:
+                assert targets[i] - tally < node.weight
+                samples[i] = (node, targets[i] - tally)
+            if self.metrics is not None:
+                self.metrics.addValue("sampleTree.depth",
+                                      self.__leafDepth(node))
+            return
+        j = 0
         for child in node.children:
-            if x < tally + child.weight:
-                if len(child.children) == 0:
-                    assert x - tally < child.weight
-                    return (child, x - tally)
-                else:
-                    return self.uniformSample(child)
+            start = j
+            while j < len(order) and targets[order[j]] < tally + child.weight:
+                j += 1
+            if j > start:
+                self.__resolveSamples(child, targets, order[start:j], tally,
+                                      samples)
+            if j == len(order):
+                return
             tally += child.weight
         assert False
 
-    # iterate through the nodes containing data elements
-    #(stored in leaves) in the tree
+    # number of edges between a node and the root
+    def __leafDepth(self, node):
+        depth = 0
+        while node.parent is not None:
+            node = node.parent
+            depth += 1
+        return depth
+
+    # iterate through all the nodes (root, internal and leaves) of the
+    # subtree of node, parents before their children and children in
+    # order (with a stack rather than recursion)
     def nodes(self, node=None):
         if node is None:
             node = self.root
-        yield node
-        for child in node.children:
-            for recChild in self.nodes(child):
-                yield recChild
+        stack = [node]
+        while len(stack) > 0:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+    # iterate through the leaf nodes (those containing data elements)
+    # in the tree, in no particular order
+    def leafNodes(self):
+        return iter(self.leaves)
                 
     # iterate through the data elements (stored in leaves) in the tree
+    # (or the subtree of node)
     def dataElements(self, node=None):
         if node is None:
-            node = self.root
+            for leaf in self.leaves:
+                yield leaf.data
+            return
         for i in self.nodes(node):
             if i.data is not None:
                 yield i.data
+
+    # the (data, weight) of every element, in a list
+    def snapshot(self):
+        return [(x.data, x.weight) for x in self.leaves]
         
     # git a histogram of the node weights of data elements with whose
-    # types are instances of the given dataType
-    def histogram(self, binSize = 1, dataType=None, checkFn = None):
-        hist = defaultdict(int)
-        for node in self.nodes():
-            if node.data is not None and\
-               (dataType is None or issubclass(type(node.data), dataType)) and\
+    # types are instances of the given dataType.  the bins are given by
+    # scheme (a BinScheme), or are linear bins of binSize if it is None
+    def histogram(self, binSize = 1, dataType=None, checkFn = None,
+                  scheme = None):
+        if scheme is None:
+            scheme = BinScheme(binSize)
+        hist = Histogram(scheme)
+        for node in self.leaves:
+            if (dataType is None or issubclass(type(node.data), dataType)) and\
                (checkFn is None or checkFn(node.data) == True):
-                bin = int(node.weight) / int(binSize)
-                hist[bin] += 1
+                hist.add(node.weight)
         return hist
 
-    def printWeights(self, node):
-        print "%d " % node.weight
-        for child in node.children:
-            self.printWeights(child)
-        
-    
-    
-    
+    def printWeights(self, node=None):
+        for node in self.nodes(node):
+            print "%d " % node.weight
+
+
+##################################################################
+# time (in seconds per operation) drawing a pair of samples and
+# removing and re-inserting a leaf, for a tree of the given degree
+# holding the given (data, weight) elements
+##################################################################
+def measureDegree(elements, degree, trials=200):
+    tree = SampleTree(degree)
+    for data, weight in elements:
+        tree.insert(data, weight)
+    start = time.time()
+    for i in xrange(trials):
+        tree.uniformSampleMany(2)
+    sampleCost = (time.time() - start) / trials
+
+    leaves = list(tree.leafNodes())
+    start = time.time()
+    for i in xrange(trials):
+        leaf = leaves[i % len(leaves)]
+        data, weight = leaf.data, leaf.weight
+        tree.remove(leaf)
+        leaves[i % len(leaves)] = tree.insert(data, weight)
+    updateCost = (time.time() - start) / (2 * trials)
+    return sampleCost, updateCost
+
+##################################################################
+# the degree among the candidates with the smallest expected cost
+# per operation for the given tree, where the mix of samples and
+# updates is taken from what has been done on the tree so far.
+# returns the degree and a dictionary of the measurements
+##################################################################
+def tuneDegree(tree, degrees=(2, 3, 4, 6, 8, 16), trials=200):
+    ops = tree.sampleCount + tree.updateCount
+    sampleFraction = 0.5
+    if ops > 0:
+        sampleFraction = float(tree.sampleCount) / ops
+    elements = tree.snapshot()
+    costs = dict()
+    best = tree.degree
+    if len(elements) > 0:
+        for degree in degrees:
+            sampleCost, updateCost = measureDegree(elements, degree, trials)
+            costs[degree] = (sampleCost, updateCost,
+                             sampleFraction * sampleCost +
+                             (1. - sampleFraction) * updateCost)
+        best = min(costs.keys(), key=lambda d: costs[d][2])
+    return best, {"degree" : best, "sampleFraction" : sampleFraction,
+                  "samples" : tree.sampleCount, "updates" : tree.updateCount,
+                  "costs" : costs}
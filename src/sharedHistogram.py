@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey
+#
+#Released under the MIT license, see LICENSE.txt
+
+import os
+import sys
+import multiprocessing
+import Queue
+import numpy as np
+
+from histogram import BinScheme
+from histogram import Histogram
+
+""" Histograms of the replicates of a cell summed in shared memory.  When
+the replicates run in several (forked) processes, sending each one's
+histograms back to the parent to be merged costs more than simulating
+at fine bin sizes.  A SharedAccumulator is made before the processes
+are started, and each process adds the contigs of its pools straight
+into its own stripe of a dense array in shared memory (so they never
+wait on a lock).  The stripes are summed when read.
+
+The array has a row for each of the four basic categories, in the order
+of the tables of runSim (aliveCircular, aliveLinear, deadCircular,
+deadLinear: the row is 2 * dead + linear), and a column for each of the
+first bins (up to maxBins of them, so fine bins over a big genome don't
+take gigabytes); the other categories (overall, alive and dead) are
+sums of these.  The contigs in later bins are counted in a sparse
+overflow dictionary of each process, which sends it to the parent
+through a queue once it's done (there are only as many entries as
+contigs).  When all the workers have sent theirs, reduce adds the
+stripes into the first one in place, which is the table from then on.
+
+The stripes are a multiprocessing.RawArray seen through numpy (the
+shared_memory module is python 3.8 and up), so only forked processes
+can use them.  A pickled accumulator keeps just the summed table and
+overflow.
+
+"""
+
+# the categories of the rows, in order
+categories = ["aliveCircular", "aliveLinear", "deadCircular", "deadLinear"]
+
+# the other categories as sums of rows
+derivedCategories = {"overall" : [0, 1, 2, 3], "alive" : [0, 1],
+                     "dead" : [2, 3]}
+
+# default limit on the dense bins
+maxDenseBins = 1 << 16
+
+class SharedAccumulator(object):
+    ##################################################################
+    # stripes for numWorkers processes, with dense bins for the sizes
+    # up to maxSize (binned by scheme), or the first maxBins of them
+    ##################################################################
+    def __init__(self, numWorkers, maxSize, scheme=None,
+                 maxBins=maxDenseBins):
+        if scheme is None:
+            scheme = BinScheme()
+        self.scheme = scheme
+        self.numWorkers = numWorkers
+        self.numBins = min(scheme.binIndex(maxSize) + 1, maxBins)
+        shape = (numWorkers, len(categories), self.numBins)
+        self.buffer = multiprocessing.RawArray('d', int(np.prod(shape)))
+        self.stripes = np.frombuffer(self.buffer, dtype=float).reshape(shape)
+        # number of replicates added by each worker
+        self.counts = np.frombuffer(multiprocessing.RawArray('l', numWorkers),
+                                    dtype=np.dtype('l'))
+        # counts of the (row, bin)s past the dense bins, in this process
+        self.overflow = dict()
+        self.channel = multiprocessing.Queue()
+        self.reduced = numWorkers == 1
+
+    ##################################################################
+    # add the contigs of a Model's pool (a SampleTree or BucketSampler)
+    # as a replicate of the given worker
+    ##################################################################
+    def addPool(self, worker, pool):
+        leaves = [x for x in pool.leafNodes() if x.data is not None]
+        rows = np.fromiter((2 * x.data.isDead() + x.data.isLinear() for x
+                            in leaves), dtype=np.int64, count=len(leaves))
+        weights = np.fromiter((x.weight for x in leaves), dtype=float,
+                              count=len(leaves))
+        self.__add(worker, rows, self.scheme.binIndices(weights))
+        self.counts[worker] += 1
+
+    # add the histograms of a replicate (as made by Experiment) of the
+    # given worker
+    def addHistograms(self, worker, histograms):
+        for row, name in enumerate(categories):
+            pairs = np.array(list(histograms[name].iteritems()),
+                             dtype=float).reshape(-1, 2)
+            self.__add(worker, np.repeat(row, len(pairs)),
+                       pairs[:, 0].astype(np.int64), pairs[:, 1])
+        self.counts[worker] += 1
+
+    def __add(self, worker, rows, bins, weights=None):
+        if weights is None:
+            weights = np.ones(len(bins))
+        dense = bins < self.numBins
+        np.add.at(self.stripes[worker], (rows[dense], bins[dense]),
+                  weights[dense])
+        for row, index, weight in zip(rows[~dense], bins[~dense],
+                                      weights[~dense]):
+            key = (int(row), int(index))
+            self.overflow[key] = self.overflow.get(key, 0.) + weight
+
+    ##################################################################
+    # send the overflow of this (worker) process to the parent, once
+    # it has added all its replicates
+    ##################################################################
+    def send(self):
+        self.channel.put(self.overflow)
+        self.overflow = dict()
+
+    ##################################################################
+    # in the parent: take in the overflows sent by the given worker
+    # processes (waiting for them, so before joining them), then add
+    # the stripes and counts into the first ones in place
+    ##################################################################
+    def reduce(self, workers=[]):
+        received = 0
+        while received < len(workers):
+            try:
+                overflow = self.channel.get(timeout=1)
+            except Queue.Empty:
+                if not any(x.is_alive() for x in workers):
+                    raise RuntimeError("a worker exited without sending "
+                                       "its histograms")
+                continue
+            for key, count in overflow.iteritems():
+                self.overflow[key] = self.overflow.get(key, 0.) + count
+            received += 1
+        for worker in xrange(1, self.numWorkers):
+            self.stripes[0] += self.stripes[worker]
+            self.stripes[worker] = 0
+            self.counts[0] += self.counts[worker]
+            self.counts[worker] = 0
+        self.reduced = True
+
+    # number of replicates added
+    def replicates(self):
+        return int(self.counts.sum())
+
+    def __len__(self):
+        return self.replicates()
+
+    ##################################################################
+    # the summed table of the dense bins (a row for each of
+    # categories).  once reduced this is the first stripe itself, not a
+    # copy
+    ##################################################################
+    def table(self):
+        if self.reduced:
+            return self.stripes[0]
+        return self.stripes.sum(axis=0)
+
+    # the summed table of the dense bins (see table) and the tail of
+    # each row: a dictionary of its counts in the overflow bins, so the
+    # bins past the dense ones are never made dense
+    def fullTable(self):
+        tails = [dict() for name in categories]
+        for (row, index), count in self.overflow.iteritems():
+            tails[row][index] = count
+        return self.table(), tails
+
+    # the summed histogram of a category (of categories or
+    # derivedCategories)
+    def histogram(self, name):
+        table = self.table()
+        if name in derivedCategories:
+            rows = derivedCategories[name]
+        else:
+            rows = [categories.index(name)]
+        row = table[rows].sum(axis=0)
+        res = Histogram(self.scheme)
+        for index in np.flatnonzero(row):
+            res.addBin(int(index), row[index])
+        for (r, index), count in sorted(self.overflow.iteritems()):
+            if r in rows:
+                res.addBin(index, count)
+        return res
+
+    # the summed histograms of every category
+    def histograms(self):
+        return dict((name, self.histogram(name)) for name in
+                    categories + derivedCategories.keys())
+
+    # add the replicates of another accumulator (or a list of
+    # replicate histograms)
+    def extend(self, other):
+        if isinstance(other, SharedAccumulator):
+            assert other.scheme == self.scheme
+            table = other.table()
+            rows, bins = np.nonzero(table)
+            self.__add(0, rows, bins, table[rows, bins])
+            if len(other.overflow) > 0:
+                keys = other.overflow.keys()
+                self.__add(0, np.array([x[0] for x in keys], dtype=np.int64),
+                           np.array([x[1] for x in keys], dtype=np.int64),
+                           np.array([other.overflow[x] for x in keys]))
+            self.counts[0] += other.replicates()
+        else:
+            for histograms in other:
+                self.addHistograms(0, histograms)
+
+    # (pickled as a single stripe holding the summed table, and the
+    # overflow)
+    def __getstate__(self):
+        return {"scheme" : self.scheme, "table" : np.array(self.table()),
+                "replicates" : self.replicates(),
+                "overflow" : self.overflow}
+
+    def __setstate__(self, state):
+        self.scheme = state["scheme"]
+        self.numWorkers = 1
+        self.numBins = state["table"].shape[1]
+        self.buffer = None
+        self.stripes = state["table"].reshape((1,) + state["table"].shape)
+        self.counts = np.array([state["replicates"]], dtype=np.dtype('l'))
+        self.overflow = state.get("overflow", dict())
+        self.channel = None
+        self.reduced = True
@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey
+#
+#Released under the MIT license, see LICENSE.txt
+
+import argparse
+import cPickle
+import errno
+import hashlib
+import json
+import os
+import sys
+import socket
+import threading
+import time
+
+from bucketSampler import BucketSampler
+from experimentServer import sweepTasks
+from experimentServer import runTask
+from experimentServer import decodeResult
+
+""" Work queue of Experiment replicates in a shared directory, so that
+a sweep can be run by workers on any host that mounts it, with no broker.
+
+The queue directory has a task file for each replicate of each cell
+(in tasks/, in the sweep format of experimentServer with one replicate
+and its own seed).  The id of a task includes a hash of its options (bin
+scheme, engine, pool and thinning), so a sweep submitted again with
+other options gets new tasks rather than the old results.  A worker claims a task by creating its lease file
+(in leases/) exclusively, and touches the lease every heartbeat seconds
+while it runs the task.  A lease that hasn't been touched for leaseTime
+seconds has expired (its worker died or hung) and can be taken over by
+another worker.  The worker taking over first creates a marker named
+after the expired lease's modification time, exclusively, so only one
+worker takes over a given expiry, and then renames the lease away.  If
+the renamed lease turns out to have been renewed meanwhile (its holder
+came back), it is put back.  The result of a task is pickled to a temporary file that
+is renamed into results/, so it appears all at once, and a task that
+fails leaves its traceback in failed/.  As the seed is in the task, a
+task that ends up run twice gives the same result both times.
+
+The coordinator (WorkQueue.submit, wait and collect) writes the tasks
+of an Experiment and reads the results back into it, in the same format
+as Experiment.run (one histogram dictionary per replicate, in order).
+
+"""
+
+##################################################################
+# a queue directory (shared by the coordinator and the workers)
+##################################################################
+class WorkQueue(object):
+    def __init__(self, path, leaseTime=60.):
+        self.path = path
+        self.leaseTime = leaseTime
+        for name in ("tasks", "leases", "results", "failed"):
+            directory = os.path.join(path, name)
+            if not os.path.isdir(directory):
+                try:
+                    os.makedirs(directory)
+                except OSError, e:
+                    if e.errno != errno.EEXIST:
+                        raise
+
+    def taskPath(self, taskId):
+        return os.path.join(self.path, "tasks", taskId + ".json")
+
+    def leasePath(self, taskId):
+        return os.path.join(self.path, "leases", taskId + ".lease")
+
+    def resultPath(self, taskId):
+        return os.path.join(self.path, "results", taskId + ".pickle")
+
+    def failedPath(self, taskId):
+        return os.path.join(self.path, "failed", taskId + ".txt")
+
+    ##################################################################
+    # write the tasks of every replicate of every cell of an experiment
+    # (replicate rep of a cell is seeded with seed + rep).  returns the
+    # task ids by cell key
+    ##################################################################
+    def submit(self, exp, replicates=1, binSize=1, seed=0):
+        exp.replicates = replicates
+        exp.binSize = binSize
+        scheme = exp.getBinScheme()
+        options = {"replicates" : 1, "binSize" : binSize,
+                   "engine" : exp.engine,
+                   "pool" : "bucket" if exp.poolType is BucketSampler
+                   else "tree",
+                   "thinning" : getattr(exp, "thinning", False)}
+        if scheme.isLog():
+            options["logBase"] = scheme.logBase
+            options["linearLimit"] = scheme.linearLimit
+        digest = hashlib.md5(json.dumps(options, sort_keys=True)).hexdigest()
+        res = dict()
+        for params in exp.parameterSpace:
+            for state in exp.startingStateSpace:
+                key = params + state
+                res[key] = []
+                for rep in xrange(replicates):
+                    taskId = "%s_%s_seed%d_rep%d" % (
+                        "_".join(str(x) for x in key), digest[:12], seed, rep)
+                    task = dict(options)
+                    task["parameterSets"] = [list(params)]
+                    task["startingStates"] = [list(state)]
+                    task["seed"] = seed + rep
+                    if not os.path.exists(self.taskPath(taskId)):
+                        publish(self.taskPath(taskId), json.dumps(task))
+                    res[key].append(taskId)
+        return res
+
+    # the ids of all the tasks
+    def taskIds(self):
+        return sorted(x[:-len(".json")] for x in
+                      os.listdir(os.path.join(self.path, "tasks"))
+                      if x.endswith(".json"))
+
+    def isFinished(self, taskId):
+        return os.path.exists(self.resultPath(taskId)) or \
+               os.path.exists(self.failedPath(taskId))
+
+    # the tasks that have neither a result nor failed
+    def pending(self):
+        return [x for x in self.taskIds() if not self.isFinished(x)]
+
+    ##################################################################
+    # wait for the given tasks (all by default) to finish.  returns
+    # False if they didn't in timeout seconds
+    ##################################################################
+    def wait(self, taskIds=None, timeout=None, poll=1.):
+        start = time.time()
+        while True:
+            if taskIds is None:
+                left = self.pending()
+            else:
+                left = [x for x in taskIds if not self.isFinished(x)]
+            if len(left) == 0:
+                return True
+            if timeout is not None and time.time() - start > timeout:
+                return False
+            time.sleep(poll)
+
+    ##################################################################
+    # read the results of the tasks (as returned by submit) into an
+    # experiment.  a failed task raises a RuntimeError with its traceback
+    ##################################################################
+    def collect(self, exp, tasks):
+        scheme = exp.getBinScheme()
+        for key, taskIds in tasks.items():
+            exp.results[key] = []
+            exp.metadata[key] = []
+            for taskId in taskIds:
+                if os.path.exists(self.failedPath(taskId)):
+                    raise RuntimeError("task %s failed:\n%s" % (
+                        taskId, open(self.failedPath(taskId)).read()))
+                resultFile = open(self.resultPath(taskId), "rb")
+                results, metadata = cPickle.load(resultFile)
+                resultFile.close()
+                exp.results[key].extend(decodeResult(x, scheme)
+                                        for x in results)
+                exp.metadata[key].extend(metadata)
+        return exp
+
+    ##################################################################
+    # take the lease of a task for a worker.  returns False if another
+    # worker holds a live lease (or the task is finished)
+    ##################################################################
+    def claim(self, taskId, workerId):
+        if self.isFinished(taskId):
+            return False
+        path = self.leasePath(taskId)
+        for attempt in xrange(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except OSError, e:
+                if e.errno != errno.EEXIST:
+                    raise
+                if attempt > 0 or not self.__breakExpired(path, workerId):
+                    return False
+                continue
+            os.write(fd, workerId)
+            os.close(fd)
+            # (the task may have finished while the lease was free)
+            if self.isFinished(taskId):
+                self.release(taskId, workerId)
+                return False
+            return True
+        return False
+
+    # touch a lease, returning False if the worker lost it
+    def heartbeat(self, taskId, workerId):
+        if self.leaseHolder(taskId) != workerId:
+            return False
+        try:
+            os.utime(self.leasePath(taskId), None)
+        except OSError:
+            return False
+        return True
+
+    # the worker holding the lease of a task (None if there's none)
+    def leaseHolder(self, taskId):
+        try:
+            leaseFile = open(self.leasePath(taskId))
+        except IOError:
+            return None
+        holder = leaseFile.read()
+        leaseFile.close()
+        return holder
+
+    def release(self, taskId, workerId):
+        if self.leaseHolder(taskId) == workerId:
+            try:
+                os.remove(self.leasePath(taskId))
+            except OSError:
+                pass
+            # (a stale takeover fails without its marker too, as the
+            # lease it renames wouldn't have the expired time)
+            prefix = os.path.basename(self.leasePath(taskId)) + ".takeover."
+            for name in os.listdir(os.path.join(self.path, "leases")):
+                if name.startswith(prefix):
+                    try:
+                        os.remove(os.path.join(self.path, "leases", name))
+                    except OSError:
+                        pass
+
+    # take over an expired lease (see above).  returns True if this
+    # worker did, or the lease was released in the meantime
+    def __breakExpired(self, path, workerId):
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            # released in the meantime
+            return True
+        if time.time() - mtime < self.leaseTime:
+            return False
+        return self.takeOver(path, workerId, mtime)
+
+    ##################################################################
+    # rename away the lease at path that had expired with the given
+    # modification time.  returns False if another worker took over
+    # that expiry, or the lease was renewed
+    ##################################################################
+    def takeOver(self, path, workerId, mtime):
+        marker = "%s.takeover.%.6f" % (path, mtime)
+        try:
+            fd = os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+            return False
+        os.write(fd, workerId)
+        os.close(fd)
+        expired = "%s.expired.%s" % (path, workerId)
+        try:
+            os.rename(path, expired)
+        except OSError:
+            return False
+        # (the holder may have touched it since it was looked at.  if
+        # another worker has made a lease in the meantime the holder's
+        # is lost, and the task is run twice, with the same seed)
+        if "%.6f" % os.stat(expired).st_mtime != "%.6f" % mtime:
+            try:
+                os.link(expired, path)
+            except OSError, e:
+                if e.errno != errno.EEXIST:
+                    raise
+            os.remove(expired)
+            return False
+        os.remove(expired)
+        return True
+
+# write a file atomically (through a temporary file in the same
+# directory, renamed to the path)
+def publish(path, data):
+    temp = "%s.tmp.%s.%d" % (path, socket.gethostname(), os.getpid())
+    outFile = open(temp, "wb")
+    outFile.write(data)
+    outFile.close()
+    os.rename(temp, path)
+
+# a worker id unique across hosts
+def workerName():
+    return "%s.%d" % (socket.gethostname(), os.getpid())
+
+##################################################################
+# a worker: claims tasks of a queue and runs them until none is left
+##################################################################
+class Worker(object):
+    def __init__(self, queue, workerId=None, heartbeat=10.):
+        self.queue = queue
+        if workerId is None:
+            workerId = workerName()
+        self.workerId = workerId
+        self.heartbeatTime = heartbeat
+
+    ##################################################################
+    # run tasks until every task of the queue is finished (or maxTasks
+    # have been run).  while the only tasks left are leased by other
+    # workers, it waits (poll seconds) in case their leases expire.
+    # returns the number of tasks run
+    ##################################################################
+    def run(self, maxTasks=None, poll=1.):
+        count = 0
+        while maxTasks is None or count < maxTasks:
+            pending = self.queue.pending()
+            if len(pending) == 0:
+                break
+            claimed = None
+            for taskId in pending:
+                if self.queue.claim(taskId, self.workerId):
+                    claimed = taskId
+                    break
+            if claimed is None:
+                time.sleep(poll)
+                continue
+            self.runTask(claimed)
+            count += 1
+        return count
+
+    # run a claimed task, keeping its lease alive, and publish the result
+    def runTask(self, taskId):
+        stop = threading.Event()
+        def beat():
+            while not stop.wait(self.heartbeatTime):
+                if not self.queue.heartbeat(taskId, self.workerId):
+                    break
+        beater = threading.Thread(target=beat)
+        beater.daemon = True
+        beater.start()
+        try:
+            taskFile = open(self.queue.taskPath(taskId))
+            task = sweepTasks(json.load(taskFile))[0]
+            taskFile.close()
+            result = runTask(task)
+        finally:
+            stop.set()
+            beater.join()
+        if result[0] == "done":
+            publish(self.queue.resultPath(taskId),
+                    cPickle.dumps((result[1], result[2]),
+                                  cPickle.HIGHEST_PROTOCOL))
+        else:
+            publish(self.queue.failedPath(taskId), result[1])
+        self.queue.release(taskId, self.workerId)
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    parser = argparse.ArgumentParser(
+        description='Run the tasks of a shared work queue directory.')
+    parser.add_argument('queueDir', type=str, help='Queue directory.')
+    parser.add_argument('--leaseTime', type=float, default=60,
+                        help='Seconds after which the lease of a worker that '
+                        'stopped sending heartbeats expires. default=%(default)s')
+    parser.add_argument('--heartbeat', type=float, default=10,
+                        help='Seconds between heartbeats. default=%(default)s')
+    parser.add_argument('--maxTasks', type=int, default=None,
+                        help='Stop after this many tasks. default=no limit')
+    parser.add_argument('--poll', type=float, default=5,
+                        help='Seconds to wait when all the tasks left are '
+                        'leased. default=%(default)s')
+    args = parser.parse_args(argv[1:])
+    worker = Worker(WorkQueue(args.queueDir, args.leaseTime),
+                    heartbeat=args.heartbeat)
+    count = worker.run(args.maxTasks, args.poll)
+    print "%s ran %d tasks" % (worker.workerId, count)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey (hickey@soe.ucsc.edu)
+#
+#Released under the MIT license, see LICENSE.txt
+import unittest
+import sys
+import os
+import random
+import math
+import tempfile
+
+from contigSim.src.abcSmc import AbcSmc
+from contigSim.src.abcSmc import histogramDistance
+from contigSim.src.abcSmc import loadObserved
+from contigSim.src.abcSmc import poolHistogram
+from contigSim.src.model import Model
+from contigSim.src.histogram import BinScheme
+from contigSim.src.histogram import Histogram
+
+from sonLib.bioio import TestStatus
+from sonLib.bioio import system
+from sonLib.bioio import getLogLevelString
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testNo = TestStatus.getTestSetup()
+        self.tempFiles = []
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self):
+        for tempFile in self.tempFiles:
+            os.remove(tempFile)
+        unittest.TestCase.tearDown(self)
+
+    def testDistance(self):
+        scheme = BinScheme(10)
+        a = Histogram(scheme)
+        a.add(15, 2)
+        a.add(55, 1)
+        assert histogramDistance(a, a) == 0
+        b = Histogram(scheme)
+        b.add(15, 4)
+        b.add(55, 2)
+        # same distribution of bases, twice the contigs
+        assert abs(histogramDistance(a, b) - abs(math.log(0.5))) < 1e-9
+        c = Histogram(scheme)
+        c.add(95, 3)
+        assert abs(histogramDistance(a, c) - 1 - abs(math.log(1.))) < 1e-9
+
+    def testLoadObserved(self):
+        path = tempfile.mktemp()
+        self.tempFiles.append(path)
+        observed = open(path, "w")
+        observed.write("# size count\n15 2\n55\n\n17 1\n")
+        observed.close()
+        hist = loadObserved(path, BinScheme(10))
+        assert hist == {1 : 3, 5 : 1}
+
+    def testFit(self):
+        # data simulated with fl = 0.8
+        N = 1000
+        scheme = BinScheme(10, 2, 40)
+        random.seed(3)
+        model = Model()
+        model.setParameters(N, 1.0 / N, 0, 0, 0.8, 0.1)
+        model.setStartingState(0, 20, 0)
+        model.simulate(150)
+        observed = poolHistogram(model, "alive", scheme)
+        abc = AbcSmc(observed, {"fl" : (0., 1.), "rll" : (0.1 / N, 10. / N,
+                                                          "log")},
+                     150, N, (0, 20, 0), fixed={"fg" : 0.1},
+                     populationSize=20, earlyFactor=3., seed=2)
+        samples, weights = abc.run(maxGenerations=3)
+        assert len(samples) == 20
+        assert abs(sum(weights) - 1) < 1e-9
+        assert sum(x["simulations"] for x in abc.history) == abc.simulations
+        epsilons = [x["epsilon"] for x in abc.history]
+        assert epsilons == sorted(epsilons, reverse=True)
+        for sample in samples:
+            assert 0 <= sample["fl"] <= 1
+            assert 0.1 / N <= sample["rll"] <= 10. / N
+        assert abc.parameters(abc.particles[0])[5:7] == \
+               (samples[0]["fl"], 0.1)
+        # the number of contigs pins down the loss rate
+        mean = abc.posteriorMean()
+        assert abs(mean["fl"] - 0.8) < 0.35
+
+def main():
+    parseCactusSuiteTestOptions()
+    sys.argv = sys.argv[:1]
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey (hickey@soe.ucsc.edu)
+#
+#Released under the MIT license, see LICENSE.txt
+import unittest
+import sys
+import os
+
+from contigSim.src.adaptiveSweep import AdaptiveSweep
+from contigSim.src.histogram import Histogram
+
+from sonLib.bioio import TestStatus
+from sonLib.bioio import system
+from sonLib.bioio import getLogLevelString
+
+# a sweep whose results jump where fl crosses 0.3 (and don't depend
+# on the other parameters), without simulating
+class StepSweep(AdaptiveSweep):
+    def evaluate(self, points):
+        for point in points:
+            if (point, self.startingStates[0]) in self.histograms:
+                continue
+            hist = Histogram()
+            fl = self.parameters(point)[5]
+            hist.add(10 if fl < 0.3 else 100, 5)
+            self.histograms[(point, self.startingStates[0])] = hist
+            self.simulations += self.replicates
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testNo = TestStatus.getTestSetup()
+        self.tempFiles = []
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self):
+        for tempFile in self.tempFiles:
+            os.remove(tempFile)
+        unittest.TestCase.tearDown(self)
+
+    def testRefineStep(self):
+        sweep = StepSweep(100, {"fl" : (0., 1.)}, [(0, 5, 0)],
+                          fixed={"N" : 1000}, initial=3, replicates=10,
+                          budget=1000, minWidth=1. / 256)
+        sweep.run()
+        points = [x[0] for x in sweep.points()]
+        # only the box around the step is refined, down to minWidth
+        refined = [x for x in points if x not in (0., 0.5, 1.)]
+        assert all(0.25 <= x <= 0.375 for x in refined)
+        assert len(refined) == 7
+        crossing = [x for x in sweep.report() if x["score"] > 0.1]
+        assert len(crossing) == 1
+        assert crossing[0]["upper"]["fl"] - crossing[0]["lower"]["fl"] < \
+               1. / 128
+        assert crossing[0]["lower"]["fl"] < 0.3 < crossing[0]["upper"]["fl"]
+
+    def testBudget(self):
+        sweep = StepSweep(100, {"fl" : (0., 1.), "rll" : (1e-4, 1e-2, "log")},
+                          [(0, 5, 0)], fixed={"N" : 1000}, initial=3,
+                          replicates=10, budget=150)
+        sweep.run()
+        assert sweep.simulations <= 150
+        # 9 points to start, then cuts of 2 points along fl
+        assert len(sweep.points()) == 15
+        for point in sweep.points():
+            params = sweep.parameters(point)
+            assert 1e-4 * 0.999 < params[2] < 1e-2 * 1.001
+
+    def testFirstGridBudget(self):
+        # 3^4 points of 10 simulations
+        sweep = StepSweep(100, {"rll" : (1e-4, 1e-2), "rld" : (0., 1e-3),
+                                "fl" : (0., 1.), "fg" : (0., 1.)},
+                          [(0, 5, 0)], fixed={"N" : 1000}, initial=3,
+                          replicates=10, budget=500)
+        self.assertRaises(ValueError, sweep.run)
+        assert sweep.simulations == 0
+        sweep.budget = 810
+        sweep.run()
+        assert sweep.simulations == 810
+
+    def testSweep(self):
+        sweep = AdaptiveSweep(100, {"fl" : (0., 1.)}, [(0, 10, 0)],
+                              fixed={"N" : 500, "rll" : 0.002}, initial=3,
+                              tolerance=0.05, replicates=2, budget=12)
+        exp = sweep.run()
+        assert sweep.simulations <= 12
+        assert len(exp.results) == len(sweep.points())
+        for results in exp.results.values():
+            assert len(results) == 2
+
+def main():
+    parseCactusSuiteTestOptions()
+    sys.argv = sys.argv[:1]
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
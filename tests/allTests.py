@@ -12,6 +12,21 @@ from contigSim.tests.eventQueueTests import TestCase as eventQueueTest
 from contigSim.tests.contigTests import TestCase as contigTest
 from contigSim.tests.dcjTests import TestCase as dcjTest
 from contigSim.tests.modelTests import TestCase as modelTest
+from contigSim.tests.ensembleTests import TestCase as ensembleTest
+from contigSim.tests.populationModelTests import TestCase as populationModelTest
+from contigSim.tests.meanFieldTests import TestCase as meanFieldTest
+from contigSim.tests.bucketSamplerTests import TestCase as bucketSamplerTest
+from contigSim.tests.metricsTests import TestCase as metricsTest
+from contigSim.tests.journalTests import TestCase as journalTest
+from contigSim.tests.histogramTests import TestCase as histogramTest
+from contigSim.tests.differentialTests import TestCase as differentialTest
+from contigSim.tests.experimentServerTests import TestCase as experimentServerTest
+from contigSim.tests.workQueueTests import TestCase as workQueueTest
+from contigSim.tests.sharedHistogramTests import TestCase as sharedHistogramTest
+from contigSim.tests.abcSmcTests import TestCase as abcSmcTest
+from contigSim.tests.adaptiveSweepTests import TestCase as adaptiveSweepTest
+from contigSim.tests.emulatorTests import TestCase as emulatorTest
+from contigSim.tests.runSimTests import TestCase as runSimTest
 
 def allSuites(): 
     allTests =unittest.TestSuite(
@@ -19,7 +34,22 @@ def allSuites():
          unittest.makeSuite(eventQueueTest, 'test'),
          unittest.makeSuite(contigTest, 'test'),
          unittest.makeSuite(dcjTest, 'test'),
-         unittest.makeSuite(modelTest, 'test')))
+         unittest.makeSuite(modelTest, 'test'),
+         unittest.makeSuite(ensembleTest, 'test'),
+         unittest.makeSuite(populationModelTest, 'test'),
+         unittest.makeSuite(meanFieldTest, 'test'),
+         unittest.makeSuite(bucketSamplerTest, 'test'),
+         unittest.makeSuite(metricsTest, 'test'),
+         unittest.makeSuite(journalTest, 'test'),
+         unittest.makeSuite(histogramTest, 'test'),
+         unittest.makeSuite(differentialTest, 'test'),
+         unittest.makeSuite(experimentServerTest, 'test'),
+         unittest.makeSuite(workQueueTest, 'test'),
+         unittest.makeSuite(sharedHistogramTest, 'test'),
+         unittest.makeSuite(abcSmcTest, 'test'),
+         unittest.makeSuite(adaptiveSweepTest, 'test'),
+         unittest.makeSuite(emulatorTest, 'test'),
+         unittest.makeSuite(runSimTest, 'test')))
     return allTests
         
 def main():    
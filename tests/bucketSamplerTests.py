@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey (hickey@soe.ucsc.edu)
+#
+#Released under the MIT license, see LICENSE.txt
+import unittest
+import sys
+import os
+import random
+from collections import defaultdict
+
+from contigSim.src.bucketSampler import BucketSampler
+from contigSim.src.model import Model
+
+from sonLib.bioio import TestStatus
+from sonLib.bioio import system
+from sonLib.bioio import getLogLevelString
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testNo = TestStatus.getTestSetup()
+        self.tempFiles = []
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self):
+        for tempFile in self.tempFiles:
+            os.remove(tempFile)
+        unittest.TestCase.tearDown(self)
+
+    def testBucketSamplerConstruct(self):
+        pool = BucketSampler()
+        assert pool.size() == 0
+
+        pool.insert("cat", 3)
+        pool.insert("bear", 100)
+        pool.insert("rabbit", 100)
+        pool.insert("snail", 0)
+        assert pool.size() == 4
+        assert pool.weight() == 203
+
+    def testBucketSamplerRemove(self):
+        pool = BucketSampler()
+        for i in range(0,1000):
+            pool.insert(str(i), i)
+
+        for node in list(pool.nodes()):
+            if node.weight == 100 or node.weight == 3 or node.weight == 0:
+                pool.remove(node)
+
+        assert pool.size() == 997
+        assert pool.weight() == (999 * 1000) / 2 - 103
+        count = 0
+        for elem in pool.dataElements():
+            assert int(elem) not in (0, 3, 100)
+            count += 1
+        assert count == 997
+
+    def testBucketSamplerHistogram(self):
+        pool = BucketSampler()
+        for i in range(0,100):
+            pool.insert(str(i), i)
+
+        hist = pool.histogram()
+        for i in range(0,100):
+            assert hist[i] == 1
+
+        hist = pool.histogram(2, object)
+        for i in range(0, 50):
+            assert hist[i] == 2
+
+    def testBucketSamplerUniform(self):
+        random.seed(0)
+        pool = BucketSampler()
+        pool.insert("a", 1)
+        pool.insert("b", 3)
+        pool.insert("c", 1000)
+        counts = defaultdict(int)
+        for i in xrange(20000):
+            node, offset = pool.uniformSample()
+            assert offset >= 0 and offset < node.weight
+            counts[node.data] += 1
+        assert counts["c"] > 19800
+        assert counts["b"] > 20 and counts["b"] < 130
+
+    def testBucketSamplerModel(self):
+        model = Model(poolType=BucketSampler)
+        model.setParameters(10000, 0.00001, 0.00001, 0.00001, 0.1, 0.1, 0.5)
+        model.setStartingState(100, 30, 30)
+        assert model.pool.size() == 61
+        model.simulate(10000)
+        assert model.pool.size() > 0
+
+def main():
+    parseCactusSuiteTestOptions()
+    sys.argv = sys.argv[:1]
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
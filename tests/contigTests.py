@@ -9,6 +9,8 @@ import os
 import copy
 from contigSim.src.contig import CircularContig
 from contigSim.src.contig import LinearContig
+from contigSim.src.contig import ContigPool
+from contigSim.src.dcj import dcj
 
 from sonLib.bioio import TestStatus
 from sonLib.bioio import system
@@ -58,6 +60,34 @@ class TestCase(unittest.TestCase):
         cc1 = l.join(r)
         assert cc1.numBases() == 5
         
+    def testContigPool(self):
+        pool = ContigPool()
+        lc = pool.make(LinearContig, 10)
+        lc.setDead()
+        pool.release(lc)
+        lc2 = pool.make(LinearContig, 5)
+        assert lc2 is lc
+        assert lc2.size == 5 and not lc2.isDead()
+        cc = pool.make(CircularContig, 5)
+        assert type(cc) == CircularContig and cc is not lc
+        assert pool.counts() == {"allocated" : 2, "reused" : 1,
+                                 "released" : 1}
+        # dcj makes the same contigs with a pool as without one
+        for forward in (True, False):
+            for c1, c2 in ((LinearContig(10), LinearContig(20)),
+                           (LinearContig(10), CircularContig(20)),
+                           (CircularContig(10), CircularContig(20))):
+                res = dcj(c1, 3, c2, 7, forward)
+                pooled = dcj(c1, 3, c2, 7, forward, pool)
+                assert [(type(x), x.size) for x in res] == \
+                       [(type(x), x.size) for x in pooled]
+            for c1 in (LinearContig(10), CircularContig(10)):
+                res = dcj(c1, 3, c1, 7, forward)
+                pooled = dcj(c1, 3, c1, 7, forward, pool)
+                assert [(type(x), x.size) for x in res] == \
+                       [(type(x), x.size) for x in pooled]
+        assert pool.reuseCount > 1
+
 def main():
     parseCactusSuiteTestOptions()
     sys.argv = sys.argv[:1]
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey (hickey@soe.ucsc.edu)
+#
+#Released under the MIT license, see LICENSE.txt
+import unittest
+import sys
+import os
+import random
+
+from contigSim.src.differential import DifferentialTest
+from contigSim.src.differential import addDefaultConfigurations
+from contigSim.src.differential import modelEngine
+from contigSim.src.differential import ensembleEngine
+from contigSim.src.differential import ksTest
+from contigSim.src.differential import chiSquareTest
+from contigSim.src.differential import chiSquareQ
+from contigSim.src.differential import kolmogorovQ
+from contigSim.src.sampleTree import SampleTree
+from contigSim.src.bucketSampler import BucketSampler
+
+from sonLib.bioio import TestStatus
+from sonLib.bioio import system
+from sonLib.bioio import getLogLevelString
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testNo = TestStatus.getTestSetup()
+        self.tempFiles = []
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self):
+        for tempFile in self.tempFiles:
+            os.remove(tempFile)
+        unittest.TestCase.tearDown(self)
+
+    def testDistributions(self):
+        # 95% quantiles
+        assert abs(chiSquareQ(3.841, 1) - 0.05) < 1e-3
+        assert abs(chiSquareQ(18.307, 10) - 0.05) < 1e-3
+        assert abs(kolmogorovQ(1.358) - 0.05) < 1e-3
+        assert chiSquareQ(0, 3) == 1. and kolmogorovQ(0) == 1.
+
+    def testTwoSampleTests(self):
+        random.seed(1)
+        x = [random.gauss(0, 1) for i in range(300)]
+        y = [random.gauss(0, 1) for i in range(300)]
+        z = [random.gauss(1, 1) for i in range(300)]
+        d, p = ksTest(x, x)
+        assert d == 0 and p == 1.
+        assert ksTest(x, y)[1] > 0.001
+        assert ksTest(x, z)[1] < 1e-6
+        a = [random.randint(0, 4) for i in range(500)]
+        b = [random.randint(0, 4) for i in range(500)]
+        c = [min(random.randint(0, 8), 4) for i in range(500)]
+        stat, dof, p = chiSquareTest(a, b)
+        assert dof == 4 and p > 0.001
+        assert chiSquareTest(a, c)[2] < 1e-6
+
+    def runEngines(self, candidate, t=100):
+        test = DifferentialTest(modelEngine(SampleTree), candidate,
+                                replicates=60, alpha=0.001, seed=0)
+        addDefaultConfigurations(test, t)
+        results = test.run()
+        assert len(results) > 20
+        return test
+
+    def testBucketSamplerMatchesModel(self):
+        test = self.runEngines(modelEngine(BucketSampler))
+        assert test.divergences() == []
+
+    def testEnsembleMatchesModel(self):
+        test = self.runEngines(ensembleEngine())
+        assert test.divergences() == []
+
+    def testThinningMatchesModel(self):
+        test = self.runEngines(modelEngine(SampleTree, thinning=True))
+        assert test.divergences() == []
+
+    def testDetectsDivergence(self):
+        # a model whose live-live rate is 50% too high
+        reference = modelEngine(SampleTree)
+        def biased(params, state, replicates, seed):
+            params = params[:2] + (params[2] * 1.5,) + params[3:]
+            return reference(params, state, replicates, seed)
+        test = self.runEngines(biased)
+        diverged = set(x["statistic"] for x in test.divergences())
+        assert "count.ll" in diverged
+
+def main():
+    parseCactusSuiteTestOptions()
+    sys.argv = sys.argv[:1]
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
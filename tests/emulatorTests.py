@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey (hickey@soe.ucsc.edu)
+#
+#Released under the MIT license, see LICENSE.txt
+import unittest
+import sys
+import os
+import math
+import cPickle
+
+from contigSim.src.emulator import Emulator
+from contigSim.src.experiment import Experiment
+from contigSim.src.histogram import BinScheme
+from contigSim.src.histogram import Histogram
+
+from sonLib.bioio import TestStatus
+from sonLib.bioio import system
+from sonLib.bioio import getLogLevelString
+
+# an experiment with a cell for each fl, whose replicates all have
+# 10 * fl + 2 contigs in bin 5 and 3 in bin 7
+def linearExperiment(fls, replicates=2):
+    exp = Experiment()
+    exp.setBinScheme(BinScheme(10))
+    for fl in fls:
+        key = (100, 1000, 0.001, 0, 0, fl, 0, 0) + (0, 5, 0)
+        exp.results[key] = []
+        for rep in xrange(replicates):
+            hist = Histogram(exp.getBinScheme())
+            hist.addBin(5, 10 * fl + 2)
+            hist.addBin(7, 3)
+            exp.results[key].append({"alive" : hist})
+    return exp
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testNo = TestStatus.getTestSetup()
+        self.tempFiles = []
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self):
+        for tempFile in self.tempFiles:
+            os.remove(tempFile)
+        unittest.TestCase.tearDown(self)
+
+    def testPredict(self):
+        emulator = Emulator(linearExperiment([x / 10. for x in xrange(11)]))
+        assert emulator.names == ["fl"]
+        assert emulator.state == (0, 5, 0)
+        mean, std = emulator.predict({"fl" : 0.35})
+        assert abs(mean[5] - 5.5) < 0.05
+        assert abs(mean[7] - 3) < 1e-9
+        assert std[7] == 0
+        assert std[5] < 0.1
+        # further from the cells, less certain
+        assert emulator.uncertainty({"fl" : 0.35}) < \
+               emulator.uncertainty({"fl" : 1.3})
+        assert emulator.predict((100, 1000, 0.001, 0, 0, 0.35, 0, 0))[0] == \
+               mean
+
+    def testSparseBins(self):
+        # a far tail bin doesn't make the fit dense up to it
+        exp = linearExperiment([0., 0.5, 1.])
+        for key in exp.results:
+            for histograms in exp.results[key]:
+                histograms["alive"].addBin(10 ** 9, key[5] + 1)
+        emulator = Emulator(exp)
+        assert list(emulator.bins) == [5, 7, 10 ** 9]
+        assert emulator.weights.shape == (3, 3)
+        mean, std = emulator.predict({"fl" : 0.5})
+        assert abs(mean[10 ** 9] - 1.5) < 0.1
+        assert abs(mean[5] - 7) < 0.1
+        assert 6 not in mean
+
+    def testSuggest(self):
+        emulator = Emulator(linearExperiment([0., 0.1, 0.2, 0.3, 1.]))
+        suggestions = emulator.suggest(2)
+        assert len(suggestions) == 2
+        # both in the gap, apart
+        fl = [x[5] for x in suggestions]
+        assert 0.5 < fl[0] < 0.8
+        assert 0.3 < fl[1] < 1 and abs(fl[1] - fl[0]) > 0.1
+        assert emulator.uncertainty({"fl" : 0.2}) < \
+               emulator.uncertainty({"fl" : 0.65})
+        for params in suggestions:
+            assert params[:5] == (100, 1000, 0.001, 0, 0)
+        candidates = [{"fl" : 0.15}, {"fl" : 0.6}, {"fl" : 0.25}]
+        assert emulator.suggest(1, candidates)[0][5] == 0.6
+
+    def testSimulated(self):
+        exp = Experiment()
+        for rll in (0.0001, 0.001, 0.01):
+            exp.addParameterSet(100, 500, rll, 0, 0, 0.5, 0.2)
+        exp.addStartingState(0, 10, 0)
+        exp.run(3, 50)
+        exp = cPickle.loads(cPickle.dumps(exp, 2))
+        emulator = Emulator(exp, "overall", logNames=["rll"])
+        assert emulator.names == ["rll"]
+        assert abs(emulator.parameters([0.5])[2] - 0.001) < 1e-9
+        mean, std = emulator.predict({"rll" : 0.003})
+        assert len(mean) > 0
+        assert all(x > 0 for x in mean.values())
+        assert all(x >= 0 for x in std.values())
+        assert 0.5 < emulator.unit(
+            [(100, 500, 0.003, 0, 0, 0.5, 0.2, 0)])[0, 0] < 1
+
+def main():
+    parseCactusSuiteTestOptions()
+    sys.argv = sys.argv[:1]
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
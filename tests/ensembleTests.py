@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey (hickey@soe.ucsc.edu)
+#
+#Released under the MIT license, see LICENSE.txt
+import unittest
+import sys
+import os
+import random
+
+from contigSim.src.ensemble import Ensemble
+from contigSim.src.model import Model
+
+from sonLib.bioio import TestStatus
+from sonLib.bioio import system
+from sonLib.bioio import getLogLevelString
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testNo = TestStatus.getTestSetup()
+        self.tempFiles = []
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self):
+        for tempFile in self.tempFiles:
+            os.remove(tempFile)
+        unittest.TestCase.tearDown(self)
+
+    def testEnsembleInit(self):
+        ensemble = Ensemble(10)
+        ensemble.setParameters(100, 0.1)
+        ensemble.setStartingState(0, 21, 3)
+        assert (ensemble.poolSizes() == 24).all()
+        assert (ensemble.poolWeights() == 100).all()
+
+        ensemble.setStartingState(11, 0, 4)
+        assert (ensemble.poolSizes() == 5).all()
+        assert (ensemble.poolWeights() == 100).all()
+        hist = ensemble.histograms()
+        assert len(hist) == 10
+        assert hist[0]["dead"][11] == 1
+        assert sum(hist[0]["aliveCircular"].values()) == 4
+
+    def testEnsembleSimulate(self):
+        ensemble = Ensemble(20, seed=0)
+        ensemble.setParameters(10000, 0.00001, 0.00001, 0.00001, 0.1, 0.1,
+                               0.5)
+        ensemble.setStartingState(100, 30, 30)
+        ensemble.simulate(10000)
+        assert (ensemble.time == 10000).all()
+        for res in ensemble.histograms(100):
+            assert sum(res["dead"].values()) == 1
+            assert sum(res["overall"].values()) == \
+                   sum(res["alive"].values()) + 1
+
+    def testEnsembleMatchesModel(self):
+        # the mean pool size after a short run should agree with Model
+        random.seed(0)
+        reps = 300
+        total = 0
+        for i in xrange(reps):
+            model = Model()
+            model.setParameters(200, 0.01, 0.002, 0.002, 0.5, 0.5, 0.5)
+            model.setStartingState(20, 5, 5)
+            model.simulate(5)
+            total += model.pool.size()
+        ensemble = Ensemble(reps, seed=0)
+        ensemble.setParameters(200, 0.01, 0.002, 0.002, 0.5, 0.5, 0.5)
+        ensemble.setStartingState(20, 5, 5)
+        ensemble.simulate(5)
+        assert abs(float(total) / reps - ensemble.poolSizes().mean()) < 0.5
+
+def main():
+    parseCactusSuiteTestOptions()
+    sys.argv = sys.argv[:1]
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -43,6 +43,27 @@ class TestCase(unittest.TestCase):
 
         assert counts["substitution"] >= counts["duplication"]
         assert  counts["duplication"] >= counts["fusion"]
+
+    def testEventQueueSetRate(self):
+        eq = EventQueue()
+        eq.addEventType(1.0, "a")
+        eq.addEventType(1.0, "b")
+        eq.begin()
+        for i in range(0, 1000):
+            eq.next()
+        # stop a, then b runs alone
+        eq.setRate("a", 0)
+        for i in range(0, 1000):
+            assert eq.next() == "b"
+        # restart a at a much higher rate
+        start = eq.time
+        eq.setRate("a", 100.0)
+        counts = {"a" : 0, "b" : 0}
+        for i in range(0, 10000):
+            counts[eq.next()] += 1
+        assert counts["a"] > 50 * counts["b"]
+        # the number of events is right for the total rate of 101
+        assert abs((eq.time - start) * 101 - 10000) < 500
         
         
 def main():
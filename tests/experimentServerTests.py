@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey (hickey@soe.ucsc.edu)
+#
+#Released under the MIT license, see LICENSE.txt
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+import threading
+import time
+import signal
+
+from contigSim.src.experimentServer import ExperimentServer
+from contigSim.src.experimentServer import ExperimentClient
+from contigSim.src.experimentServer import sweepTasks
+
+from sonLib.bioio import TestStatus
+from sonLib.bioio import system
+from sonLib.bioio import getLogLevelString
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testNo = TestStatus.getTestSetup()
+        self.tempFiles = []
+        self.tempDir = tempfile.mkdtemp()
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self):
+        for tempFile in self.tempFiles:
+            os.remove(tempFile)
+        shutil.rmtree(self.tempDir)
+        unittest.TestCase.tearDown(self)
+
+    def sweep(self, seed=0):
+        return {"parameterSets" : [[100, 200, 0.01], {"t" : 100, "N" : 200,
+                                                      "rll" : 0.01,
+                                                      "rld" : 0.001,
+                                                      "rdd" : 0.001}],
+                "startingStates" : [[0, 5, 5], [50, 0, 5]],
+                "replicates" : 3, "seed" : seed}
+
+    def testSweepTasks(self):
+        tasks = sweepTasks(self.sweep())
+        assert len(tasks) == 4
+        assert len(set(tasks)) == 4
+        assert tasks[0][0] == (100., 200, 0.01, 0., 0., 0., 0., 0.)
+        # the same cells written differently are the same tasks
+        other = {"parameterSets" : [[100.0, 200.0, 0.01, 0, 0, 0, 0, 0]],
+                 "startingStates" : [{"garbageSize" : 0, "numLinear" : 5,
+                                      "numCircular" : 5}],
+                 "replicates" : 3}
+        assert sweepTasks(other)[0] == tasks[0]
+        assert sweepTasks(self.sweep(1))[0] != tasks[0]
+
+    def testServer(self):
+        server = ExperimentServer(processes=2, cacheDir=self.tempDir)
+        server.start()
+        try:
+            client = ExperimentClient(server.address())
+            # two clients submit overlapping sweeps at the same time
+            events = [[], []]
+            def run(i, sweep):
+                events[i] = list(client.submit(sweep))
+            small = dict(self.sweep())
+            small["startingStates"] = [[0, 5, 5]]
+            threads = [threading.Thread(target=run, args=(0, self.sweep())),
+                       threading.Thread(target=run, args=(1, small))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert server.status()["launched"] == 4
+            assert events[0][0]["event"] == "accepted"
+            assert events[0][-1]["event"] == "done"
+            cells = [x for x in events[0] if x["event"] == "cell"]
+            assert len(cells) == 4
+            assert [x["completed"] for x in cells] == [1, 2, 3, 4]
+            for cell in cells:
+                assert cell["status"] == "done"
+                # the mean number of bases (counting each contig's
+                # bin) adds up to N
+                bases = sum(i * c for i, c in cell["aggregate"]["overall"])
+                assert abs(bases - 200) < 1e-6
+            assert len([x for x in events[1] if x["event"] == "cell"]) == 2
+
+            # finished cells are not run again
+            assert len(list(client.submit(self.sweep()))) == 6
+            assert server.status()["launched"] == 4
+            exp = client.experiment(self.sweep())
+            assert len(exp.results) == 4
+            for key, results in exp.results.items():
+                assert len(results) == 3
+                for res in results:
+                    total = sum(i * c for i, c in res["overall"].items())
+                    assert total == 200
+            fetched = client.fetch(self.sweep(5))
+            assert [x["status"] for x in fetched] == ["missing"] * 4
+        finally:
+            server.close()
+
+        # a new server finds the results in the cache
+        server = ExperimentServer(processes=1, cacheDir=self.tempDir)
+        server.start()
+        try:
+            client = ExperimentClient(server.address())
+            fetched = client.fetch(self.sweep())
+            assert [x["status"] for x in fetched] == ["done"] * 4
+            assert len(fetched[0]["results"]) == 3
+            list(client.submit(self.sweep()))
+            assert server.status()["launched"] == 0
+        finally:
+            server.close()
+
+    def testLostWorker(self):
+        server = ExperimentServer(processes=1)
+        server.start()
+        try:
+            client = ExperimentClient(server.address())
+            # a cell that takes far longer than the test
+            slow = {"parameterSets" : [[100000, 100000, 0.01]],
+                    "startingStates" : [[0, 5, 5]]}
+            for launched in (1, 2):
+                events = []
+                thread = threading.Thread(
+                    target=lambda : events.extend(client.submit(slow)))
+                thread.start()
+                # kill the worker once it has started the cell
+                while len(server.running) == 0:
+                    time.sleep(0.05)
+                os.kill(server.running.keys()[0], signal.SIGKILL)
+                thread.join(30)
+                assert not thread.is_alive()
+                assert [x["event"] for x in events] == ["accepted", "cell",
+                                                        "done"]
+                assert events[1]["status"] == "failed"
+                assert "died" in events[1]["error"]
+                # the failed cell isn't kept, so it runs again
+                status = server.status()
+                assert status["launched"] == launched
+                assert status["failed"] == launched
+                assert status["queued"] == 0
+            # and the replaced worker still runs cells
+            small = dict(self.sweep())
+            small["parameterSets"] = small["parameterSets"][:1]
+            small["startingStates"] = small["startingStates"][:1]
+            cells = [x for x in client.submit(small) if x["event"] == "cell"]
+            assert [x["status"] for x in cells] == ["done"]
+        finally:
+            server.close()
+
+def main():
+    parseCactusSuiteTestOptions()
+    sys.argv = sys.argv[:1]
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey (hickey@soe.ucsc.edu)
+#
+#Released under the MIT license, see LICENSE.txt
+import unittest
+import sys
+import os
+import random
+import numpy as np
+
+from contigSim.src.histogram import BinScheme
+from contigSim.src.histogram import Histogram
+from contigSim.src.histogram import mergeHistograms
+from contigSim.src.sampleTree import SampleTree
+
+from sonLib.bioio import TestStatus
+from sonLib.bioio import system
+from sonLib.bioio import getLogLevelString
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testNo = TestStatus.getTestSetup()
+        self.tempFiles = []
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self):
+        for tempFile in self.tempFiles:
+            os.remove(tempFile)
+        unittest.TestCase.tearDown(self)
+
+    def testBinSchemeLinear(self):
+        scheme = BinScheme(10)
+        assert not scheme.isLog()
+        assert scheme.binIndex(0) == 0
+        assert scheme.binIndex(9) == 0
+        assert scheme.binIndex(10) == 1
+        assert scheme.binIndex(12345) == 1234
+        assert scheme.binLower(3) == 30 and scheme.binUpper(3) == 40
+
+    def testBinSchemeLog(self):
+        scheme = BinScheme(10, 2, 100)
+        assert scheme.isLog()
+        assert scheme.numLinear == 10
+        assert scheme.binIndex(99) == 9
+        assert scheme.binIndex(100) == 10
+        assert scheme.binIndex(199) == 10
+        assert scheme.binIndex(200) == 11
+        assert scheme.binIndex(1600) == 14
+        assert scheme.binIndex(1599) == 13
+        # every size falls between the bounds of its bin
+        for value in range(0, 5000, 7) + [10 ** 9, 3 * 10 ** 9]:
+            i = scheme.binIndex(value)
+            assert scheme.binLower(i) <= value < scheme.binUpper(i)
+        # a 3Gb genome only needs a few dozen bins
+        assert scheme.binIndex(3 * 10 ** 9) < 40
+
+    def testBinIndices(self):
+        random.seed(5)
+        for scheme in (BinScheme(7), BinScheme(10, 2, 100),
+                       BinScheme(1, 1.5, 1)):
+            values = [random.randint(0, 10 ** 7) for i in range(500)]
+            values += [0, 1, 99, 100, 128, 1024, 3 * 10 ** 9]
+            indices = scheme.binIndices(np.array(values))
+            assert list(indices) == [scheme.binIndex(x) for x in values]
+
+    def testHistogramSparseDense(self):
+        hist = Histogram(BinScheme())
+        hist.add(5)
+        hist.add(100000)
+        assert not hist.isDense()
+        assert hist.span() == 100001
+        for i in range(0, 100):
+            hist.add(i, 2)
+        hist.add(5, -2)
+        assert len(hist) == 101
+        assert hist[5] == 1 and hist[6] == 2 and hist[100000] == 1
+        assert hist.total() == 200
+        # filling in the low bins switches to dense storage and back
+        hist[100000] = 0
+        for i in range(0, 300):
+            hist.add(i)
+        assert hist.isDense()
+        assert hist.span() == 300
+        hist[10 ** 6] = 4
+        assert not hist.isDense()
+        assert hist[10 ** 6] == 4 and hist[99] == 3 and hist[100] == 1
+        assert 10 ** 6 in hist and 300 not in hist
+        assert hist.keys() == range(0, 300) + [10 ** 6]
+
+    def testHistogramMerge(self):
+        random.seed(11)
+        scheme = BinScheme(3, 2, 30)
+        hists = []
+        expected = dict()
+        for rep in range(0, 10):
+            hist = Histogram(scheme)
+            for i in range(0, random.randint(0, 300)):
+                value = random.randint(0, 10 ** 5)
+                hist.add(value)
+                index = scheme.binIndex(value)
+                expected[index] = expected.get(index, 0) + 1
+            hists.append(hist)
+        merged = mergeHistograms(hists)
+        assert merged.scheme == scheme
+        assert merged == expected
+        assert merged.total() == sum(x.total() for x in hists)
+        # merging into a copy leaves the original alone
+        copy = hists[0].copy()
+        copy.merge(hists[1])
+        assert copy.total() == hists[0].total() + hists[1].total()
+        assert merged == mergeHistograms(hists[::-1])
+        assert merged.toDict() == expected
+
+    def testSampleTreeHistogramScheme(self):
+        tree = SampleTree()
+        for i in range(0, 1000):
+            tree.insert(i, i)
+        scheme = BinScheme(10, 10, 100)
+        hist = tree.histogram(scheme=scheme)
+        assert hist.scheme == scheme
+        assert hist[0] == 10 and hist[9] == 10
+        assert hist[10] == 900
+        assert hist.total() == 1000
+
+def main():
+    parseCactusSuiteTestOptions()
+    sys.argv = sys.argv[:1]
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
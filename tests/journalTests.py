@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey (hickey@soe.ucsc.edu)
+#
+#Released under the MIT license, see LICENSE.txt
+import unittest
+import sys
+import os
+import tempfile
+from collections import defaultdict
+
+from contigSim.src.journal import JournalWriter
+from contigSim.src.journal import Replay
+from contigSim.src.journal import readJournal
+from contigSim.src.journal import INIT, LL, GAIN, LOSS, LD, DD
+from contigSim.src.contig import LinearContig
+from contigSim.src.contig import CircularContig
+from contigSim.src.model import Model
+
+from sonLib.bioio import TestStatus
+from sonLib.bioio import system
+from sonLib.bioio import getLogLevelString
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testNo = TestStatus.getTestSetup()
+        self.tempFiles = []
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self):
+        for tempFile in self.tempFiles:
+            os.remove(tempFile)
+        unittest.TestCase.tearDown(self)
+
+    def tempPath(self):
+        handle, path = tempfile.mkstemp(suffix=".csj")
+        os.close(handle)
+        self.tempFiles.append(path)
+        return path
+
+    # (size, linear, dead) multiset of a model's pool
+    def poolState(self, model):
+        state = defaultdict(int)
+        for contig in model.pool.dataElements():
+            state[(int(contig.size), contig.isLinear(), contig.isDead())] += 1
+        return dict(state)
+
+    def testJournalReadWrite(self):
+        path = self.tempPath()
+        writer = JournalWriter(path, chunkSize=3)
+        dead = CircularContig(7)
+        dead.setDead()
+        for i in range(0, 10):
+            writer.write(i * 0.5, LD, i, 2 * i, i % 2 == 0,
+                         [LinearContig(10), dead], [LinearContig(i + 1)])
+        writer.write(5., INIT, 0, 0, False, [], [CircularContig(3)])
+        writer.close()
+        records = list(readJournal(path))
+        assert len(records) == 11
+        for i in range(0, 10):
+            time, eventType, forward, offset1, offset2, inputs, outputs = \
+                  records[i]
+            assert time == i * 0.5 and eventType == LD
+            assert forward == (i % 2 == 0)
+            assert offset1 == i and offset2 == 2 * i
+            assert inputs == [(10, True, False), (7, False, True)]
+            assert outputs == [(i + 1, True, False)]
+        assert records[10][1] == INIT and records[10][5] == []
+        assert records[10][6] == [(3, False, False)]
+
+    def testJournalReplay(self):
+        path = self.tempPath()
+        model = Model()
+        model.setParameters(10000, 0.00001, 0.00001, 0.00001, 0.5, 0.5, 0.5)
+        model.setStartingState(100, 30, 30)
+        start = self.poolState(model)
+        model.setJournal(JournalWriter(path, chunkSize=100))
+        model.simulate(20000)
+        model.journal.close()
+
+        records = list(readJournal(path))
+        types = set(x[1] for x in records)
+        assert INIT in types and LL in types and LD in types
+        assert len([x for x in records if x[1] == INIT]) == 61
+        assert len([x for x in records if x[1] == LL]) == model.llCount
+
+        replay = Replay(path)
+        assert replay.stateAt(0) == start
+        assert replay.stateAt(20000) == self.poolState(model)
+        times = [0, 5000, 10000, 20000]
+        states = list(replay.states(times))
+        assert [x[0] for x in states] == times
+        for time, state in states:
+            assert sum(state.values()) > 0
+
+        hists = replay.histograms(20000, 10)
+        assert sum(hists["overall"].values()) == model.pool.size()
+        assert hists["alive"] == model.pool.histogram(
+            binSize=10, checkFn = lambda x : x.isDead() == False)
+
+def main():
+    parseCactusSuiteTestOptions()
+    sys.argv = sys.argv[:1]
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
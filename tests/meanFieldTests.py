@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey (hickey@soe.ucsc.edu)
+#
+#Released under the MIT license, see LICENSE.txt
+import unittest
+import sys
+import os
+
+from contigSim.src.meanField import MeanFieldModel
+
+from sonLib.bioio import TestStatus
+from sonLib.bioio import system
+from sonLib.bioio import getLogLevelString
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testNo = TestStatus.getTestSetup()
+        self.tempFiles = []
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self):
+        for tempFile in self.tempFiles:
+            os.remove(tempFile)
+        unittest.TestCase.tearDown(self)
+
+    def testMeanFieldInit(self):
+        model = MeanFieldModel(binSize=10)
+        model.setParameters(1000, 0.001)
+        model.setStartingState(100, 6, 3)
+        assert abs(model.poolSize() - 10) < 1e-9
+        assert abs(model.poolWeight() - 1000) < 1e-9
+        res = model.histograms(10)
+        assert res["deadCircular"][10] == 1
+        assert abs(sum(res["aliveLinear"].values()) - 6) < 1e-9
+        assert abs(sum(res["aliveCircular"].values()) - 3) < 1e-9
+
+    def testMeanFieldLiveLive(self):
+        # live-live events keep the number of linears and the weight
+        model = MeanFieldModel(binSize=500)
+        model.setParameters(100000, 0.00001)
+        model.setStartingState(0, 20, 0)
+        model.simulate(500)
+        assert abs(model.linear.sum() - 20) < 1e-6
+        assert abs(model.poolWeight() - 100000) < 100
+        assert model.circular.sum() > 0
+
+    def testMeanFieldTrajectory(self):
+        model = MeanFieldModel(binSize=1000)
+        model.setParameters(100000, 0.00001, 0.000001, 0.000001, 0.5, 0.5,
+                            0.5)
+        model.setStartingState(10000, 10, 10)
+        results = model.trajectory([100, 200], 1000)
+        assert len(results) == 2
+        assert model.time == 200
+        assert model.deadWeight > 10000
+        for res in results:
+            assert abs(sum(res["dead"].values()) - 1) < 1e-9
+            assert abs(model.poolWeight() - 100000) < 1000
+
+def main():
+    parseCactusSuiteTestOptions()
+    sys.argv = sys.argv[:1]
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
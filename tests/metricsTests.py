@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey (hickey@soe.ucsc.edu)
+#
+#Released under the MIT license, see LICENSE.txt
+import unittest
+import sys
+import os
+import json
+
+from contigSim.src.metrics import Metrics
+from contigSim.src.metrics import timeBucket
+from contigSim.src.model import Model
+
+from sonLib.bioio import TestStatus
+from sonLib.bioio import system
+from sonLib.bioio import getLogLevelString
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testNo = TestStatus.getTestSetup()
+        self.tempFiles = []
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self):
+        for tempFile in self.tempFiles:
+            os.remove(tempFile)
+        unittest.TestCase.tearDown(self)
+
+    def testMetricsRecord(self):
+        metrics = Metrics()
+        metrics.count("a")
+        metrics.count("a", 2)
+        metrics.addTime("t", 0.000001)
+        metrics.addTime("t", 0.000003)
+        metrics.addValue("h", 3)
+        metrics.addValue("h", 3)
+        metrics.addRun(10, 2.0)
+        res = metrics.toDict()
+        assert res["counters"]["a"] == 3
+        assert res["timers"]["t"]["count"] == 2
+        assert abs(res["timers"]["t"]["mean"] - 0.000002) < 1e-12
+        assert res["timers"]["t"]["histogram"] == {"512" : 1, "2048" : 1}
+        assert res["histograms"]["h"] == {"3" : 2}
+        assert res["eventsPerSecond"] == 5.0
+        assert timeBucket(0) == 0
+
+        other = Metrics()
+        other.count("a")
+        other.addTime("t", 0.000001)
+        other.addRun(10, 2.0)
+        metrics.merge(other)
+        res = metrics.toDict()
+        assert res["counters"]["a"] == 4
+        assert res["timers"]["t"]["histogram"]["512"] == 2
+        assert res["events"] == 20
+
+    def testMetricsModel(self):
+        model = Model()
+        model.setParameters(10000, 0.00001, 0.00001, 0.00001, 0.1, 0.1, 0.5)
+        model.setStartingState(100, 30, 30)
+        model.enableMetrics()
+        model.simulate(10000)
+        res = model.metadata["metrics"]
+        json.loads(json.dumps(res))
+        counters = res["counters"]
+        timers = res["timers"]
+        for event in ("ll", "ld", "dd"):
+            outcomes = sum(v for k, v in counters.items()
+                           if k.startswith(event + "."))
+            assert outcomes == timers[event]["count"]
+        assert counters["ll.normal"] == model.llCount
+        assert counters.get("ll.gain", 0) == model.fgCount
+        assert counters.get("ld.swap", 0) == model.ldSwapCount
+        # the last call to next() is past the end of the simulation
+        assert counters["eventQueue.next"] == res["events"] + 1
+        assert res["events"] == sum(x["count"] for x in timers.values())
+        assert sum(res["histograms"]["sampleTree.depth"].values()) > 0
+        assert counters["sampleTree.insert"] > 0
+        assert res["eventsPerSecond"] > 0
+
+    def testMetricsDisabled(self):
+        model = Model()
+        model.setParameters(10000, 0.00001)
+        model.setStartingState(0, 30, 30)
+        model.simulate(10000)
+        assert model.metrics is None
+        assert "metrics" not in model.metadata
+
+def main():
+    parseCactusSuiteTestOptions()
+    sys.argv = sys.argv[:1]
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,7 @@ import unittest
 import sys
 import os
 import copy
+import gc
 
 from contigSim.src.model import Model
 from contigSim.src.contig import LinearContig
@@ -80,7 +81,138 @@ class TestCase(unittest.TestCase):
         model.setParameters(10000, 0.00001, 0.00001, 0.00001, 0.1, 0.1, 0.5)
         model.setStartingState(100, 30, 30)
         model.simulate(100000)
-        
+
+    def testSimulateTuneDegree(self):
+        model = Model(tuneEvents=200, tuneDegrees=(2, 8))
+        model.setParameters(10000, 0.00001, 0.00001, 0.00001, 0.1, 0.1, 0.5)
+        model.setStartingState(100, 30, 30)
+        weight = model.pool.weight()
+        model.simulate(10000)
+        assert model.metadata["degree"] in (2, 8)
+        assert model.pool.degree == model.metadata["degree"]
+        assert set(model.metadata["tuning"]["costs"].keys()) == set([2, 8])
+        assert model.metadata["tuning"]["samples"] > 0
+        assert model.pool.weight() == weight
+
+    def testModelReset(self):
+        model = Model(pauseGC=True)
+        model.setParameters(10000, 0.00001, 0.00001, 0.00001, 0.1, 0.1, 0.5)
+        for rep in range(0, 3):
+            if rep > 0:
+                model.reset()
+                assert model.pool.size() == 0
+                assert model.metadata == dict()
+            model.setStartingState(100, 30, 30)
+            weight = model.pool.weight()
+            model.simulate(10000)
+            assert gc.isenabled()
+            assert model.pool.weight() == weight
+            allocations = model.metadata["allocations"]
+            # the first run allocates the starting pool, and later runs
+            # reuse it
+            if rep == 0:
+                assert allocations["contigsAllocated"] >= 60
+                assert allocations["nodesAllocated"] > 0
+            else:
+                assert allocations["nodesAllocated"] == 0
+            assert allocations["contigsReused"] > 0
+            assert allocations["nodesReused"] > 0
+            # no contig is in the pool twice or also on the free list
+            contigs = [id(x) for x in model.pool.dataElements()]
+            free = [id(x) for x in model.contigPool.free[LinearContig] +
+                    model.contigPool.free[CircularContig]]
+            assert len(set(contigs)) == len(contigs)
+            assert len(set(contigs) & set(free)) == 0
+
+    def testLLEffective(self):
+        model = Model()
+        model.setParameters(200, 0.001, 0.001, 0.001, 0.3, 0.6, 0.5)
+        model.setStartingState(20, 3, 4)
+        for rep in range(0, 5):
+            model.simulate(100)
+            contigs = list(model.pool.dataElements())
+            live = [x for x in contigs if not x.isDead()]
+            assert model.liveWeight == sum(x.numBases() for x in live)
+            assert model.liveLinear == len([x for x in live if x.isLinear()
+                                            and x.numBases() > 0])
+            # sum the acceptance probability over every pair of samples
+            # (the first one flipped to the right telomere half the time)
+            total = 0.
+            for c1 in live:
+                first = [(o, 1.) for o in range(1, int(c1.numBases()))]
+                if c1.isLinear() and c1.numBases() > 0:
+                    first += [(0, 0.5), (c1.numBases(), 0.5)]
+                elif c1.isCircular() and c1.numBases() > 0:
+                    first += [(0, 1.)]
+                for c2 in live:
+                    for offset1, w1 in first:
+                        for offset2 in range(0, int(c2.numBases())):
+                            if c2 is not c1 and c2.isLinear() and offset2 == 0:
+                                second = [(0, 0.5), (c2.numBases(), 0.5)]
+                            else:
+                                second = [(offset2, 1.)]
+                            for offset2, w2 in second:
+                                total += w1 * w2 * self.accept(
+                                    model, c1, offset1, c2, offset2)
+            weight = float(model.pool.weight())
+            assert abs(total / (weight * weight) - model.llEffective()) < 1e-9
+
+    def accept(self, model, c1, offset1, c2, offset2):
+        telomere = lambda c, o : c.isLinear() and (o == 0 or o == c.size - 1)
+        if c1 is c2 and offset1 == offset2:
+            if telomere(c1, offset1):
+                return 0.
+            return model.fg
+        if telomere(c1, offset1) and telomere(c2, offset2):
+            if c1 is c2:
+                return model.fl / 4.
+            return model.fl / 2.
+        return 1.
+
+    def testSimulateResume(self):
+        model = Model()
+        model.setParameters(10000, 0.00001, 0.00001, 0.00001, 0.1, 0.1, 0.5)
+        model.setStartingState(100, 30, 30)
+        model.simulate(5000)
+        assert model.eventQueue.time == 5000
+        llCount = model.llCount
+        events = model.metadata["events"]
+        assert events > 0
+        model.simulate(10000, resume=True)
+        assert model.eventQueue.time == 10000
+        assert model.llCount >= llCount
+        assert model.metadata["events"] >= events
+
+    def testSimulateThinning(self):
+        model = Model(thinning=True)
+        metrics = model.enableMetrics()
+        model.setParameters(10000, 0.00001, 0.00001, 0.00001, 0.1, 0.1, 0.5)
+        model.setStartingState(100, 30, 30)
+        weight = model.pool.weight()
+        model.simulate(100000)
+        assert model.pool.weight() == weight
+        assert model.eventQueue.time == 100000
+        # only effective live-live events are run
+        for name in ("ll.dead", "ll.gainRejected", "ll.lossRejected"):
+            assert metrics.counters[name] == 0
+        assert metrics.counters["ll.normal"] > 0
+        assert model.metadata["events"] == metrics.events
+
+    def testThinningDeadSamples(self):
+        # with 9/10 of the pool in the garbage, drawing pairs until both
+        # are live would take 100 (two target) descents per event, but
+        # only the dead samples are redrawn, so about 1 + 2 * 9
+        model = Model(thinning=True)
+        metrics = model.enableMetrics()
+        model.setParameters(10000, 0.0001)
+        model.setStartingState(9000, 0, 20)
+        model.pool.sampleCount = 0
+        model.simulate(50000)
+        assert model.pool.weight() == 10000
+        events = metrics.counters["ll.normal"]
+        assert events == model.metadata["events"] > 100
+        assert metrics.counters["ll.deadRedrawn"] > 0
+        assert float(model.pool.sampleCount) / events < 30
             
 def main():
     parseCactusSuiteTestOptions()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey (hickey@soe.ucsc.edu)
+#
+#Released under the MIT license, see LICENSE.txt
+import unittest
+import sys
+import os
+
+from contigSim.src.populationModel import PopulationModel
+from contigSim.src.ensemble import LL
+
+from sonLib.bioio import TestStatus
+from sonLib.bioio import system
+from sonLib.bioio import getLogLevelString
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testNo = TestStatus.getTestSetup()
+        self.tempFiles = []
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self):
+        for tempFile in self.tempFiles:
+            os.remove(tempFile)
+        unittest.TestCase.tearDown(self)
+
+    def testPopulationInit(self):
+        model = PopulationModel(classWidth=10)
+        model.setParameters(100, 0.1)
+        model.setStartingState(0, 21, 3)
+        assert model.poolSize() == 24
+        assert model.poolWeight() == 100
+
+        model.setStartingState(11, 0, 4)
+        assert model.poolSize() == 5
+        assert model.poolWeight() == 100
+        res = model.histograms(10)
+        assert res["deadCircular"][1] == 1
+        assert sum(res["aliveCircular"].values()) == 4
+        assert sum(res["overall"].values()) == 5
+
+    def testPopulationSimulate(self):
+        model = PopulationModel(classWidth=100, seed=0)
+        model.setParameters(10000, 0.00001, 0.00001, 0.00001, 0.1, 0.1, 0.5)
+        model.setStartingState(100, 30, 30)
+        model.simulate(10000)
+        assert model.time == 10000
+        res = model.histograms(100)
+        assert sum(res["dead"].values()) == 1
+        assert sum(res["overall"].values()) == model.poolSize()
+
+    def testPopulationLeap(self):
+        # enough contigs that the LIVE-LIVE events are leaped
+        model = PopulationModel(classWidth=1000, leapThreshold=100, seed=0)
+        model.setParameters(1000000, 0.000001)
+        model.setStartingState(0, 1000, 0)
+        model.simulate(2000)
+        assert model.leapCount > 0
+        assert model.llCount > 1500 and model.llCount < 2500
+        assert abs(model.poolWeight() - 1000000) < 1000
+        assert abs(model.poolSize() - 1000) < 100
+
+    def testPopulationRedraw(self):
+        model = PopulationModel(classWidth=10, seed=0)
+        model.setParameters(100, 0.1)
+        model.setStartingState(0, 10, 0)
+        events = model._PopulationModel__events
+        calls = []
+        # the first draws of the pair are inconsistent
+        def failing(eventType):
+            calls.append(eventType)
+            if len(calls) <= 3:
+                return False
+            return events(eventType)
+        model._PopulationModel__events = failing
+        model._PopulationModel__event(LL)
+        assert len(calls) == 4
+        assert model.llCount + model.fgCount + model.flCount == 1
+        # an event that can never be done isn't dropped silently
+        model._PopulationModel__events = lambda eventType : False
+        self.assertRaises(RuntimeError, model._PopulationModel__event, LL)
+
+def main():
+    parseCactusSuiteTestOptions()
+    sys.argv = sys.argv[:1]
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
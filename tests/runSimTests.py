@@ -0,0 +1,425 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey (hickey@soe.ucsc.edu)
+#
+#Released under the MIT license, see LICENSE.txt
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+import cPickle
+import random
+from collections import defaultdict
+import numpy as np
+
+from contigSim.src import runSim
+from contigSim.src.experiment import Experiment
+from contigSim.src.histogram import BinScheme
+from contigSim.src.histogram import Histogram
+from contigSim.src.sharedHistogram import SharedAccumulator
+from contigSim.src.sharedHistogram import maxDenseBins
+
+from sonLib.bioio import TestStatus
+from sonLib.bioio import system
+from sonLib.bioio import getLogLevelString
+
+# the mean (or total) histogram of a category of the replicates, as
+# runSim summed them before its tables were dense arrays
+def avgHistogram(results, cat, args):
+    table = defaultdict(int)
+    for rep in results:
+        res = rep[cat]
+        for key,value in res.items():
+            table[key] += value
+    for key,value in table.items():
+        if args.countY:
+            table[key] = float(table[key])
+        else:
+            table[key] = float(table[key]) / float(len(results))
+    return table
+
+##################################################################
+# a stand-in for matplotlib, so the plotting code runs without it.
+# the figures record what was plotted, and saved files hold the
+# number of pages written to them
+##################################################################
+class StubAxes(object):
+    def __init__(self):
+        self.spines = dict()
+        self.xaxis = self
+        self.yaxis = self
+        self.clears = 0
+    def cla(self):
+        self.clears += 1
+    def set_ticks_position(self, position):
+        pass
+    def set_minor_locator(self, locator):
+        pass
+    def set_xscale(self, scale):
+        pass
+    def set_yscale(self, scale):
+        pass
+
+class StubFigure(object):
+    def __init__(self, plt):
+        self.plt = plt
+    def add_axes(self, rect):
+        return StubAxes()
+    def savefig(self, target, format=None, dpi=None):
+        if isinstance(target, StubPdfPages):
+            target.pages += 1
+        else:
+            open(target, "w").write("1")
+
+class StubPdfPages(object):
+    def __init__(self, filename):
+        self.filename = filename
+        self.pages = 0
+    def close(self):
+        open(self.filename, "w").write(str(self.pages))
+
+class StubLegend(object):
+    def get_texts(self):
+        return []
+
+class StubPyplot(object):
+    def __init__(self):
+        self.plots = []
+        self.titles = []
+        self.shown = 0
+    def figure(self, **kwargs):
+        return StubFigure(self)
+    def plot(self, x, y, **kwargs):
+        self.plots.append((list(x), list(y)))
+        return [None]
+    def xlim(self, *args):
+        return (0., 1.)
+    def ylim(self, *args):
+        return (0., 1.)
+    def title(self, title):
+        self.titles.append(title)
+    def legend(self, *args, **kwargs):
+        return StubLegend()
+    def show(self):
+        self.shown += 1
+    def xlabel(self, *args):
+        pass
+    def ylabel(self, *args):
+        pass
+    def setp(self, *args, **kwargs):
+        pass
+    def sca(self, ax):
+        pass
+    def close(self, fig):
+        pass
+
+class StubBackend(object):
+    PdfPages = StubPdfPages
+
+class StubLocator(object):
+    def __init__(self, **kwargs):
+        pass
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testNo = TestStatus.getTestSetup()
+        self.tempFiles = []
+        self.tempDir = tempfile.mkdtemp()
+        # (the summaries and plots are written in the current directory)
+        self.cwd = os.getcwd()
+        os.chdir(self.tempDir)
+        # plot with the stand-in for matplotlib
+        self.plt = StubPyplot()
+        self.loadPlotting = runSim.loadPlotting
+        def loadPlotting():
+            runSim.np = np
+            runSim.plt = self.plt
+            runSim.pltBack = StubBackend
+            runSim.LogLocator = StubLocator
+        runSim.loadPlotting = loadPlotting
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self):
+        for tempFile in self.tempFiles:
+            os.remove(tempFile)
+        runSim.loadPlotting = self.loadPlotting
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tempDir)
+        unittest.TestCase.tearDown(self)
+
+    def testSubcommandOptions(self):
+        parser = runSim.initSubcommandOptions()
+        args = parser.parse_args(["simulate", "--out", "a.pickle", "--N",
+                                  "1000", "--t", "50", "--replicates", "2",
+                                  "--numParamSets", "2"])
+        assert args.command == "simulate"
+        assert args.out == "a.pickle"
+        assert (args.N, args.t, args.replicates) == (1000, 50., 2)
+        assert args.engine == "model" and args.processes == 1
+        assert args.queueDir is None
+        # (the plot options are only for plot)
+        assert not hasattr(args, "showPlot")
+        args = parser.parse_args(["aggregate", "a", "b", "--out", "c"])
+        assert args.command == "aggregate"
+        assert (args.inputs, args.out) == (["a", "b"], "c")
+        args = parser.parse_args(["plot", "a", "--countY", "--multipage",
+                                  "all.pdf", "--plotProcesses", "3"])
+        assert args.command == "plot"
+        assert args.inputs == ["a"] and args.countY
+        assert (args.multipage, args.plotProcesses) == ("all.pdf", 3)
+        assert not hasattr(args, "replicates")
+        # an aggregate needs its output
+        stderr = sys.stderr
+        sys.stderr = open(os.devnull, "w")
+        try:
+            self.assertRaises(SystemExit, parser.parse_args,
+                              ["aggregate", "a"])
+        finally:
+            sys.stderr.close()
+            sys.stderr = stderr
+        # the legacy options
+        args = runSim.initOptions().parse_args(["--N", "1000", "--saveSim",
+                                                "a.pickle", "--preview"])
+        assert args.saveSim == "a.pickle" and args.preview
+        assert args.N == 1000 and args.binSize == 1000000
+
+    def testSimulateAggregate(self):
+        options = ["--N", "500", "--t", "20", "--replicates", "2",
+                   "--binSize", "10", "--numParamSets", "2"]
+        assert runSim.main(["runSim.py", "simulate", "--out", "a.pickle"] +
+                           options) == 0
+        assert runSim.main(["runSim.py", "simulate", "--out", "b.pickle"] +
+                           options) == 0
+        assert runSim.main(["runSim.py", "aggregate", "a.pickle", "b.pickle",
+                            "--out", "c.pickle"]) == 0
+        exp = runSim.unpackData("c.pickle")
+        assert len(exp.results) == 2
+        assert exp.binSize == 10
+        for key, results in exp.results.items():
+            assert key[:2] == (20, 500)
+            assert len(results) == 4
+            assert len(exp.metadata[key]) == 4
+
+    # plot options and the results of a small experiment
+    def experiment(self, replicates=3, countY=False):
+        args = runSim.initOptions().parse_args(["--binSize", "10"])
+        args.countY = countY
+        args.binScheme = BinScheme(10)
+        random.seed(2)
+        exp = Experiment()
+        exp.addParameterSet(100, 500, 0.002, 0.001, 0.001, 0.5, 0.5)
+        exp.addStartingState(100, 5, 5)
+        exp.run(replicates, 10)
+        return exp, args
+
+    def testHistogramTables(self):
+        runSim.loadPlotting()
+        for countY in (False, True):
+            exp, args = self.experiment(countY=countY)
+            results = exp.results.values()[0]
+            tables, tails = runSim.histogramTables(results, args)
+            assert tables.shape[0] == len(runSim.tableCategories)
+            assert tails == [dict()] * len(runSim.tableCategories)
+            for i, cat in enumerate(runSim.tableCategories):
+                old = avgHistogram(results, cat, args)
+                assert set(np.flatnonzero(tables[i])) == \
+                       set(x for x in old if old[x] != 0)
+                for index, value in old.items():
+                    assert abs(tables[i][index] - value) < 1e-9
+
+    def testLargeTables(self):
+        # fine bins over N=3e9: only the first maxDenseBins are dense
+        runSim.loadPlotting()
+        args = runSim.initOptions().parse_args(["--binSize", "1"])
+        args.binScheme = BinScheme(1)
+        results = []
+        for rep in xrange(2):
+            histograms = dict((cat, Histogram(args.binScheme)) for cat in
+                              runSim.tableCategories)
+            histograms["aliveLinear"].addBin(3, 2)
+            histograms["aliveLinear"].addBin(3000000000, 1)
+            histograms["deadCircular"].addBin(maxDenseBins + rep, 1)
+            results.append(histograms)
+        tables, tails = runSim.histogramTables(results, args)
+        assert tables.shape == (4, maxDenseBins)
+        assert tables[1, 3] == 2 and tables.sum() == 2
+        assert tails == [dict(), {3000000000 : 1.}, {maxDenseBins : 0.5,
+                         maxDenseBins + 1 : 0.5}, dict()]
+        key = (10, 3000000000, 0, 0, 0, 0, 0, 0, 0, 1, 0)
+        exp = Experiment()
+        cell = runSim.summarizeCell(exp, (key, results), args)
+        assert cell[2][1] == tails
+        lines = open(cell[3][:-len(".pdf")] + ".txt").read()
+        assert "linear: contigs=3.00 bases=3000000006" in lines
+        assert "deadCircular: contigs=1.00 bases=%d" % (maxDenseBins + 0.5) \
+               in lines
+        runSim.renderCell(cell)
+        assert self.plt.plots[1] == ([3.5 - 1, 3000000000.5 - 1], [2., 1.])
+        assert self.plt.plots[2][1] == [0.5, 0.5]
+
+    def testSummarizeCell(self):
+        runSim.loadPlotting()
+        exp, args = self.experiment()
+        result = exp.results.items()[0]
+        key, replicates, tables, fname, cellArgs = runSim.summarizeCell(
+            exp, result, args)
+        assert key == result[0] and replicates == 3
+        assert fname.endswith(".pdf")
+        txtname = fname[:-len(".pdf")] + ".txt"
+        lines = dict(x.split(": ") for x in open(txtname).read().split("\n")
+                     if ": " in x)
+        # the same numbers as from the old tables
+        for name, cat in [("linear", "aliveLinear"),
+                          ("circular", "aliveCircular"),
+                          ("deadLinear", "deadLinear"),
+                          ("deadCircular", "deadCircular")]:
+            old = avgHistogram(result[1], cat, args)
+            contigs = sum(old.values())
+            bases = sum(k * v for k, v in old.items())
+            # (the bases are truncated after sums in another order)
+            fields = dict(x.split("=") for x in lines[name].split())
+            assert fields["contigs"] == "%.2f" % contigs
+            assert abs(int(fields["bases"]) - bases) <= 1
+
+    def testSharedTables(self):
+        runSim.loadPlotting()
+        exp, args = self.experiment()
+        results = exp.results.values()[0]
+        accumulator = SharedAccumulator(1, 1000, args.binScheme)
+        accumulator.extend(results)
+        tables, tails = runSim.histogramTables(results, args)
+        shared, sharedTails = runSim.histogramTables(accumulator, args)
+        assert (shared[:, :tables.shape[1]] == tables).all()
+        assert (shared[:, tables.shape[1]:] == 0).all()
+        # with contigs past the dense bins
+        accumulator = SharedAccumulator(1, 1000, args.binScheme, maxBins=5)
+        accumulator.extend(results)
+        assert len(accumulator.overflow) > 0
+        shared, sharedTails = runSim.histogramTables(accumulator, args)
+        assert shared.shape == (4, 5)
+        assert (shared == tables[:, :5]).all()
+        for i in xrange(4):
+            assert sharedTails[i] == dict((x, tables[i, x]) for x in
+                                          np.flatnonzero(tables[i, 5:]) + 5)
+        args.countY = True
+        shared, sharedTails = runSim.histogramTables(accumulator, args)
+        assert (shared == 3 * tables[:, :5]).all()
+        assert sum(sum(x.values()) for x in sharedTails) == \
+               3 * tables[:, 5:].sum()
+        # fine bins over N=3e9 stay within the dense bins and the tails
+        args.countY = False
+        accumulator = SharedAccumulator(1, 3000000000, BinScheme(1))
+        accumulator.extend(results[:1])
+        accumulator.addHistograms(0, dict(
+            (x, {3000000000 : 1} if x == "aliveLinear" else {}) for x in
+            runSim.tableCategories))
+        shared, sharedTails = runSim.histogramTables(accumulator, args)
+        assert shared.shape == (4, maxDenseBins)
+        assert sharedTails[1] == {3000000000 : 0.5}
+
+    def testRenderCell(self):
+        runSim.loadPlotting()
+        exp, args = self.experiment()
+        cell = runSim.summarizeCell(exp, exp.results.items()[0], args)
+        key, replicates, (tables, tails), fname, cellArgs = cell
+        runSim.renderCell(cell)
+        assert open(fname).read() == "1"
+        # the four categories, at the middle of their bins
+        assert len(self.plt.plots) == 4
+        for (x, y), table in zip(self.plt.plots, tables):
+            assert y == list(table[np.flatnonzero(table)])
+            assert x == list(np.flatnonzero(table) * 10 - 5.)
+        assert self.plt.titles == [fname]
+        # a preview is a png
+        args.preview = True
+        cell = runSim.summarizeCell(exp, exp.results.items()[0], args)
+        assert cell[3].endswith(".png")
+        runSim.renderCell(cell)
+        assert os.path.exists(cell[3])
+        # or shown
+        args.showPlot = True
+        runSim.renderCell(cell)
+        assert self.plt.shown == 1
+
+    def testRenderMultipage(self):
+        runSim.loadPlotting()
+        exp, args = self.experiment()
+        args.multipage = "all.pdf"
+        cell = runSim.summarizeCell(exp, exp.results.items()[0], args)
+        runSim.renderMultipage([cell] * 3, args)
+        assert open("all.pdf").read() == "3"
+        assert len(self.plt.plots) == 3 * 4
+        assert self.plt.titles == [cell[3]] * 3
+        assert not os.path.exists(cell[3])
+
+    # an experiment of two cells, and plot options
+    def twoCells(self):
+        args = runSim.initOptions().parse_args(["--binSize", "10",
+                                                "--plotProcesses", "2"])
+        random.seed(3)
+        exp = Experiment()
+        exp.addParameterSet(100, 500, 0.002)
+        exp.addParameterSet(100, 500, 0.002, 0.001, 0.001, 0.5, 0.5)
+        exp.addStartingState(100, 5, 5)
+        return exp, args
+
+    def cellFiles(self, exp, extension):
+        return ["t%d_N%d_rll%.2f_rld%.2f_rdd_%.2f_fl%.2f_fg%.2f_pgain_%.2f__"
+                "gbg%d_nl%d_nc%d%s" % (key + (extension,))
+                for key in exp.results]
+
+    def testRunCellsStream(self):
+        exp, args = self.twoCells()
+        cells = exp.runCells(2, 10)
+        # nothing is run until the cells are asked for, one at a time
+        assert len(exp.results) == 0
+        key, results = cells.next()
+        assert exp.results.keys() == [key] and len(results) == 2
+        key2, results2 = cells.next()
+        assert key2 != key and len(exp.results) == 2
+        self.assertRaises(StopIteration, cells.next)
+
+    def testPlotCells(self):
+        exp, args = self.twoCells()
+        seen = []
+        def stream():
+            for cell in exp.runCells(2, 10):
+                seen.append(cell[0])
+                yield cell
+        # summarized and rendered in the pool
+        runSim.plotCells(exp, stream(), args)
+        assert len(seen) == 2
+        for name in self.cellFiles(exp, ".txt") + self.cellFiles(exp, ".pdf"):
+            assert os.path.exists(name)
+        # in one pdf, at the end
+        for name in os.listdir("."):
+            os.remove(name)
+        args.multipage = "all.pdf"
+        runSim.plotCells(exp, exp.results.items(), args)
+        assert open("all.pdf").read() == "2"
+        assert not any(os.path.exists(x) for x in self.cellFiles(exp, ".pdf"))
+        # or shown in turn
+        args.multipage = None
+        args.showPlot = True
+        runSim.plotCells(exp, exp.results.items(), args)
+        assert self.plt.shown == 2
+
+    def testPlotSharedCells(self):
+        exp, args = self.twoCells()
+        runSim.plotCells(exp, exp.runCellsShared(4, 10, processes=2, seed=1),
+                         args)
+        for key, accumulator in exp.results.items():
+            assert isinstance(accumulator, SharedAccumulator)
+            assert len(accumulator) == 4
+        for name in self.cellFiles(exp, ".txt") + self.cellFiles(exp, ".pdf"):
+            assert os.path.exists(name)
+
+def main():
+    parseCactusSuiteTestOptions()
+    sys.argv = sys.argv[:1]
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
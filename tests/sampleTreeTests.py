@@ -6,7 +6,9 @@
 import unittest
 import sys
 import os
+import random
 from contigSim.src.sampleTree import SampleTree
+from contigSim.src.sampleTree import tuneDegree
 
 from sonLib.bioio import TestStatus
 from sonLib.bioio import system
@@ -107,6 +109,179 @@ class TestCase(unittest.TestCase):
         hist = tree.histogram(2, object)
         for i in range(0, 50):
             assert hist[i] == 2
+
+    def testSampleTreeUniformSampleMany(self):
+        tree = SampleTree(3)
+        for i in range(0,200):
+            tree.insert(str(i), i % 17)
+        leaves = [x for x in tree.nodes() if x.data is not None]
+
+        random.seed(7)
+        samples = tree.uniformSampleMany(50)
+        random.seed(7)
+        targets = [random.randint(0, tree.weight() - 1) for i in range(50)]
+        assert len(samples) == 50
+        # each target maps to the same leaf as a scan of the leaves
+        for x, (node, offset) in zip(targets, samples):
+            tally = 0
+            for leaf in leaves:
+                if x < tally + leaf.weight:
+                    break
+                tally += leaf.weight
+            assert node is leaf
+            assert offset == x - tally
+            assert offset < node.weight
+
+        # the same as single samples for the same targets
+        for seed in xrange(20):
+            random.seed(seed)
+            samples = tree.uniformSampleMany(2)
+            random.seed(seed)
+            assert samples == [tree.uniformSample(), tree.uniformSample()]
+
+        empty = SampleTree()
+        assert empty.uniformSampleMany(2) is None
+
+    def testSampleTreeTuneDegree(self):
+        tree = SampleTree()
+        for i in range(0,100):
+            tree.insert(str(i), i + 1)
+        for i in range(0,30):
+            tree.uniformSampleMany(2)
+        assert tree.sampleCount == 30
+        assert tree.updateCount == 100
+        degree, tuning = tuneDegree(tree, (2, 5), 20)
+        assert degree in (2, 5)
+        assert tuning["degree"] == degree
+        assert abs(tuning["sampleFraction"] - 30. / 130.) < 1e-9
+        for d in (2, 5):
+            sampleCost, updateCost, cost = tuning["costs"][d]
+            assert sampleCost >= 0 and updateCost >= 0
+            assert cost <= max(sampleCost, updateCost)
+        assert degree == min((2, 5), key=lambda d: tuning["costs"][d][2])
+
+    def testSampleTreeBalance(self):
+        random.seed(3)
+        for degree in (2, 3, 5):
+            tree = SampleTree(degree)
+            leaves = []
+            for i in range(0,2000):
+                tree.insert(i, random.randint(1, 100))
+            leaves = list(tree.leafNodes())
+            # remove most of the leaves, in tree order, then churn
+            for leaf in leaves[:1900]:
+                tree.remove(leaf)
+            for i in range(0,3000):
+                if random.random() < 0.5 and tree.size() > 1:
+                    leaf, offset = tree.uniformSample()
+                    tree.remove(leaf)
+                else:
+                    tree.insert(i, random.randint(1, 100))
+                self.checkTree(tree)
+            assert tree.depth() <= tree.maxDepth()
+
+    def testSampleTreeRebuild(self):
+        tree = SampleTree(3)
+        for i in range(0,100):
+            tree.insert(i, i + 1)
+        leaves = list(tree.leafNodes())
+        tree.rebuild()
+        self.checkTree(tree)
+        assert tree.rebuildCount == 1
+        assert tree.size() == 100
+        assert tree.weight() == (100 * 101) / 2
+        # complete tree of degree 3 over 100 leaves
+        assert tree.depth() == 5
+        for leaf in leaves:
+            tree.remove(leaf)
+        self.checkTree(tree)
+        assert tree.size() == 0 and tree.depth() == 0
+        assert tree.nodeCount() == 1
+        assert tree.fillFactor() == 0.
+
+    def testSampleTreeStats(self):
+        tree = SampleTree(2)
+        for i in range(0,4):
+            tree.insert(i, 1)
+        stats = tree.stats()
+        assert stats["size"] == 4
+        assert stats["depth"] == 2
+        assert stats["nodeCount"] == 7
+        assert stats["fillFactor"] == 1.0
+        assert stats["rebuilds"] == 0
+
+    def testSampleTreeFreeNodes(self):
+        tree = SampleTree(3)
+        for i in range(0,100):
+            tree.insert(i, i + 1)
+        allocated = tree.allocCount
+        assert allocated == tree.nodeCount() - 1
+        leaves = list(tree.leafNodes())
+        for leaf in leaves[:50]:
+            tree.remove(leaf)
+            assert leaf.data is None and leaf.parent is None
+        self.checkTree(tree)
+        for i in range(0,50):
+            tree.insert(i, 1)
+        self.checkTree(tree)
+        assert tree.reuseCount > 0
+        assert tree.size() == 100
+        tree.clear()
+        assert tree.size() == 0 and tree.weight() == 0
+        assert tree.nodeCount() == 1
+        for i in range(0,100):
+            tree.insert(i, i + 1)
+        self.checkTree(tree)
+        assert tree.weight() == (100 * 101) / 2
+        assert tree.allocations() == {"allocated" : tree.allocCount,
+                                      "reused" : tree.reuseCount}
+        assert tree.allocCount <= allocated + 50
+
+    def testSampleTreeLeafRegistry(self):
+        random.seed(9)
+        tree = SampleTree(3)
+        for i in range(0,300):
+            tree.insert(i, random.randint(0, 50))
+        for i in range(0,1000):
+            if random.random() < 0.5 and tree.size() > 0:
+                leaf = random.choice(tree.leaves)
+                tree.remove(leaf)
+            else:
+                tree.insert(i, random.randint(0, 50))
+        self.checkTree(tree)
+        elements = sorted(tree.dataElements())
+        assert elements == sorted(x.data for x in tree.nodes()
+                                  if x.data is not None)
+        assert sorted(tree.snapshot()) == sorted(
+            (x.data, x.weight) for x in tree.nodes() if x.data is not None)
+        # nodes() goes parents first, children in order
+        order = dict((id(x), i) for i, x in enumerate(tree.nodes()))
+        assert order[id(tree.root)] == 0
+        for node in tree.nodes():
+            if node is not tree.root:
+                assert order[id(node.parent)] < order[id(node)]
+        tree.clear()
+        assert list(tree.leafNodes()) == []
+
+    # counts, weights and heights add up, only the root can have fewer
+    # than two children, and the leaf registry holds exactly the leaves
+    def checkTree(self, tree):
+        leaves = 0
+        for node in tree.nodes():
+            if node.data is not None:
+                assert len(node.children) == 0 and node.height == 0
+                assert tree.leaves[node.index] is node
+                leaves += 1
+                continue
+            assert node is tree.root or len(node.children) >= 2
+            assert len(node.children) <= tree.degree
+            for child in node.children:
+                assert child.parent is node
+            assert node.count == sum(x.count for x in node.children)
+            assert node.weight == sum(x.weight for x in node.children)
+            assert node.height == max([x.height + 1 for x in node.children]
+                                      + [0])
+        assert leaves == len(tree.leaves) == tree.size()
    
         
 
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey (hickey@soe.ucsc.edu)
+#
+#Released under the MIT license, see LICENSE.txt
+import unittest
+import sys
+import os
+import cPickle
+import random
+import multiprocessing
+import numpy as np
+
+from contigSim.src.sharedHistogram import SharedAccumulator
+from contigSim.src.model import Model
+from contigSim.src.experiment import Experiment
+from contigSim.src.histogram import BinScheme
+from contigSim.src.histogram import mergeHistograms
+
+from sonLib.bioio import TestStatus
+from sonLib.bioio import system
+from sonLib.bioio import getLogLevelString
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testNo = TestStatus.getTestSetup()
+        self.tempFiles = []
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self):
+        for tempFile in self.tempFiles:
+            os.remove(tempFile)
+        unittest.TestCase.tearDown(self)
+
+    def models(self, n):
+        random.seed(1)
+        res = []
+        for i in xrange(n):
+            model = Model()
+            model.setParameters(1000, 0.001, 0.0005, 0.0005, 0.5, 0.5, 0.5)
+            model.setStartingState(300, 5, 5)
+            model.simulate(200)
+            res.append(model)
+        return res
+
+    def histograms(self, model, scheme):
+        checks = {"aliveCircular" : lambda x : not x.isDead() and
+                  not x.isLinear(),
+                  "aliveLinear" : lambda x : not x.isDead() and x.isLinear(),
+                  "deadCircular" : lambda x : x.isDead() and not x.isLinear(),
+                  "deadLinear" : lambda x : x.isDead() and x.isLinear(),
+                  "alive" : lambda x : not x.isDead(),
+                  "dead" : lambda x : x.isDead(),
+                  "overall" : lambda x : True}
+        return dict((name, model.pool.histogram(scheme=scheme, checkFn=check))
+                    for name, check in checks.items())
+
+    def testAccumulator(self):
+        for scheme in (BinScheme(3), BinScheme(2, 2, 16)):
+            models = self.models(4)
+            accumulator = SharedAccumulator(2, 2000, scheme)
+            histograms = []
+            for i, model in enumerate(models):
+                accumulator.addPool(i % 2, model.pool)
+                histograms.append(self.histograms(model, scheme))
+            assert accumulator.replicates() == 4
+            for name in histograms[0].keys():
+                assert accumulator.histogram(name) == \
+                       mergeHistograms([x[name] for x in histograms], scheme)
+            # the same from the histograms
+            other = SharedAccumulator(1, 2000, scheme)
+            other.extend(histograms)
+            assert (other.table() == accumulator.table()).all()
+            # pickled as the sums
+            copy = cPickle.loads(cPickle.dumps(accumulator, 2))
+            assert len(copy) == 4
+            assert (copy.table() == accumulator.table()).all()
+            copy.extend(accumulator)
+            assert len(copy) == 8
+            assert (copy.table() == 2 * accumulator.table()).all()
+
+    def testSharedProcesses(self):
+        # (bin 99 is past the dense bins)
+        accumulator = SharedAccumulator(3, 100, maxBins=50)
+        assert accumulator.numBins == 50
+        def work(worker):
+            for i in xrange(10):
+                accumulator.addHistograms(worker, dict(
+                    (name, {worker : 1, 99 : 2}) for name in
+                    ["aliveCircular", "aliveLinear", "deadCircular",
+                     "deadLinear"]))
+            accumulator.send()
+        workers = [multiprocessing.Process(target=work, args=(i,))
+                   for i in xrange(3)]
+        for worker in workers:
+            worker.start()
+        accumulator.reduce(workers)
+        for worker in workers:
+            worker.join()
+        assert len(accumulator) == 30
+        overall = accumulator.histogram("overall")
+        assert overall == {0 : 40, 1 : 40, 2 : 40, 99 : 240}
+        assert accumulator.histogram("aliveLinear") == {0 : 10, 1 : 10,
+                                                        2 : 10, 99 : 60}
+        # reduced into the first stripe, which is the table
+        table = accumulator.table()
+        assert np.may_share_memory(table, accumulator.stripes[0])
+        assert (accumulator.stripes[1:] == 0).all()
+        assert table.shape == (4, 50) and table.sum() == 4 * 30
+        full, tails = accumulator.fullTable()
+        assert np.may_share_memory(full, accumulator.stripes[0])
+        assert sum(x[99] for x in tails) == 240
+        assert all(x.keys() == [99] for x in tails)
+        copy = cPickle.loads(cPickle.dumps(accumulator, 2))
+        assert copy.histogram("overall") == overall
+        # a worker that dies without sending
+        accumulator = SharedAccumulator(2, 100)
+        worker = multiprocessing.Process(target=os._exit, args=(1,))
+        worker.start()
+        self.assertRaises(RuntimeError, accumulator.reduce, [worker])
+        worker.join()
+
+    def testExperimentShared(self):
+        exp = Experiment()
+        exp.addParameterSet(100, 500, 0.002, 0.001, 0.001, 0.5, 0.5)
+        exp.addStartingState(100, 5, 5)
+        cells = list(exp.runCellsShared(7, 1, processes=3, seed=5))
+        assert len(cells) == 1
+        key, accumulator = cells[0]
+        assert exp.results[key] is accumulator
+        assert np.may_share_memory(accumulator.table(), accumulator.stripes)
+        assert len(accumulator) == 7
+        assert accumulator.histogram("dead").total() <= 7
+        assert accumulator.histogram("alive").total() >= 7
+        # merged with replicates run the usual way
+        other = Experiment()
+        other.addParameterSet(100, 500, 0.002, 0.001, 0.001, 0.5, 0.5)
+        other.addStartingState(100, 5, 5)
+        other.run(2, 1)
+        other.merge(exp)
+        assert len(other.results[key]) == 9
+        assert len(other.metadata[key]) == 9
+
+def main():
+    parseCactusSuiteTestOptions()
+    sys.argv = sys.argv[:1]
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+#Copyright (C) 2012 by Glenn Hickey (hickey@soe.ucsc.edu)
+#
+#Released under the MIT license, see LICENSE.txt
+import unittest
+import sys
+import os
+import time
+import shutil
+import tempfile
+import multiprocessing
+
+from contigSim.src.workQueue import WorkQueue
+from contigSim.src.workQueue import Worker
+from contigSim.src.experiment import Experiment
+
+from sonLib.bioio import TestStatus
+from sonLib.bioio import system
+from sonLib.bioio import getLogLevelString
+
+# (run in a separate process)
+def runWorker(path, workerId):
+    Worker(WorkQueue(path, leaseTime=0.5), workerId,
+           heartbeat=0.05).run(poll=0.05)
+
+class TestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.testNo = TestStatus.getTestSetup()
+        self.tempFiles = []
+        self.tempDir = tempfile.mkdtemp()
+        unittest.TestCase.setUp(self)
+
+    def tearDown(self):
+        for tempFile in self.tempFiles:
+            os.remove(tempFile)
+        shutil.rmtree(self.tempDir)
+        unittest.TestCase.tearDown(self)
+
+    def experiment(self):
+        exp = Experiment()
+        exp.addParameterSet(100, 200, 0.01)
+        exp.addParameterSet(100, 200, 0.01, 0.001, 0.001, 0.5, 0.5)
+        exp.addStartingState(0, 5, 5)
+        exp.addStartingState(50, 0, 5)
+        return exp
+
+    def testLeases(self):
+        queue = WorkQueue(self.tempDir, leaseTime=1000)
+        tasks = queue.submit(self.experiment(), replicates=2)
+        taskId = tasks.values()[0][0]
+        assert len(queue.pending()) == 8
+        assert queue.claim(taskId, "a")
+        assert not queue.claim(taskId, "b")
+        assert queue.heartbeat(taskId, "a")
+        assert not queue.heartbeat(taskId, "b")
+        # the lease expires without heartbeats
+        old = time.time() - 2000
+        os.utime(queue.leasePath(taskId), (old, old))
+        assert queue.claim(taskId, "b")
+        assert queue.leaseHolder(taskId) == "b"
+        assert not queue.heartbeat(taskId, "a")
+        queue.release(taskId, "a")
+        assert queue.leaseHolder(taskId) == "b"
+        queue.release(taskId, "b")
+        assert queue.leaseHolder(taskId) is None
+        # submitting again doesn't add tasks
+        assert queue.submit(self.experiment(), replicates=2) == tasks
+        assert len(queue.taskIds()) == 8
+
+    def testStaleTakeOver(self):
+        queue = WorkQueue(self.tempDir, leaseTime=1000)
+        taskId = queue.submit(self.experiment()).values()[0][0]
+        path = queue.leasePath(taskId)
+        assert queue.claim(taskId, "a")
+        old = time.time() - 2000
+        os.utime(path, (old, old))
+        mtime = os.stat(path).st_mtime
+        # b takes over, then c tries with the expiry it saw before
+        assert queue.claim(taskId, "b")
+        assert not queue.takeOver(path, "c", mtime)
+        assert queue.leaseHolder(taskId) == "b"
+        # even once the marker is gone, as b's lease is newer
+        queue.release(taskId, "b")
+        assert queue.claim(taskId, "b")
+        assert not queue.takeOver(path, "c", mtime)
+        assert queue.leaseHolder(taskId) == "b"
+        assert queue.heartbeat(taskId, "b")
+        queue.release(taskId, "b")
+        assert os.listdir(os.path.join(self.tempDir, "leases")) == []
+
+    def testResubmitOptions(self):
+        queue = WorkQueue(self.tempDir, leaseTime=0.5)
+        exp = Experiment()
+        exp.addParameterSet(100, 200, 0.01)
+        exp.addStartingState(0, 5, 0)
+        tasks = queue.submit(exp, replicates=1, binSize=1)
+        assert Worker(queue, "a").run() == 1
+        # other bins are other tasks, not the old results
+        exp2 = Experiment()
+        exp2.addParameterSet(100, 200, 0.01)
+        exp2.addStartingState(0, 5, 0)
+        tasks2 = queue.submit(exp2, replicates=1, binSize=50)
+        assert tasks2.values() != tasks.values()
+        assert queue.pending() == tasks2.values()[0]
+        assert Worker(queue, "a").run() == 1
+        queue.collect(exp2, tasks2)
+        hist = exp2.results.values()[0][0]["overall"]
+        assert max(hist.keys()) <= 200 / 50
+        assert abs(sum(i * 50 * c for i, c in hist.items()) - 200) <= 50 * \
+               len(hist)
+
+    def testWorkers(self):
+        queue = WorkQueue(self.tempDir, leaseTime=0.5)
+        exp = self.experiment()
+        tasks = queue.submit(exp, replicates=3, seed=7)
+        # a task leased by a worker that died
+        deadTask = tasks.values()[0][1]
+        assert queue.claim(deadTask, "dead")
+        workers = [multiprocessing.Process(target=runWorker,
+                                           args=(self.tempDir, "w%d" % i))
+                   for i in xrange(3)]
+        for worker in workers:
+            worker.start()
+        assert queue.wait(timeout=60, poll=0.05)
+        for worker in workers:
+            worker.join()
+        assert queue.pending() == []
+        assert len(os.listdir(os.path.join(self.tempDir, "leases"))) == 0
+        queue.collect(exp, tasks)
+        assert len(exp.results) == 4
+        for key, results in exp.results.items():
+            assert len(results) == 3
+            assert len(exp.metadata[key]) == 3
+            for res in results:
+                assert sum(res["overall"].values()) == \
+                       sum(res["alive"].values()) + sum(res["dead"].values())
+                # (gains and losses change the number of bases)
+                bases = sum(i * c for i, c in res["overall"].items())
+                assert abs(bases - 200) <= 10
+                assert sum(res["dead"].values()) == int(key[8] > 0)
+
+        # a task run again gives the same result
+        taskId = tasks.values()[0][0]
+        result = open(queue.resultPath(taskId), "rb").read()
+        os.remove(queue.resultPath(taskId))
+        assert Worker(queue, "again").run() == 1
+        assert open(queue.resultPath(taskId), "rb").read() == result
+
+def main():
+    parseCactusSuiteTestOptions()
+    sys.argv = sys.argv[:1]
+    unittest.main()
+
+if __name__ == '__main__':
+    main()